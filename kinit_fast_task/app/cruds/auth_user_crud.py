@@ -5,17 +5,22 @@
 # @Desc           : 数据操作
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel as AbstractSchemaModel
+from sqlalchemy import Exists, exists, false, func, insert, literal, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from kinit_fast_task.app.cruds.base.orm import ORMCrud, ORMModel
 from kinit_fast_task.app.schemas import auth_user_schema as user_s
 from kinit_fast_task.app.models.auth_user_model import AuthUserModel
+from kinit_fast_task.app.models.auth_role_model import AuthRoleModel
+from kinit_fast_task.app.models.auth_user_to_role_model import auth_user_to_role_model
 from kinit_fast_task.app.cruds.auth_role_crud import AuthRoleCRUD
 from kinit_fast_task.core.exception import CustomException
 
 
 class AuthUserCRUD(ORMCrud[AuthUserModel]):
+    unique_errors = {"uq_auth_user_telephone": "手机号已注册！", "uq_auth_user_email": "邮箱已注册！"}
+
     def __init__(self, session: AsyncSession):
         super().__init__()
         self.session = session
@@ -33,37 +38,122 @@ class AuthUserCRUD(ORMCrud[AuthUserModel]):
         :return:
         """  # noqa E501
 
-        # 验证数据是否合格
-        telephone = await self.get_data(telephone=data.telephone, v_return_none=True)
-        if telephone:
-            raise CustomException("手机号已注册！")
-        if data.email:
-            email = await self.get_data(email=data.email, v_return_none=True)
-            if email:
-                raise CustomException("邮箱已注册！")
-
-        # 开始创建操作
         data = jsonable_encoder(data)
-        role_ids = data.pop("role_ids")
+        role_ids = set(data.pop("role_ids"))
+        await self.validate_data(telephone=data["telephone"], email=data.get("email"), role_ids=role_ids)
+
+        # 开始创建操作, 唯一性最终由数据库唯一索引保证
         obj = self.model(**data)
-        if role_ids:
-            roles = await AuthRoleCRUD(self.session).get_datas(limit=0, id=("in", role_ids), v_return_type="model")
-            if len(role_ids) != len(roles):
-                raise CustomException("关联角色异常, 请确保关联的角色存在！")
-            for role in roles:
-                obj.roles.add(role)
         await self.flush(obj)
+        self.mark_cache_invalid([obj.id])
+        if role_ids:
+            user_roles = [{"user_id": obj.id, "role_id": role_id} for role_id in role_ids]
+            await self.session.execute(insert(auth_user_to_role_model), user_roles)
         if v_return_obj:
+            await self.session.refresh(obj, ["roles"])
             return obj
         return "创建成功"
 
+    async def validate_data(
+        self,
+        *,
+        telephone: str | None = None,
+        email: str | None = None,
+        role_ids: set[int] | None = None,
+        exclude_id: int | None = None,
+    ) -> None:
+        """
+        只执行一次查询, 同时验证手机号与邮箱是否已注册, 关联角色是否都存在
+
+        :param telephone: 需要验证的手机号, 为 None 时不验证
+        :param email: 需要验证的邮箱, 为 None 时不验证
+        :param role_ids: 需要验证的关联角色 ID 列表, 为空时不验证
+        :param exclude_id: 排除的用户 ID, 更新时排除用户自身
+        :return:
+        """
+        if telephone is None and email is None and not role_ids:
+            return
+
+        def registered(condition) -> Exists:
+            sql = exists().where(condition, self.model.is_delete == false())
+            if exclude_id is not None:
+                sql = sql.where(self.model.id != exclude_id)
+            return sql
+
+        role_count = literal(0)
+        if role_ids:
+            role_count = (
+                select(func.count(AuthRoleModel.id))
+                .where(AuthRoleModel.id.in_(role_ids), AuthRoleModel.is_delete == false())
+                .scalar_subquery()
+            )
+        sql = select(
+            registered(self.model.telephone == telephone) if telephone is not None else literal(False),
+            registered(self.model.email == email) if email is not None else literal(False),
+            role_count,
+        )
+        telephone_exists, email_exists, count = (await self.session.execute(sql)).one()
+        if telephone_exists:
+            raise CustomException("手机号已注册！")
+        if email_exists:
+            raise CustomException("邮箱已注册！")
+        if role_ids and count != len(role_ids):
+            raise CustomException("关联角色异常, 请确保关联的角色存在！")
+
     async def create_datas(
         self, datas: list[dict | AbstractSchemaModel], v_return_objs: bool = False
     ) -> list[ORMModel] | str:
         """
-        重写批量创建用户方法
+        重写批量创建用户方法, 同时批量创建关联角色数据
+
+        :param datas: 创建数据列表
+        :param v_return_objs: 不支持返回 ORM 对象
+        """
+        if v_return_objs:
+            raise CustomException("批量创建用户不支持返回 ORM 对象！")
+        await self.bulk_create(datas)
+        return "批量创建成功"
+
+    async def bulk_insert_chunk(self, chunk: list[dict]) -> None:
+        """
+        重写插入一批用户, 每批用户只执行一次唯一性验证、一次角色验证、一次用户插入与一次关联角色插入
+
+        :param chunk: 一批用户字典数据
+        :return:
         """
-        raise NotImplementedError("未实现批量创建用户方法！")
+        role_ids_list = [data.pop("role_ids", None) or [] for data in chunk]
+
+        # 验证数据是否合格
+        telephones = [data["telephone"] for data in chunk]
+        if len(telephones) != len(set(telephones)):
+            raise CustomException("数据中存在重复的手机号, 请检查数据！")
+        emails = [data["email"] for data in chunk if data.get("email")]
+        if len(emails) != len(set(emails)):
+            raise CustomException("数据中存在重复的邮箱, 请检查数据！")
+        # 与唯一索引保持一致, 只验证未删除的用户
+        registered = exists().where(
+            or_(self.model.telephone.in_(telephones), self.model.email.in_(emails)), self.model.is_delete == false()
+        )
+        if await self.session.scalar(select(registered)):
+            raise CustomException("手机号或邮箱已注册, 请检查数据！")
+
+        role_ids = set().union(*role_ids_list)
+        if role_ids:
+            count = await AuthRoleCRUD(self.session).get_count(id=("in", list(role_ids)), is_delete=False)
+            if count != len(role_ids):
+                raise CustomException("关联角色异常, 请确保关联的角色存在！")
+
+        # 开始创建操作
+        sql = insert(self.model).returning(self.model.id, sort_by_parameter_order=True)
+        with self.translate_integrity_error():
+            user_ids = (await self.session.execute(sql, chunk)).scalars().all()
+        user_roles = [
+            {"user_id": user_id, "role_id": role_id}
+            for user_id, role_ids in zip(user_ids, role_ids_list, strict=True)
+            for role_id in role_ids
+        ]
+        if user_roles:
+            await self.session.execute(insert(auth_user_to_role_model), user_roles)
 
     async def update_data(
         self, data_id: int, data: user_s.AuthUserUpdateSchema | dict, *, v_return_obj: bool = False
@@ -78,29 +168,25 @@ class AuthUserCRUD(ORMCrud[AuthUserModel]):
         v_options = [selectinload(AuthUserModel.roles)]
         obj: AuthUserModel = await self.get_data(data_id, v_options=v_options)
 
-        # 验证数据是否合格
-        if obj.telephone != data.telephone:
-            telephone = await self.get_data(telephone=data.telephone, v_return_none=True)
-            if telephone:
-                raise CustomException("手机号已注册！")
-        if obj.email != data.email and data.email is not None:
-            email = await self.get_data(email=data.email, v_return_none=True)
-            if email:
-                raise CustomException("邮箱已注册！")
-
-        # 开始更新操作
+        # 验证数据是否合格, 只验证发生变化的手机号与邮箱
         data_dict = jsonable_encoder(data)
+        role_ids = data_dict.pop("role_ids", None)
+        telephone = data_dict.get("telephone")
+        email = data_dict.get("email")
+        await self.validate_data(
+            telephone=telephone if telephone != obj.telephone else None,
+            email=email if email != obj.email else None,
+            exclude_id=data_id,
+        )
+
+        # 开始更新操作, 唯一性最终由数据库唯一索引保证
+        if role_ids:
+            roles = await AuthRoleCRUD(self.session).get_datas(limit=0, id=("in", role_ids), v_return_type="model")
+            if len(role_ids) != len(roles):
+                raise CustomException("关联角色异常, 请确保关联的角色存在！")
+            obj.roles.clear()
+            obj.roles.update(roles)
         for key, value in data_dict.items():
-            if key == "role_ids":
-                if value:
-                    roles = await AuthRoleCRUD(self.session).get_datas(limit=0, id=("in", value), v_return_type="model")
-                    if len(value) != len(roles):
-                        raise CustomException("关联角色异常, 请确保关联的角色存在！")
-                    if obj.roles:
-                        obj.roles.clear()
-                    for role in roles:
-                        obj.roles.add(role)
-                continue
             setattr(obj, key, value)
         await self.flush()
         if v_return_obj:
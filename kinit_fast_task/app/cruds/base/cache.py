@@ -0,0 +1,498 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/22 10:12
+# @File           : cache.py
+# @IDE            : PyCharm
+# @Desc           : ORM 查询缓存
+
+import asyncio
+import hashlib
+import time
+import uuid
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+import orjson
+from pydantic import BaseModel as AbstractSchemaModel
+from redis import RedisError
+from redis.commands.core import AsyncScript
+from sqlalchemy import event
+from sqlalchemy.exc import MissingGreenlet
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import ORMExecuteState, Session, object_mapper
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.util import await_only
+
+from kinit_fast_task.app.models.base.orm import AbstractORMModel
+from kinit_fast_task.config import settings
+from kinit_fast_task.db import DBFactory
+from kinit_fast_task.utils import log
+from kinit_fast_task.utils.cache import MISSING, LRUCache, SingleFlight
+from kinit_fast_task.utils.response import orjson_default
+
+
+class ORMDataCache:
+    """
+    ORMCrud.get_data 读缓存，缓存根据 ID 查询并序列化后的字典数据
+
+    两级缓存：
+    1. 进程内 LRU 缓存，过期时间较短，其他进程写入后最多延迟 local_ttl 秒失效
+    2. Redis 缓存，每条数据使用一个 Hash 存储，键为 {prefix}:{表名}:{数据 ID}，字段为 schema，
+       修改数据时删除一个键即可让该数据所有 schema 的缓存失效，未启用 Redis 时只使用进程内缓存
+
+    缓存失效：
+    会话提交后自动删除本次事务修改过的数据缓存，包括 ORMCrud 执行的 update/delete 语句与 flush 的 ORM 对象，
+    在提交之后删除，避免并发读取在事务提交前将旧数据重新写入缓存，事务回滚时不清除标记，多删除一次缓存不影响数据正确性
+    关联表数据的变化不会使缓存失效，只能等待缓存过期
+
+    防止旧数据回填：
+    删除缓存的同时为数据写入新的版本号（{prefix}:{表名}:{数据 ID}:version），回源查询前读取版本号，
+    写入时通过 Lua 脚本比较版本号，不一致说明查询期间数据已被修改并提交，放弃写入，
+    进程内缓存通过失效次数实现相同的判断
+    只读副本可能存在复制延迟，只有从主库查询的数据才会写入缓存，见 ORMCrud.get_data
+
+    防止缓存击穿：
+    进程内同一个键同时只有一个协程查询数据库，多个进程之间通过 Redis SET NX 锁保证同时只有一个进程查询数据库，
+    其他进程等待缓存写入，等待超时后直接查询数据库
+    """
+
+    # 会话 info 中记录待删除缓存的键
+    session_key = "orm_data_cache_keys"
+    # 版本号未变化时写入缓存，KEYS：[缓存键, 版本号键]，ARGV：[读取的版本号, schema, 数据, 过期时间]
+    fill_script = """
+    if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return 1
+    """
+
+    def __init__(
+        self,
+        *,
+        prefix: str = "orm_data",
+        ttl: int = 300,
+        local_ttl: float = 5,
+        local_max_size: int = 1024,
+        lock_ttl: float = 5,
+        lock_wait: float = 1,
+    ):
+        """
+        :param prefix: Redis 缓存键前缀
+        :param ttl: Redis 缓存过期时间（秒）
+        :param local_ttl: 进程内缓存过期时间（秒）
+        :param local_max_size: 进程内缓存最大数据量
+        :param lock_ttl: 加载数据锁的过期时间（秒），持有锁的进程异常退出时锁自动释放
+        :param lock_wait: 未获取到锁时等待缓存写入的最长时间（秒）
+        """
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        # 缓存格式：{(表名, 数据 ID): {schema: 字典数据}}
+        self.local = LRUCache(local_max_size, ttl=local_ttl)
+        self.single_flight = SingleFlight()
+        # 进程内缓存失效次数，加载期间有缓存失效时不写入进程内缓存
+        self.invalidations = 0
+        self._fill_script: AsyncScript | None = None
+
+    @property
+    def redis_enabled(self) -> bool:
+        return settings.db.REDIS_DB_ENABLE
+
+    def redis_key(self, table: str, data_id: int) -> str:
+        return f"{self.prefix}:{table}:{data_id}"
+
+    def version_key(self, table: str, data_id: int) -> str:
+        return f"{self.redis_key(table, data_id)}:version"
+
+    @staticmethod
+    def schema_key(schema: type[AbstractSchemaModel]) -> str:
+        return f"{schema.__module__}.{schema.__qualname__}"
+
+    async def get(
+        self,
+        table: str,
+        data_id: int,
+        schema: type[AbstractSchemaModel],
+        loader: Callable[[], Awaitable[tuple[dict | None, bool]]],
+    ) -> dict | None:
+        """
+        获取缓存数据，未命中时执行 loader 查询数据库并写入缓存
+
+        :param table: 表名
+        :param data_id: 数据 ID
+        :param schema: 序列化对象
+        :param loader: 查询数据库的函数，返回 (字典数据, 是否可以写入缓存)，数据为 None 时不写入缓存
+        :return:
+        """
+        field = self.schema_key(schema)
+        data = self.local.get((table, data_id), {}).get(field, MISSING)
+        if data is MISSING:
+            key = (table, data_id, field)
+            data = await self.single_flight.do(key, lambda: self.load(table, data_id, field, loader))
+        # 返回浅拷贝，避免调用方修改返回值后影响进程内缓存
+        return None if data is None else dict(data)
+
+    async def load(
+        self, table: str, data_id: int, field: str, loader: Callable[[], Awaitable[tuple[dict | None, bool]]]
+    ) -> dict | None:
+        """
+        依次从 Redis 缓存与数据库加载数据
+
+        :param table: 表名
+        :param data_id: 数据 ID
+        :param field: schema 缓存字段
+        :param loader: 查询数据库的函数
+        :return:
+        """
+        invalidations = self.invalidations
+        if not self.redis_enabled:
+            data, cacheable = await loader()
+            if cacheable:
+                self.set_local(table, data_id, field, data, invalidations)
+            return data
+
+        key = self.redis_key(table, data_id)
+        version_key = self.version_key(table, data_id)
+        lock_key = f"{key}:lock"
+        locked = False
+        try:
+            database = DBFactory.get_instance("redis")
+            rd = database.db_getter()
+            # 读取缓存使用自动批量发送，并发读取多条数据时合并为一次 Redis 往返
+            data = await self.get_redis(database.auto_pipeline, key, field)
+            if data is not MISSING:
+                self.set_local(table, data_id, field, data, invalidations)
+                return data
+            # 回源查询之前读取版本号
+            async with rd.pipeline(transaction=False) as pipe:
+                pipe.set(lock_key, 1, nx=True, px=int(self.lock_ttl * 1000))
+                pipe.get(version_key)
+                locked, version = await pipe.execute()
+            if not locked:
+                data = await self.wait_redis(database.auto_pipeline, key, field)
+                if data is not MISSING:
+                    self.set_local(table, data_id, field, data, invalidations)
+                    return data
+        except RedisError as e:
+            log.warning(f"读取 ORM 数据缓存失败，直接查询数据库：{e}")
+            rd = None
+
+        cacheable = False
+        try:
+            data, cacheable = await loader()
+            if data is not None and cacheable and rd is not None:
+                if self._fill_script is None:
+                    self._fill_script = rd.register_script(self.fill_script)
+                value = orjson.dumps(data, default=orjson_default)
+                args = [version or "", field, value, self.ttl]
+                await self._fill_script(keys=[key, version_key], args=args, client=rd)
+        except RedisError as e:
+            log.warning(f"写入 ORM 数据缓存失败：{e}")
+        finally:
+            if locked:
+                try:
+                    await rd.delete(lock_key)
+                except RedisError:
+                    pass
+        if cacheable:
+            self.set_local(table, data_id, field, data, invalidations)
+        return data
+
+    @staticmethod
+    async def get_redis(rd, key: str, field: str) -> dict | object:
+        value = await rd.hget(key, field)
+        return MISSING if value is None else orjson.loads(value)
+
+    async def wait_redis(self, rd, key: str, field: str) -> dict | object:
+        """
+        其他进程正在加载数据，轮询等待缓存写入
+
+        :return: 等待超时返回 MISSING
+        """
+        interval = 0.05
+        for _ in range(int(self.lock_wait / interval)):
+            await asyncio.sleep(interval)
+            data = await self.get_redis(rd, key, field)
+            if data is not MISSING:
+                return data
+        return MISSING
+
+    def set_local(self, table: str, data_id: int, field: str, data: dict | None, invalidations: int) -> None:
+        """
+        写入进程内缓存
+
+        :param invalidations: 开始加载时的缓存失效次数，加载期间有缓存失效时不写入
+        """
+        if data is None or invalidations != self.invalidations:
+            return
+        self.local.set((table, data_id), self.local.get((table, data_id), {}) | {field: data})
+
+    def mark(self, session: Session | AsyncSession, table: str, ids: Iterable[int]) -> None:
+        """
+        标记需要在会话提交后删除的缓存
+
+        :param session: ORM 会话
+        :param table: 表名
+        :param ids: 数据 ID 列表
+        :return:
+        """
+        session.info.setdefault(self.session_key, set()).update((table, data_id) for data_id in ids)
+
+    def invalidate(self, keys: Iterable[tuple[str, int]]) -> None:
+        """
+        删除缓存
+
+        在 AsyncSession 提交时的 greenlet 中同步等待 Redis 删除完成，保证提交返回后读取不到旧数据
+        删除缓存的同时写入新的版本号，正在回源查询的加载不会再将旧数据写入缓存，版本号与缓存的过期时间相同
+
+        :param keys: [(表名, 数据 ID)]
+        :return:
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        self.invalidations += 1
+        for key in keys:
+            self.local.delete(key)
+        if not self.redis_enabled:
+            return
+        rd = DBFactory.get_instance("redis").db_getter()
+        version = uuid.uuid4().hex
+
+        async def delete() -> None:
+            async with rd.pipeline(transaction=False) as pipe:
+                pipe.delete(*[self.redis_key(table, data_id) for table, data_id in keys])
+                for table, data_id in keys:
+                    pipe.set(self.version_key(table, data_id), version, ex=self.ttl)
+                await pipe.execute()
+
+        try:
+            await_only(delete())
+        except MissingGreenlet:
+            log.warning("当前会话不是 AsyncSession，无法删除 Redis 中的 ORM 数据缓存")
+        except RedisError as e:
+            log.error(f"删除 ORM 数据缓存失败：{e}")
+
+
+class ORMQueryCache:
+    """
+    ORMCrud 列表查询与统计总数缓存，缓存序列化后的字典数据
+
+    缓存键为编译后的 SQL 与参数，过滤、分页、排序条件相同的查询使用同一个缓存
+
+    按表失效：
+    每个表有一个代数计数器，缓存数据时记录查询涉及的所有表（查询语句中的表与 schema 中加载的关联表）的当前代数，
+    读取时代数不一致即为失效，任意会话提交写入后对应表的代数加一，该表所有相关缓存同时失效
+    查询前读取代数，即使查询过程中有写入提交，写入的缓存代数也已经过期，不会缓存旧数据
+    只读副本可能存在复制延迟，读取代数之后从副本查询仍可能得到旧数据，
+    所以只缓存从主库查询的数据，见 ORMCrud.get_cached_query
+
+    会话中执行的 insert/update/delete 语句（包括 bulk_upsert 与关联中间表的写入）与 flush 的 ORM 对象都会标记写入的表，
+    text() 原生 SQL 无法确定写入的表，需要调用 orm_query_cache.mark 手动标记
+
+    启用 Redis 时代数计数器与缓存都存储在 Redis 中，读取时只需要一次 MGET，所有进程共享，
+    未启用 Redis 时只使用进程内缓存，只能感知当前进程的写入，其他进程的写入需要等待缓存过期
+    """
+
+    # 会话 info 中记录写入的表
+    session_key = "orm_query_cache_tables"
+
+    def __init__(self, *, prefix: str = "orm_query", local_max_size: int = 1024):
+        """
+        :param prefix: Redis 缓存键前缀
+        :param local_max_size: 进程内缓存最大数量
+        """
+        self.prefix = prefix
+        # 缓存格式：{缓存键: (代数列表, 数据)}
+        self.local = LRUCache(local_max_size)
+        self.generations: dict[str, int] = {}
+        self.single_flight = SingleFlight()
+        # 命中统计，格式：{缓存名称: {"hits": 命中次数, "misses": 未命中次数}}
+        self.counters: dict[str, dict[str, int]] = {}
+        self.started_at = time.time()
+
+    @property
+    def redis_enabled(self) -> bool:
+        return settings.db.REDIS_DB_ENABLE
+
+    def generation_key(self, table: str) -> str:
+        return f"{self.prefix}:gen:{table}"
+
+    async def get(
+        self,
+        name: str,
+        key: str,
+        tables: Iterable[str],
+        ttl: int,
+        loader: Callable[[], Awaitable[tuple[Any, bool]]],
+    ) -> Any:
+        """
+        获取缓存数据，未命中时执行 loader 查询数据库并写入缓存
+
+        :param name: 缓存名称，用于命中统计，例如 auth_role.page
+        :param key: 缓存键，未经过哈希的完整键
+        :param tables: 查询涉及的表
+        :param ttl: 缓存过期时间（秒）
+        :param loader: 查询数据库的函数，返回 (数据, 是否可以写入缓存)，数据需要可以 JSON 序列化
+        :return:
+        """
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        tables = sorted(set(tables))
+        counter = self.counters.setdefault(name, {"hits": 0, "misses": 0})
+
+        if not self.redis_enabled:
+            generations = [self.generations.get(table, 0) for table in tables]
+            entry = self.local.get(digest)
+            if entry is not MISSING and entry[0] == generations:
+                counter["hits"] += 1
+                return entry[1]
+            counter["misses"] += 1
+
+            async def load_local() -> Any:
+                data, cacheable = await loader()
+                if cacheable:
+                    self.local.set(digest, (generations, data), ttl)
+                return data
+
+            return await self.single_flight.do((digest, *generations), load_local)
+
+        entry_key = f"{self.prefix}:{digest}"
+        try:
+            rd = DBFactory.get_instance("redis").db_getter()
+            *values, entry = await rd.mget([self.generation_key(table) for table in tables] + [entry_key])
+            generations = [int(value or 0) for value in values]
+            if entry is not None:
+                entry = orjson.loads(entry)
+                if entry["g"] == generations:
+                    counter["hits"] += 1
+                    return entry["d"]
+        except RedisError as e:
+            log.warning(f"读取 ORM 查询缓存失败，直接查询数据库：{e}")
+            counter["misses"] += 1
+            data, _ = await loader()
+            return data
+        counter["misses"] += 1
+
+        async def load_redis() -> Any:
+            data, cacheable = await loader()
+            if not cacheable:
+                return data
+            try:
+                await rd.set(entry_key, orjson.dumps({"g": generations, "d": data}, default=orjson_default), ex=ttl)
+            except RedisError as exc:
+                log.warning(f"写入 ORM 查询缓存失败：{exc}")
+            return data
+
+        return await self.single_flight.do((digest, *generations), load_redis)
+
+    def mark(self, session: Session | AsyncSession, tables: Iterable[str]) -> None:
+        """
+        标记需要在会话提交后失效的表
+
+        :param session: ORM 会话
+        :param tables: 表名列表
+        :return:
+        """
+        session.info.setdefault(self.session_key, set()).update(tables)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        """
+        表的代数加一，使相关缓存失效
+
+        与 ORMDataCache.invalidate 相同，在 AsyncSession 提交时的 greenlet 中同步等待 Redis 写入完成
+
+        :param tables: 表名列表
+        :return:
+        """
+        tables = list(tables)
+        for table in tables:
+            self.generations[table] = self.generations.get(table, 0) + 1
+        if not tables or not self.redis_enabled:
+            return
+        rd = DBFactory.get_instance("redis").db_getter()
+
+        async def incr() -> None:
+            async with rd.pipeline(transaction=False) as pipe:
+                for table in tables:
+                    pipe.incr(self.generation_key(table))
+                await pipe.execute()
+
+        try:
+            await_only(incr())
+        except MissingGreenlet:
+            log.warning("当前会话不是 AsyncSession，无法更新 Redis 中的 ORM 查询缓存代数")
+        except RedisError as e:
+            log.error(f"更新 ORM 查询缓存代数失败：{e}")
+
+    def stats(self) -> dict:
+        """
+        当前进程的缓存命中统计
+
+        :return:
+        """
+        result = {}
+        for name, counter in sorted(self.counters.items()):
+            total = counter["hits"] + counter["misses"]
+            result[name] = counter | {"hit_rate": round(counter["hits"] / total, 4) if total else 0}
+        hits = sum(counter["hits"] for counter in self.counters.values())
+        total = hits + sum(counter["misses"] for counter in self.counters.values())
+        return {
+            "backend": "redis" if self.redis_enabled else "local",
+            "since": self.started_at,
+            "hits": hits,
+            "misses": total - hits,
+            "hit_rate": round(hits / total, 4) if total else 0,
+            "queries": result,
+        }
+
+    def clear(self) -> None:
+        """
+        清空进程内缓存与命中统计
+
+        :return:
+        """
+        self.local.clear()
+        self.counters.clear()
+        self.started_at = time.time()
+
+
+orm_data_cache = ORMDataCache()
+orm_query_cache = ORMQueryCache()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_execute_table(orm_execute_state: ORMExecuteState) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            orm_query_cache.mark(orm_execute_state.session, [table.name])
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush_objects(session: Session, _) -> None:
+    changed = [obj for obj in (*session.dirty, *session.deleted) if isinstance(obj, AbstractORMModel)]
+    if changed:
+        keys = session.info.setdefault(ORMDataCache.session_key, set())
+        keys.update((obj.__table__.name, obj.id) for obj in changed)
+
+    tables = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        mapper = object_mapper(obj)
+        tables.update(table.name for table in mapper.tables)
+        for relationship in mapper.relationships:
+            if relationship.secondary is not None and get_history(obj, relationship.key).has_changes():
+                tables.add(relationship.secondary.name)
+    if tables:
+        orm_query_cache.mark(session, tables)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    keys = session.info.pop(ORMDataCache.session_key, None)
+    if keys:
+        orm_data_cache.invalidate(keys)
+    tables = session.info.pop(ORMQueryCache.session_key, None)
+    if tables:
+        orm_query_cache.bump(tables)
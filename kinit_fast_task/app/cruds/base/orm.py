@@ -4,19 +4,49 @@
 # @IDE            : PyCharm
 # @Desc           : 数据库 增删改查操作
 
+import base64
 import datetime
+import json
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy.exc import IntegrityError, NoResultFound
 
 from kinit_fast_task.utils.response_code import Status as UtilsStatus
-from sqlalchemy import func, delete, update, BinaryExpression, select, false, insert, Result, CursorResult
+from sqlalchemy import (
+    func,
+    delete,
+    update,
+    BinaryExpression,
+    select,
+    false,
+    insert,
+    Result,
+    CursorResult,
+    tuple_,
+    text,
+    bindparam,
+    Integer,
+    Table,
+    inspect as sa_inspect,
+    values as sa_values,
+    column,
+)
+from sqlalchemy.orm import QueryableAttribute, load_only, selectinload
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.sql.util import find_tables
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.strategy_options import _AbstractLoad
 from kinit_fast_task.core import CustomException
 from sqlalchemy.sql.selectable import Select as SelectType
-from typing import Any, TypeVar, Generic
-from pydantic import BaseModel as AbstractSchemaModel
+from typing import Any, TypeVar, Generic, get_args
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable, Generator, Iterable, Sequence
+from pydantic import BaseModel as AbstractSchemaModel, TypeAdapter
 from kinit_fast_task.app.models.base.orm import AbstractORMModel
+from kinit_fast_task.app.cruds.base.cache import ORMDataCache, ORMQueryCache, orm_data_cache, orm_query_cache
+from kinit_fast_task.db.orm.asyncio import RoutingSession
 from abc import ABC, abstractmethod
 from enum import Enum
 
@@ -32,6 +62,238 @@ class ReturnType(Enum):
     RAW_RESULT = "raw_result"  # 原始结果，未经处理的结果
 
 
+class PageTotal(Enum):
+    """
+    分页查询总数统计方式
+    """
+
+    EXACT = "exact"  # 精确总数，与分页数据在同一条 SQL 中查出
+    APPROXIMATE = "approximate"  # 不统计总数，只判断是否存在下一页，返回已知的最少数据量
+    SKIP = "skip"  # 不统计总数
+
+
+class CountStrategy(Enum):
+    """
+    数据总数统计方式
+    """
+
+    EXACT = "exact"  # 精确统计
+    ESTIMATE = "estimate"  # PostgreSQL 查询计划器估算
+    CACHED = "cached"  # 精确统计，并在进程内缓存一段时间
+
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN (FORMAT JSON) 查询，保留原查询的绑定参数
+
+    官方文档：https://docs.sqlalchemy.org/en/20/core/compiler.html
+    """
+
+    inherit_cache = False
+
+    def __init__(self, statement: SelectType):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kw) -> str:
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kw)}"
+
+
+class SelectShape(Enum):
+    """
+    build_filter_sql 查询内容
+    """
+
+    MODEL = "model"  # 查询模型
+    COUNT = "count"  # 查询总数
+    MODEL_TOTAL = "model_total"  # 查询模型与窗口函数统计的总数
+
+
+class StatementCache:
+    """
+    查询语句缓存，按查询结构缓存构建好的 Select 对象，使用 LRU 策略淘汰
+    """
+
+    def __init__(self, max_size: int = 512):
+        """
+        :param max_size: 最大缓存数量
+        """
+        self.max_size = max_size
+        self._cache: OrderedDict[tuple, SelectType] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.skips = 0
+
+    def get(self, key: tuple) -> SelectType | None:
+        """
+        获取缓存的查询语句
+
+        :param key: 查询结构缓存键
+        :return: 未命中返回 None
+        """
+        sql = self._cache.get(key)
+        if sql is None:
+            self.misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return sql
+
+    def set(self, key: tuple, sql: SelectType) -> None:
+        """
+        缓存查询语句
+
+        :param key: 查询结构缓存键
+        :param sql: 查询语句
+        """
+        self._cache[key] = sql
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def skip(self) -> None:
+        """
+        记录一次无法缓存的查询
+
+        :return:
+        """
+        self.skips += 1
+
+    def stats(self) -> dict:
+        """
+        缓存命中统计
+
+        :return:
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skips": self.skips,
+            "hit_rate": round(self.hits / total, 4) if total else 0,
+        }
+
+    def clear(self) -> None:
+        """
+        清空缓存与统计
+
+        :return:
+        """
+        self._cache.clear()
+        self.hits = self.misses = self.skips = 0
+
+
+@lru_cache(maxsize=256)
+def get_list_adapter(schema: type[AbstractSchemaModel]) -> TypeAdapter:
+    """
+    获取 list[schema] 的 TypeAdapter，TypeAdapter 构建代价较高，所以按 schema 缓存
+
+    官方文档：https://docs.pydantic.dev/latest/concepts/type_adapter/
+
+    :param schema: 序列化对象
+    :return:
+    """
+    return TypeAdapter(list[schema])
+
+
+def _find_nested_schema(annotation: Any) -> type[AbstractSchemaModel] | None:
+    """
+    从字段类型注解中查找嵌套的 schema，例如：list[AuthRoleSimpleOutSchema]、AuthRoleSimpleOutSchema | None
+
+    :param annotation: 字段类型注解
+    :return: 未找到返回 None
+    """
+    if isinstance(annotation, type) and issubclass(annotation, AbstractSchemaModel):
+        return annotation
+    for arg in get_args(annotation):
+        schema = _find_nested_schema(arg)
+        if schema is not None:
+            return schema
+    return None
+
+
+def _schema_columns(
+    model: type[AbstractORMModel], schema: type[AbstractSchemaModel], extra_fields: tuple[str, ...] = ()
+) -> tuple[list[Any], list[_AbstractLoad]] | None:
+    """
+    获取 schema 需要加载的模型字段与关系加载选项
+
+    :param model: ORM 模型
+    :param schema: 序列化 schema
+    :param extra_fields: 额外需要加载的字段
+    :return: (字段列表, 关系加载选项列表)，schema 中存在非模型字段（例如 property）时无法确定需要加载的字段，返回 None
+    """
+    mapper = sa_inspect(model)
+    columns = []
+    relationships = []
+    for name in (*schema.model_fields.keys(), *extra_fields):
+        if name in mapper.column_attrs:
+            columns.append(getattr(model, name))
+        elif name in mapper.relationships:
+            attr = getattr(model, name)
+            loader = selectinload(attr)
+            nested = _find_nested_schema(schema.model_fields[name].annotation) if name in schema.model_fields else None
+            result = _schema_columns(mapper.relationships[name].mapper.class_, nested) if nested else None
+            if result is not None:
+                nested_columns, nested_relationships = result
+                sub_options = [load_only(*nested_columns)] if nested_columns else []
+                loader = loader.options(*sub_options, *nested_relationships)
+            relationships.append(loader)
+        else:
+            return None
+    return columns, relationships
+
+
+@lru_cache(maxsize=256)
+def get_schema_tables(model: type[AbstractORMModel], schema: type[AbstractSchemaModel]) -> frozenset[str]:
+    """
+    获取 schema 中加载的关联表，包括嵌套 schema 中的关联表与多对多中间表，用于查询缓存按表失效
+
+    :param model: ORM 模型
+    :param schema: 序列化 schema
+    :return: 表名集合
+    """
+    mapper = sa_inspect(model)
+    tables = set()
+    for name, field in schema.model_fields.items():
+        relationship = mapper.relationships.get(name)
+        if relationship is None:
+            continue
+        tables.add(relationship.target.name)
+        if relationship.secondary is not None:
+            tables.add(relationship.secondary.name)
+        nested = _find_nested_schema(field.annotation)
+        if nested is not None:
+            tables.update(get_schema_tables(relationship.mapper.class_, nested))
+    return frozenset(tables)
+
+
+@lru_cache(maxsize=256)
+def get_schema_load_options(
+    model: type[AbstractORMModel], schema: type[AbstractSchemaModel], extra_fields: tuple[str, ...] = ()
+) -> tuple[_AbstractLoad, ...]:
+    """
+    根据序列化 schema 生成加载选项，只查询 schema 中需要的字段，包括嵌套的关系 schema，例如 AuthUserOutSchema.roles
+
+    宽表只查询接口需要的字段，可以减少数据库传输的数据量与 ORM 对象构建的开销
+
+    加载选项按 (model, schema) 缓存，同一个加载选项对象可以被查询语句缓存复用
+
+    :param model: ORM 模型
+    :param schema: 序列化 schema
+    :param extra_fields: 额外需要加载的字段，例如游标分页的排序字段
+    :return: 无法确定需要加载的字段时返回空元组，即加载所有字段
+    """
+    result = _schema_columns(model, schema, extra_fields)
+    if result is None:
+        return ()
+    columns, relationships = result
+    options = [load_only(*columns)] if columns else []
+    return tuple(options + relationships)
+
+
 ORMModel = TypeVar("ORMModel", bound=AbstractORMModel)
 
 
@@ -43,6 +305,16 @@ class ORMCrud(ABC, Generic[ORMModel]):
     sqlalchemy 增删改操作：https://docs.sqlalchemy.org/en/20/orm/queryguide/dml.html
     """
 
+    # 查询语句缓存，所有 CRUD 共享，缓存键中包含模型
+    statement_cache: StatementCache = StatementCache()
+    # 唯一索引冲突提示信息，格式：{唯一索引名称: 提示信息}，写入时违反对应唯一索引会转换为 CustomException
+    unique_errors: dict[str, str] = {}
+    # 单条数据读缓存，所有 CRUD 共享，缓存键中包含表名，get_data 使用 v_cache 开启
+    data_cache: ORMDataCache = orm_data_cache
+    # 列表查询与统计总数缓存，所有 CRUD 共享，按表失效
+    # get_datas/get_page 使用 v_cache 开启，get_count 使用 cached 统计方式开启
+    query_cache: ORMQueryCache = orm_query_cache
+
     @abstractmethod
     def __init__(
         self,
@@ -76,7 +348,9 @@ class ORMCrud(ABC, Generic[ORMModel]):
         v_return_none: bool = False,
         v_schema: type[AbstractSchemaModel] = None,
         v_return_type: ReturnType | str = ReturnType.MODEL,
+        v_load_only: bool = True,
         v_expire_all: bool = False,
+        v_cache: bool = False,
         **kwargs,
     ) -> Any:
         """
@@ -94,13 +368,46 @@ class ORMCrud(ABC, Generic[ORMModel]):
         :param v_return_none: 是否返回空 None，否认 抛出异常，默认抛出异常
         :param v_schema: 指定使用的序列化对象
         :param v_return_type: 指定数据返回类型，默认返回模型对象
+        :param v_load_only: 返回类型为 DICT 或 SCHEMA 时，是否只查询序列化对象中需要的字段
         :param v_expire_all: 使当前会话（Session）中所有已加载的对象过期，确保您获取的是数据库中的最新数据，但可能会有性能损耗，博客：https://blog.csdn.net/k_genius/article/details/135490378。
+        :param v_cache: 是否使用读缓存，只支持根据 ID 查询并返回 DICT 类型的数据，数据修改提交后缓存自动失效，见 ORMDataCache
         :param kwargs: 查询参数
         :return: 默认返回 ORM Model 对象
         """  # noqa E501
+        if v_cache:
+            if (
+                data_id is None
+                or kwargs
+                or any(x is not None for x in (v_start_sql, v_select_from, v_join, v_outer_join, v_where))
+                or v_return_type not in (ReturnType.DICT, ReturnType.DICT.value)
+            ):
+                raise CustomException("读缓存只支持根据 ID 查询并返回 DICT 类型的数据")
+            v_schema = v_schema or self.simple_out_schema
+
+            async def load() -> tuple[dict | None, bool]:
+                # 只读副本可能存在复制延迟，只有从主库查询的数据才写入缓存
+                sync_session = self.session.sync_session
+                cacheable = not isinstance(sync_session, RoutingSession) or sync_session.pin_primary()
+                data = await self.get_data(
+                    data_id,
+                    v_options=v_options,
+                    v_return_none=v_return_none,
+                    v_schema=v_schema,
+                    v_return_type=ReturnType.DICT,
+                    v_load_only=v_load_only,
+                    v_expire_all=v_expire_all,
+                )
+                return data, cacheable
+
+            return await self.data_cache.get(self.model.__table__.name, data_id, v_schema, load)
+
         if v_expire_all:
             self.session.expire_all()
 
+        v_options = self.add_schema_options(
+            v_options, v_start_sql=v_start_sql, v_schema=v_schema, v_return_type=v_return_type, v_load_only=v_load_only
+        )
+
         queryset = await self.filter_core(
             v_start_sql=v_start_sql,
             v_select_from=v_select_from,
@@ -154,7 +461,10 @@ class ORMCrud(ABC, Generic[ORMModel]):
         v_order_field: str = None,
         v_schema: type[AbstractSchemaModel] = None,
         v_return_type: ReturnType | str = ReturnType.MODEL,
+        v_load_only: bool = True,
         v_expire_all: bool = False,
+        v_cache: bool = False,
+        v_cache_ttl: int = 60,
         **kwargs,
     ) -> Any:
         """
@@ -172,13 +482,217 @@ class ORMCrud(ABC, Generic[ORMModel]):
         :param v_order_field: 排序字段
         :param v_schema: 指定使用的序列化对象
         :param v_return_type: 指定数据返回类型，默认返回模型对象
+        :param v_load_only: 返回类型为 DICT 或 SCHEMA 时，是否只查询序列化对象中需要的字段
         :param v_expire_all: 使当前会话（Session）中所有已加载的对象过期，确保您获取的是数据库中的最新数据，但可能会有性能损耗，博客：https://blog.csdn.net/k_genius/article/details/135490378。
+        :param v_cache: 是否使用查询缓存，只支持返回 DICT 类型的数据，查询涉及的表写入提交后缓存自动失效，见 ORMQueryCache
+        :param v_cache_ttl: 查询缓存有效时间，单位秒
         :param kwargs: 查询参数，使用的是自定义表达式
         :return:
         """  # noqa E501
+        if v_cache and v_options:
+            raise CustomException("查询缓存不支持 v_options，关联数据请通过 v_schema 加载")
+
+        if v_expire_all:
+            self.session.expire_all()
+
+        v_options = self.add_schema_options(
+            v_options, v_start_sql=v_start_sql, v_schema=v_schema, v_return_type=v_return_type, v_load_only=v_load_only
+        )
+
+        if isinstance(v_start_sql, SelectType):
+            sql: SelectType = await self.filter_core(
+                v_start_sql=v_start_sql,
+                v_select_from=v_select_from,
+                v_join=v_join,
+                v_outer_join=v_outer_join,
+                v_options=v_options,
+                v_where=v_where,
+                v_order=v_order,
+                v_order_field=v_order_field,
+                v_return_sql=True,
+                **kwargs,
+            )
+            if limit != 0:
+                sql = sql.offset((page - 1) * limit).limit(limit)
+            params = {}
+        else:
+            sql, params = self.build_filter_sql(
+                v_paging=limit != 0,
+                v_select_from=v_select_from,
+                v_join=v_join,
+                v_outer_join=v_outer_join,
+                v_options=v_options,
+                v_where=v_where,
+                v_order=v_order,
+                v_order_field=v_order_field,
+                **kwargs,
+            )
+            if limit != 0:
+                params.update(v_offset=(page - 1) * limit, v_limit=limit)
+
+        async def fetch() -> Any:
+            queryset = await self.session.execute(sql, params)
+            if v_return_type == ReturnType.RAW_RESULT or v_return_type == ReturnType.RAW_RESULT.value:
+                return queryset.all()  # 返回格式：[(<model object>, ), (<model object>, ), ...]
+            return self.format_datas(queryset.scalars().all(), v_schema=v_schema, v_return_type=v_return_type)
+
+        if v_cache:
+            return await self.get_cached_query(
+                "datas", sql, params, fetch, v_schema=v_schema, v_return_type=v_return_type, v_cache_ttl=v_cache_ttl
+            )
+        return await fetch()
+
+    async def stream_datas(
+        self,
+        *,
+        v_start_sql: SelectType = None,
+        v_select_from: list[Any] = None,
+        v_join: list[Any] = None,
+        v_outer_join: list[Any] = None,
+        v_options: list[_AbstractLoad] = None,
+        v_where: list[BinaryExpression] = None,
+        v_order: str = None,
+        v_order_field: str = None,
+        v_schema: type[AbstractSchemaModel] = None,
+        v_return_type: ReturnType | str = ReturnType.MODEL,
+        v_load_only: bool = True,
+        v_yield_per: int = 1000,
+        **kwargs,
+    ) -> AsyncIterator[Any]:
+        """
+        流式获取全部数据，使用服务端游标每次只从数据库读取 v_yield_per 条数据，内存占用与数据总量无关
+
+        用于导出等需要遍历大量数据的场景，遍历期间会一直占用当前会话的数据库连接，
+        服务端游标需要在事务中使用，不支持 db_read_getter 获取的只读会话，请使用 db_getter 或 db_transaction_getter
+
+        官方文档：https://docs.sqlalchemy.org/en/20/orm/queryguide/api.html#fetching-large-result-sets-with-yield-per
+
+        :param v_start_sql: 初始 sql
+        :param v_select_from: 用于指定查询从哪个表开始，通常与 .join() 等方法一起使用。
+        :param v_join: 创建内连接（INNER JOIN）操作，返回两个表中满足连接条件的交集。
+        :param v_outer_join: 用于创建外连接（OUTER JOIN）操作，返回两个表中满足连接条件的并集，包括未匹配的行，并用 NULL 值填充。
+        :param v_options: 用于为查询添加附加选项，如预加载、延迟加载等。
+        :param v_where: 当前表查询条件，原始表达式
+        :param v_order: 排序，默认正序，为 desc 是倒叙
+        :param v_order_field: 排序字段
+        :param v_schema: 指定使用的序列化对象
+        :param v_return_type: 指定数据返回类型，默认返回模型对象，不支持 RAW_RESULT
+        :param v_load_only: 返回类型为 DICT 或 SCHEMA 时，是否只查询序列化对象中需要的字段
+        :param v_yield_per: 每批从数据库读取的数据量
+        :param kwargs: 查询参数，使用的是自定义表达式
+        :return: 逐条返回数据的异步迭代器
+        """  # noqa E501
+        if v_return_type == ReturnType.RAW_RESULT or v_return_type == ReturnType.RAW_RESULT.value:
+            raise CustomException("流式获取数据不支持返回原始结果！")
+
+        v_options = self.add_schema_options(
+            v_options, v_start_sql=v_start_sql, v_schema=v_schema, v_return_type=v_return_type, v_load_only=v_load_only
+        )
+        if isinstance(v_start_sql, SelectType):
+            sql: SelectType = await self.filter_core(
+                v_start_sql=v_start_sql,
+                v_select_from=v_select_from,
+                v_join=v_join,
+                v_outer_join=v_outer_join,
+                v_options=v_options,
+                v_where=v_where,
+                v_order=v_order,
+                v_order_field=v_order_field,
+                v_return_sql=True,
+                **kwargs,
+            )
+            params = {}
+        else:
+            sql, params = self.build_filter_sql(
+                v_select_from=v_select_from,
+                v_join=v_join,
+                v_outer_join=v_outer_join,
+                v_options=v_options,
+                v_where=v_where,
+                v_order=v_order,
+                v_order_field=v_order_field,
+                **kwargs,
+            )
+
+        result = await self.session.stream(sql.execution_options(yield_per=v_yield_per), params)
+        try:
+            async for partition in result.scalars().partitions():
+                for data in self.format_datas(partition, v_schema=v_schema, v_return_type=v_return_type):
+                    yield data
+        finally:
+            await result.close()
+
+    async def get_cursor_datas(
+        self,
+        *,
+        cursor: str = None,
+        limit: int = 10,
+        v_start_sql: SelectType = None,
+        v_select_from: list[Any] = None,
+        v_join: list[Any] = None,
+        v_outer_join: list[Any] = None,
+        v_options: list[_AbstractLoad] = None,
+        v_where: list[BinaryExpression] = None,
+        v_order: str = None,
+        v_order_field: str = None,
+        v_schema: type[AbstractSchemaModel] = None,
+        v_return_type: ReturnType | str = ReturnType.MODEL,
+        v_load_only: bool = True,
+        v_expire_all: bool = False,
+        **kwargs,
+    ) -> tuple[Any, str | None]:
+        """
+        游标（keyset）分页获取数据列表
+
+        与 get_datas 的 OFFSET 分页不同，游标分页通过上一页最后一条数据的 (v_order_field, id) 生成 seek 条件：
+        WHERE (v_order_field, id) < (:value, :id)，所以无论翻到多深，查询代价都与第一页相同
+
+        排序字段需为非空字段，否则包含 NULL 的数据无法参与比较
+
+        :param cursor: 游标，第一页不传，之后传入上一页返回的 next_cursor
+        :param limit: 当前页数据量
+        :param v_start_sql: 初始 sql
+        :param v_select_from: 用于指定查询从哪个表开始，通常与 .join() 等方法一起使用。
+        :param v_join: 创建内连接（INNER JOIN）操作，返回两个表中满足连接条件的交集。
+        :param v_outer_join: 用于创建外连接（OUTER JOIN）操作，返回两个表中满足连接条件的并集，包括未匹配的行，并用 NULL 值填充。
+        :param v_options: 用于为查询添加附加选项，如预加载、延迟加载等。
+        :param v_where: 当前表查询条件，原始表达式
+        :param v_order: 排序，默认正序，为 desc 是倒叙
+        :param v_order_field: 排序字段，默认使用 id 排序
+        :param v_schema: 指定使用的序列化对象
+        :param v_return_type: 指定数据返回类型，默认返回模型对象，不支持 RAW_RESULT
+        :param v_load_only: 返回类型为 DICT 或 SCHEMA 时，是否只查询序列化对象中需要的字段
+        :param v_expire_all: 使当前会话（Session）中所有已加载的对象过期，确保您获取的是数据库中的最新数据，但可能会有性能损耗。
+        :param kwargs: 查询参数，使用的是自定义表达式
+        :return: (数据列表, 下一页游标)，没有下一页时游标为 None
+        """  # noqa E501
+        if v_return_type == ReturnType.RAW_RESULT or v_return_type == ReturnType.RAW_RESULT.value:
+            raise CustomException("游标分页不支持 RAW_RESULT 返回类型")
+
         if v_expire_all:
             self.session.expire_all()
 
+        v_options = self.add_schema_options(
+            v_options,
+            v_start_sql=v_start_sql,
+            v_schema=v_schema,
+            v_return_type=v_return_type,
+            v_load_only=v_load_only,
+            extra_fields=(v_order_field,) if v_order_field else (),
+        )
+
+        is_desc = v_order in self.order_fields
+        order_attr = getattr(self.model, v_order_field) if v_order_field else None
+
+        v_where = list(v_where) if v_where else []
+        if cursor:
+            value, last_id = self.decode_cursor(cursor, order_attr)
+            if order_attr is not None:
+                left, right = tuple_(order_attr, self.model.id), tuple_(value, last_id)
+            else:
+                left, right = self.model.id, last_id
+            v_where.append(left < right if is_desc else left > right)
+
         sql: SelectType = await self.filter_core(
             v_start_sql=v_start_sql,
             v_select_from=v_select_from,
@@ -186,35 +700,254 @@ class ORMCrud(ABC, Generic[ORMModel]):
             v_outer_join=v_outer_join,
             v_options=v_options,
             v_where=v_where,
-            v_order=v_order,
-            v_order_field=v_order_field,
             v_return_sql=True,
             **kwargs,
         )
 
-        if limit != 0:
-            sql = sql.offset((page - 1) * limit).limit(limit)
+        order_by = [order_attr, self.model.id] if order_attr is not None else [self.model.id]
+        sql = sql.order_by(*[item.desc() if is_desc else item for item in order_by])
 
-        queryset = await self.session.execute(sql)
-        if v_return_type == ReturnType.RAW_RESULT or v_return_type == ReturnType.RAW_RESULT.value:
-            return queryset.all()  # 返回格式：[(<model object>, ), (<model object>, ), ...]
+        # 多查询一条数据用于判断是否存在下一页
+        queryset = (await self.session.execute(sql.limit(limit + 1))).scalars().all()
+
+        next_cursor = None
+        if len(queryset) > limit:
+            queryset = queryset[:limit]
+            last = queryset[-1]
+            next_cursor = self.encode_cursor(getattr(last, v_order_field) if v_order_field else None, last.id)
+
+        return self.format_datas(queryset, v_schema=v_schema, v_return_type=v_return_type), next_cursor
+
+    async def get_page(
+        self,
+        *,
+        page: int = 1,
+        limit: int = 10,
+        v_start_sql: SelectType = None,
+        v_select_from: list[Any] = None,
+        v_join: list[Any] = None,
+        v_outer_join: list[Any] = None,
+        v_options: list[_AbstractLoad] = None,
+        v_where: list[BinaryExpression] = None,
+        v_order: str = None,
+        v_order_field: str = None,
+        v_schema: type[AbstractSchemaModel] = None,
+        v_return_type: ReturnType | str = ReturnType.MODEL,
+        v_total: PageTotal | str = PageTotal.EXACT,
+        v_load_only: bool = True,
+        v_expire_all: bool = False,
+        v_cache: bool = False,
+        v_cache_ttl: int = 60,
+        **kwargs,
+    ) -> tuple[Any, int | None]:
+        """
+        获取分页数据列表与数据总数，相当于 get_datas + get_count，但只会构建一次过滤条件并且只有一次数据库往返
 
-        queryset = queryset.scalars().all()
+        总数通过窗口函数 count(*) OVER () 与分页数据在同一条 SQL 中查出，
+        只有在当前页没有数据（例如页码超出范围）时才会额外执行一次总数统计
 
+        使用窗口函数统计时，请使用 selectinload 加载集合关系，joinedload 集合关系会导致总数统计到关联的行
+
+        :param page: 页码
+        :param limit: 当前页数据量
+        :param v_start_sql: 初始 sql
+        :param v_select_from: 用于指定查询从哪个表开始，通常与 .join() 等方法一起使用。
+        :param v_join: 创建内连接（INNER JOIN）操作，返回两个表中满足连接条件的交集。
+        :param v_outer_join: 用于创建外连接（OUTER JOIN）操作，返回两个表中满足连接条件的并集，包括未匹配的行，并用 NULL 值填充。
+        :param v_options: 用于为查询添加附加选项，如预加载、延迟加载等。
+        :param v_where: 当前表查询条件，原始表达式
+        :param v_order: 排序，默认正序，为 desc 是倒叙
+        :param v_order_field: 排序字段
+        :param v_schema: 指定使用的序列化对象
+        :param v_return_type: 指定数据返回类型，默认返回模型对象，RAW_RESULT 时每行最后一列为总数
+        :param v_total: 总数统计方式，exact：精确总数，approximate：只判断是否存在下一页，返回已知的最少数据量，skip：不统计总数
+        :param v_load_only: 返回类型为 DICT 或 SCHEMA 时，是否只查询序列化对象中需要的字段
+        :param v_expire_all: 使当前会话（Session）中所有已加载的对象过期，确保您获取的是数据库中的最新数据，但可能会有性能损耗。
+        :param v_cache: 是否使用查询缓存，只支持返回 DICT 类型的数据，查询涉及的表写入提交后缓存自动失效，见 ORMQueryCache
+        :param v_cache_ttl: 查询缓存有效时间，单位秒
+        :param kwargs: 查询参数，使用的是自定义表达式
+        :return: (数据列表, 数据总数)，不统计总数时总数为 None
+        """  # noqa E501
+        v_total = PageTotal(v_total)
+
+        if v_cache and v_options:
+            raise CustomException("查询缓存不支持 v_options，关联数据请通过 v_schema 加载")
+
+        if v_expire_all:
+            self.session.expire_all()
+
+        v_options = self.add_schema_options(
+            v_options, v_start_sql=v_start_sql, v_schema=v_schema, v_return_type=v_return_type, v_load_only=v_load_only
+        )
+
+        offset = (page - 1) * limit
+        # 估算总数时多查询一条数据用于判断是否存在下一页
+        page_limit = limit + 1 if v_total == PageTotal.APPROXIMATE else limit
+
+        if isinstance(v_start_sql, SelectType):
+            sql: SelectType = await self.filter_core(
+                v_start_sql=v_start_sql,
+                v_select_from=v_select_from,
+                v_join=v_join,
+                v_outer_join=v_outer_join,
+                v_options=v_options,
+                v_where=v_where,
+                v_order=v_order,
+                v_order_field=v_order_field,
+                v_return_sql=True,
+                **kwargs,
+            )
+            if v_total == PageTotal.EXACT:
+                sql = sql.add_columns(func.count().over().label("v_total"))
+            if limit != 0:
+                sql = sql.offset(offset).limit(page_limit)
+            params = {}
+        else:
+            sql, params = self.build_filter_sql(
+                v_select=SelectShape.MODEL_TOTAL if v_total == PageTotal.EXACT else SelectShape.MODEL,
+                v_paging=limit != 0,
+                v_select_from=v_select_from,
+                v_join=v_join,
+                v_outer_join=v_outer_join,
+                v_options=v_options,
+                v_where=v_where,
+                v_order=v_order,
+                v_order_field=v_order_field,
+                **kwargs,
+            )
+            if limit != 0:
+                params.update(v_offset=offset, v_limit=page_limit)
+
+        async def fetch() -> tuple[Any, int | None]:
+            rows = (await self.session.execute(sql, params)).all()
+
+            total = None
+            if v_total == PageTotal.EXACT:
+                if rows:
+                    total = rows[0][-1]
+                elif page > 1 and limit != 0:
+                    # 当前页没有数据时无法通过窗口函数获取总数，去掉分页与排序后统计同一查询的数据量，
+                    # 保证与窗口函数统计的范围一致（包括 is_delete 与 v_start_sql 中的条件）
+                    count_sql = select(func.count()).select_from(sql.limit(None).offset(None).order_by(None).subquery())
+                    count_params = {k: v for k, v in params.items() if k not in ("v_offset", "v_limit")}
+                    total = (await self.session.execute(count_sql, count_params)).scalar_one()
+                else:
+                    total = 0
+            elif v_total == PageTotal.APPROXIMATE:
+                if limit != 0 and len(rows) > limit:
+                    rows = rows[:limit]
+                    total = offset + limit + 1
+                else:
+                    total = offset + len(rows)
+
+            if v_return_type == ReturnType.RAW_RESULT or v_return_type == ReturnType.RAW_RESULT.value:
+                return rows, total
+
+            return self.format_datas([row[0] for row in rows], v_schema=v_schema, v_return_type=v_return_type), total
+
+        if v_cache:
+            return tuple(
+                await self.get_cached_query(
+                    "page", sql, params, fetch, v_schema=v_schema, v_return_type=v_return_type, v_cache_ttl=v_cache_ttl
+                )
+            )
+        return await fetch()
+
+    def add_schema_options(
+        self,
+        v_options: list[_AbstractLoad] | None,
+        *,
+        v_start_sql: SelectType = None,
+        v_schema: type[AbstractSchemaModel] = None,
+        v_return_type: ReturnType | str = ReturnType.MODEL,
+        v_load_only: bool = True,
+        extra_fields: tuple[str, ...] = (),
+    ) -> list[_AbstractLoad] | None:
+        """
+        根据序列化 schema 添加 load_only 加载选项
+
+        只在返回类型为 DICT 或 SCHEMA 时生效，返回 MODEL 时调用方可能访问任意字段，异步会话中访问未加载的字段会报错
+
+        :param v_options: 已有的加载选项
+        :param v_start_sql: 初始 sql，指定初始 sql 时不添加
+        :param v_schema: 指定使用的序列化对象
+        :param v_return_type: 指定数据返回类型
+        :param v_load_only: 是否添加
+        :param extra_fields: 额外需要加载的字段
+        :return: 加载选项
+        """
+        if not v_load_only or isinstance(v_start_sql, SelectType):
+            return v_options
+        if v_return_type not in (ReturnType.DICT, ReturnType.DICT.value, ReturnType.SCHEMA, ReturnType.SCHEMA.value):
+            return v_options
+        options = get_schema_load_options(self.model, v_schema or self.simple_out_schema, extra_fields)
+        if not options:
+            return v_options
+        return [*(v_options or []), *options]
+
+    def format_datas(
+        self,
+        queryset: Sequence[ORMModel],
+        *,
+        v_schema: type[AbstractSchemaModel] = None,
+        v_return_type: ReturnType | str = ReturnType.MODEL,
+    ) -> Any:
+        """
+        按照指定的返回类型格式化 ORM Model 对象列表
+
+        :param queryset: ORM Model 对象列表
+        :param v_schema: 指定使用的序列化对象
+        :param v_return_type: 指定数据返回类型
+        :return:
+        """
         if v_return_type == ReturnType.MODEL or v_return_type == ReturnType.MODEL.value:
             return queryset  # 返回格式：[<model object>, <model object>, ...]
 
         v_schema = v_schema or self.simple_out_schema
 
+        # 整个列表只调用一次 Pydantic 验证与序列化，避免逐行调用 model_validate 与 model_dump
+        adapter = get_list_adapter(v_schema)
+
         if v_return_type == ReturnType.DICT or v_return_type == ReturnType.DICT.value:
             # 返回格式：[{"id": 1, ...}, {"id": 2, ...}, ...]
-            return [v_schema.model_validate(obj).model_dump() for obj in queryset]
+            return adapter.dump_python(adapter.validate_python(queryset, from_attributes=True))
         elif v_return_type == ReturnType.SCHEMA or v_return_type == ReturnType.SCHEMA.value:
             # 返回格式：[<schema object>, <schema object>, ...]
-            return [v_schema.model_validate(obj) for obj in queryset]
+            return adapter.validate_python(queryset, from_attributes=True)
         else:
             raise CustomException("无效的返回值类型")
 
+    @staticmethod
+    def encode_cursor(value: Any, data_id: int) -> str:
+        """
+        生成游标，对前端来说游标是不透明的字符串
+
+        :param value: 排序字段值
+        :param data_id: 数据 ID
+        :return:
+        """
+        content = json.dumps([jsonable_encoder(value), data_id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(content.encode("utf-8")).decode("utf-8")
+
+    @staticmethod
+    def decode_cursor(cursor: str, order_attr: Any = None) -> tuple[Any, int]:
+        """
+        解析游标
+
+        :param cursor: 游标
+        :param order_attr: 排序字段，用于将排序字段值还原为对应的 Python 类型
+        :return: (排序字段值, 数据 ID)
+        """
+        try:
+            value, data_id = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+            if order_attr is not None and value is not None:
+                python_type = order_attr.type.python_type
+                if python_type in (datetime.datetime, datetime.date):
+                    value = python_type.fromisoformat(value)
+            return value, int(data_id)
+        except (ValueError, TypeError) as exc:
+            raise CustomException("无效的分页游标！") from exc
+
     async def get_count(
         self,
         *,
@@ -222,30 +955,151 @@ class ORMCrud(ABC, Generic[ORMModel]):
         v_join: list[Any] = None,
         v_outer_join: list[Any] = None,
         v_where: list[BinaryExpression] = None,
+        v_count_strategy: CountStrategy | str = CountStrategy.EXACT,
+        v_exact_threshold: int = 1000,
+        v_cache_ttl: int = 60,
         **kwargs,
     ) -> int:
         """
         获取数据总数
 
+        统计方式：
+            exact：执行 SELECT count(id) 获取精确总数
+            estimate：使用 PostgreSQL 查询计划器的估算行数，无过滤条件时直接读取 pg_class.reltuples，
+                估算结果小于 v_exact_threshold 时改为精确统计，非 PostgreSQL 数据库始终精确统计
+            cached：精确统计并按 SQL 与参数缓存 v_cache_ttl 秒，表写入提交后缓存自动失效，见 ORMQueryCache
+
         :param v_select_from: 用于指定查询从哪个表开始，通常与 .join() 等方法一起使用。
         :param v_join: 创建内连接（INNER JOIN）操作，返回两个表中满足连接条件的交集。
         :param v_outer_join: 用于创建外连接（OUTER JOIN）操作，返回两个表中满足连接条件的并集，包括未匹配的行，并用 NULL 值填充。
         :param v_where: 当前表查询条件，原始表达式
+        :param v_count_strategy: 统计方式，默认精确统计
+        :param v_exact_threshold: 估算统计时，估算结果小于该值则改为精确统计
+        :param v_cache_ttl: 缓存统计时，缓存有效时间，单位秒
         :param kwargs: 查询参数
         :return: 返回数据总数
         """  # noqa E501
-        v_start_sql = select(func.count(self.model.id))
-        sql = await self.filter_core(
-            v_start_sql=v_start_sql,
+        v_count_strategy = CountStrategy(v_count_strategy)
+
+        if v_count_strategy == CountStrategy.ESTIMATE and self.session.get_bind().dialect.name == "postgresql":
+            unfiltered = not (v_select_from or v_join or v_outer_join or v_where) and all(
+                value is None or value == "" for value in kwargs.values()
+            )
+            sql = await self.filter_core(
+                v_start_sql=select(self.model.id),
+                v_select_from=v_select_from,
+                v_join=v_join,
+                v_outer_join=v_outer_join,
+                v_where=v_where,
+                v_return_sql=True,
+                **kwargs,
+            )
+            estimate = await self.estimate_count(sql, unfiltered=unfiltered)
+            if estimate >= v_exact_threshold:
+                return estimate
+
+        sql, params = self.build_filter_sql(
+            v_select=SelectShape.COUNT,
             v_select_from=v_select_from,
             v_join=v_join,
             v_outer_join=v_outer_join,
             v_where=v_where,
-            v_return_sql=True,
             **kwargs,
         )
-        queryset = await self.session.execute(sql)
-        return queryset.one()[0]
+
+        if v_count_strategy != CountStrategy.CACHED:
+            queryset = await self.session.execute(sql, params)
+            return queryset.one()[0]
+
+        async def fetch() -> int:
+            queryset = await self.session.execute(sql, params)
+            return queryset.one()[0]
+
+        return await self.get_cached_query("count", sql, params, fetch, v_cache_ttl=v_cache_ttl)
+
+    async def estimate_count(self, sql: SelectType, *, unfiltered: bool = False) -> int:
+        """
+        使用 PostgreSQL 统计信息估算数据总数
+
+        无过滤条件时读取 pg_class.reltuples（表需要被 ANALYZE 过），
+        否则使用 EXPLAIN 获取查询计划器估算的行数
+
+        :param sql: 需要估算的查询 sql，应查询数据行而不是 count
+        :param unfiltered: 是否为无过滤条件的全表查询
+        :return: 估算的数据总数
+        """
+        if unfiltered:
+            queryset = await self.session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)"),
+                {"table_name": self.model.__table__.fullname},
+            )
+            reltuples = queryset.scalar()
+            # 从未 ANALYZE 的表 reltuples 为 -1
+            if reltuples is not None and reltuples >= 0:
+                return reltuples
+
+        queryset = await self.session.execute(Explain(sql))
+        plan = queryset.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    async def get_cached_query(
+        self,
+        name: str,
+        sql: SelectType,
+        params: dict,
+        fetch: Callable[[], Awaitable[Any]],
+        *,
+        v_schema: type[AbstractSchemaModel] = None,
+        v_return_type: ReturnType | str = ReturnType.DICT,
+        v_cache_ttl: int = 60,
+    ) -> Any:
+        """
+        通过查询缓存执行查询
+
+        缓存键为编译后的 SQL、参数与 schema，缓存按查询语句中的表与 schema 中加载的关联表（包括嵌套 schema）失效
+        只读会话中已经从只读副本读取过数据时，查询结果不会写入缓存，见 RoutingSession.pin_primary
+
+        :param name: 查询名称，用于命中统计
+        :param sql: 查询语句
+        :param params: 查询参数
+        :param fetch: 查询数据库的函数
+        :param v_schema: 指定使用的序列化对象
+        :param v_return_type: 数据返回类型，只支持 DICT
+        :param v_cache_ttl: 缓存有效时间，单位秒
+        :return:
+        """
+        if v_return_type not in (ReturnType.DICT, ReturnType.DICT.value):
+            raise CustomException("查询缓存只支持返回 DICT 类型的数据")
+        v_schema = v_schema or self.simple_out_schema
+
+        tables = {table.name for table in find_tables(sql) if isinstance(table, Table)}
+        # ORM 关系连接（join(Model.relation)）在编译时才会转换为表连接
+        for from_ in sql.get_final_froms():
+            tables.update(table.name for table in find_tables(from_, include_joins=True) if isinstance(table, Table))
+        if name != "count":
+            tables.update(get_schema_tables(self.model, v_schema))
+
+        async def load() -> tuple[Any, bool]:
+            # 只读副本可能存在复制延迟，只有从主库查询的数据才写入缓存
+            sync_session = self.session.sync_session
+            cacheable = not isinstance(sync_session, RoutingSession) or sync_session.pin_primary()
+            return await fetch(), cacheable
+
+        compiled = sql.compile()
+        schema_key = "" if name == "count" else ORMDataCache.schema_key(v_schema)
+        key = f"{name}:{schema_key}:{compiled}:{sorted((compiled.params | params).items())!r}"
+        return await self.query_cache.get(f"{self.model.__table__.name}.{name}", key, tables, v_cache_ttl, load)
+
+    @classmethod
+    def get_query_cache_stats(cls) -> dict:
+        """
+        获取列表查询与统计总数缓存命中统计
+
+        :return:
+        """
+        return cls.query_cache.stats()
 
     async def create_data(self, data: AbstractSchemaModel | dict, *, v_return_obj: bool = False) -> ORMModel | str:
         """
@@ -261,6 +1115,7 @@ class ORMCrud(ABC, Generic[ORMModel]):
         """  # noqa E501
         obj = self.model(**jsonable_encoder(data))
         await self.flush(obj)
+        self.mark_cache_invalid([obj.id])
         if v_return_obj:
             return obj
         return "创建成功"
@@ -282,13 +1137,138 @@ class ORMCrud(ABC, Generic[ORMModel]):
         sql = insert(self.model)
         if v_return_objs:
             sql = sql.returning(self.model)
-        result = await self.session.execute(sql, datas)
+        with self.translate_integrity_error():
+            result = await self.session.execute(sql, datas)
         if v_return_objs:
             queryset = result.scalars().all()
             assert isinstance(queryset, list)
             return queryset
         return "批量创建成功"
 
+    async def bulk_create(
+        self,
+        datas: Iterable[dict | AbstractSchemaModel] | AsyncIterable[dict | AbstractSchemaModel],
+        *,
+        chunk_size: int = 1000,
+    ) -> int:
+        """
+        分批批量创建数据
+
+        数据按 chunk_size 分批插入，每批只执行一次 executemany，支持传入异步迭代器流式读取数据，
+        内存中最多只保留一批数据，适合导入大量数据
+
+        ORM 批量插入官方文档：https://docs.sqlalchemy.org/en/20/orm/queryguide/dml.html#orm-bulk-insert-statements
+
+        :param datas: 数据列表或异步迭代器
+        :param chunk_size: 每批数据量
+        :return: 创建数据总数
+        """  # noqa E501
+        total = 0
+        async for chunk in self.iter_chunks(datas, chunk_size=chunk_size):
+            # 子类重写的 bulk_insert_chunk 也需要转换唯一索引异常
+            with self.translate_integrity_error():
+                await self.bulk_insert_chunk(chunk)
+            total += len(chunk)
+        return total
+
+    async def bulk_insert_chunk(self, chunk: list[dict]) -> None:
+        """
+        插入一批数据，子类可重写该方法处理关联数据
+
+        :param chunk: 一批字典数据
+        :return:
+        """
+        with self.translate_integrity_error():
+            await self.session.execute(insert(self.model), chunk)
+
+    async def bulk_upsert(
+        self,
+        datas: Iterable[dict | AbstractSchemaModel] | AsyncIterable[dict | AbstractSchemaModel],
+        *,
+        conflict_cols: list[str],
+        update_cols: list[str] = None,
+        chunk_size: int = 1000,
+    ) -> int:
+        """
+        分批批量插入或更新数据，使用 INSERT ... ON CONFLICT 实现，只支持 PostgreSQL 与 SQLite
+
+        conflict_cols 对应的字段必须存在唯一约束或唯一索引，PostgreSQL 下如果是部分唯一索引会自动带上索引条件，冲突时更新 update_cols 中的字段，
+        update_cols 为空时更新数据中除冲突字段与 id 外的所有字段，没有需要更新的字段时忽略冲突数据
+
+        ON CONFLICT DO UPDATE 不会触发字段的 onupdate，所以会同时将 update_datetime 更新为当前时间，
+        通过 RETURNING 获取插入或更新的数据 ID，会话提交后使这些数据的读缓存失效
+
+        官方文档：https://docs.sqlalchemy.org/en/20/orm/queryguide/dml.html#orm-upsert-statements
+
+        :param datas: 数据列表或异步迭代器
+        :param conflict_cols: 冲突判断字段
+        :param update_cols: 冲突时需要更新的字段
+        :param chunk_size: 每批数据量
+        :return: 处理数据总数
+        """  # noqa E501
+        dialect = self.session.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise CustomException(f"批量插入或更新不支持 {dialect} 数据库")
+
+        index_where = None
+        if dialect == "postgresql":
+            for index in self.model.__table__.indexes:
+                if index.unique and [column.name for column in index.columns] == list(conflict_cols):
+                    index_where = index.dialect_options["postgresql"]["where"]
+                    break
+
+        total = 0
+        async for chunk in self.iter_chunks(datas, chunk_size=chunk_size):
+            sql = dialect_insert(self.model)
+            columns = update_cols or [key for key in chunk[0] if key not in conflict_cols and key != "id"]
+            set_ = {column: sql.excluded[column] for column in columns}
+            if set_:
+                set_.setdefault("update_datetime", func.now())
+                sql = sql.on_conflict_do_update(index_elements=conflict_cols, index_where=index_where, set_=set_)
+            else:
+                sql = sql.on_conflict_do_nothing(index_elements=conflict_cols, index_where=index_where)
+            with self.translate_integrity_error():
+                result = await self.session.execute(sql.returning(self.model.id), chunk)
+            self.mark_cache_invalid(result.scalars().all())
+            total += len(chunk)
+        return total
+
+    @staticmethod
+    async def iter_chunks(
+        datas: Iterable[dict | AbstractSchemaModel] | AsyncIterable[dict | AbstractSchemaModel],
+        *,
+        chunk_size: int = 1000,
+    ) -> AsyncIterator[list[dict]]:
+        """
+        将数据按 chunk_size 分批，schema 对象会转为字典
+
+        :param datas: 数据列表或异步迭代器
+        :param chunk_size: 每批数据量
+        :return: 异步生成器，每次返回一批字典数据
+        """
+        if chunk_size <= 0:
+            raise CustomException("每批数据量必须大于 0")
+
+        chunk = []
+        if isinstance(datas, AsyncIterable):
+            async for data in datas:
+                chunk.append(data.model_dump() if isinstance(data, AbstractSchemaModel) else dict(data))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        else:
+            for data in datas:
+                chunk.append(data.model_dump() if isinstance(data, AbstractSchemaModel) else dict(data))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
     async def update_data(
         self, data_id: int, data: AbstractSchemaModel | dict, *, v_return_obj: bool = False
     ) -> ORMModel | str:
@@ -304,7 +1284,9 @@ class ORMCrud(ABC, Generic[ORMModel]):
         sql = update(self.model).where(self.model.id == data_id).values(**jsonable_encoder(data))
         if v_return_obj:
             sql = sql.returning(self.model)
-        result = await self.session.execute(sql)
+        with self.translate_integrity_error():
+            result = await self.session.execute(sql)
+        self.mark_cache_invalid([data_id])
         if v_return_obj:
             try:
                 obj = result.scalar_one()
@@ -316,6 +1298,65 @@ class ORMCrud(ABC, Generic[ORMModel]):
             raise CustomException("未查询到需要更新的数据！", code=UtilsStatus.HTTP_404)
         return "更新成功"
 
+    async def bulk_update(
+        self,
+        rows: Iterable[dict | AbstractSchemaModel] | AsyncIterable[dict | AbstractSchemaModel],
+        *,
+        chunk_size: int = 1000,
+    ) -> int:
+        """
+        根据 id 分批批量更新数据，每行数据可以更新为不同的值
+
+        每批数据按更新字段分组，PostgreSQL 下每组只执行一条 UPDATE ... FROM (VALUES ...) 语句，
+        其他数据库每组执行一次根据主键的 executemany 批量更新，未指定 update_datetime 时会和 update_data 一样触发 onupdate 更新为当前时间
+
+        更新不会同步当前会话中已加载的对象，如需获取最新数据请使用 v_expire_all
+
+        官方文档：https://docs.sqlalchemy.org/en/20/core/selectable.html#sqlalchemy.sql.expression.values
+
+        :param rows: 更新数据列表或异步迭代器，每行数据必须包含 id
+        :param chunk_size: 每批数据量，每批的绑定参数数量为：数据量 * 字段数量，PostgreSQL 单条语句最多支持 32767 个参数
+        :return: 更新的数据总数
+        """  # noqa E501
+        table = self.model.__table__
+        # SQLite 等数据库不支持 VALUES 列别名，退回到根据主键的 executemany 批量更新
+        from_values = self.session.get_bind().dialect.name == "postgresql"
+        total = 0
+        async for chunk in self.iter_chunks(rows, chunk_size=chunk_size):
+            groups: dict[tuple[str, ...], list[dict]] = {}
+            for row in chunk:
+                if row.get("id") is None:
+                    raise CustomException("批量更新的数据中缺少 id！")
+                groups.setdefault(tuple(sorted(row)), []).append(row)
+            self.mark_cache_invalid([row["id"] for row in chunk])
+
+            for keys, group in groups.items():
+                fields = [key for key in keys if key != "id"]
+                if not fields:
+                    continue
+                if not from_values:
+                    sql = (
+                        update(table)
+                        .where(table.c.id == bindparam("b_id"))
+                        .values({key: bindparam(f"b_{key}") for key in fields})
+                    )
+                    params = [{f"b_{key}": value for key, value in row.items()} for row in group]
+                    result = await self.session.execute(sql, params)
+                    total += result.rowcount
+                    continue
+                source = sa_values(*[column(key, table.c[key].type) for key in keys], name="v_bulk_update").data([
+                    tuple(row[key] for key in keys) for row in group
+                ])
+                sql = (
+                    update(self.model)
+                    .where(self.model.id == source.c.id)
+                    .values({key: source.c[key] for key in fields})
+                    .execution_options(synchronize_session=False)
+                )
+                result = await self.session.execute(sql)
+                total += result.rowcount
+        return total
+
     async def delete_datas(self, ids: list[int], *, v_soft: bool = False, **kwargs) -> str:
         """
         删除多条数据
@@ -336,8 +1377,20 @@ class ORMCrud(ABC, Generic[ORMModel]):
             result = await self.session.execute(delete(self.model).where(self.model.id.in_(ids)))
         if result.rowcount == 0:
             raise CustomException("未查询到需要删除的数据！", code=UtilsStatus.HTTP_404)
+        self.mark_cache_invalid(ids)
         return "删除成功"
 
+    def mark_cache_invalid(self, ids: Iterable[int]) -> None:
+        """
+        标记数据读缓存在当前会话提交后失效
+
+        通过 flush 写入的 ORM 对象会自动标记，使用 update/delete 语句写入时需要调用此方法
+
+        :param ids: 数据 ID 列表
+        :return:
+        """
+        self.data_cache.mark(self.session, self.model.__table__.name, ids)
+
     async def flush(self, obj: ORMModel = None) -> ORMModel | None:
         """
         刷新到数据库
@@ -347,9 +1400,33 @@ class ORMCrud(ABC, Generic[ORMModel]):
         """
         if obj:
             self.session.add(obj)
-        await self.session.flush()
+        with self.translate_integrity_error():
+            await self.session.flush()
         return obj
 
+    @contextmanager
+    def translate_integrity_error(self) -> Generator[None, None, None]:
+        """
+        将违反 unique_errors 中唯一索引的 IntegrityError 转换为 CustomException
+
+        依赖数据库唯一索引保证数据唯一，不需要在写入前额外查询验证，未配置的约束异常原样抛出
+
+        PostgreSQL 异常信息中包含唯一索引名称，SQLite 异常信息中只包含 "表名.字段名"，两种格式都可以匹配
+
+        :return:
+        """
+        try:
+            yield
+        except IntegrityError as exc:
+            message = str(exc.orig)
+            for index in self.model.__table__.indexes:
+                if not index.unique or index.name not in self.unique_errors:
+                    continue
+                columns = ", ".join(f"{index.table.name}.{column.name}" for column in index.columns)
+                if index.name in message or columns in message:
+                    raise CustomException(self.unique_errors[index.name]) from exc
+            raise
+
     async def filter_core(
         self,
         v_start_sql: SelectType = None,
@@ -378,7 +1455,20 @@ class ORMCrud(ABC, Generic[ORMModel]):
         :return: 返回过滤后的总数居 或 sql
         """  # noqa E501
         if not isinstance(v_start_sql, SelectType):
-            v_start_sql = select(self.model).where(self.model.is_delete == false())
+            # 未指定初始 sql 时使用查询语句缓存
+            sql, params = self.build_filter_sql(
+                v_select_from=v_select_from,
+                v_join=v_join,
+                v_outer_join=v_outer_join,
+                v_options=v_options,
+                v_where=v_where,
+                v_order=v_order,
+                v_order_field=v_order_field,
+                **kwargs,
+            )
+            if v_return_sql:
+                return sql.params(params) if params else sql
+            return await self.session.execute(sql, params)
 
         sql = self.add_relation(
             v_start_sql=v_start_sql,
@@ -392,20 +1482,126 @@ class ORMCrud(ABC, Generic[ORMModel]):
             sql = sql.where(*v_where)
 
         sql = self.add_filter_condition(sql, **kwargs)
+        sql = self.add_order(sql, v_order=v_order, v_order_field=v_order_field)
+
+        if v_return_sql:
+            return sql
+
+        queryset = await self.session.execute(sql)
+
+        return queryset
+
+    def build_filter_sql(
+        self,
+        *,
+        v_select: SelectShape | str = SelectShape.MODEL,
+        v_paging: bool = False,
+        v_select_from: list[Any] = None,
+        v_join: list[Any] = None,
+        v_outer_join: list[Any] = None,
+        v_options: list[_AbstractLoad] = None,
+        v_where: list[BinaryExpression] = None,
+        v_order: str = None,
+        v_order_field: str = None,
+        **kwargs,
+    ) -> tuple[SelectType, dict[str, Any]]:
+        """
+        构建过滤查询 sql，并使用查询语句缓存
+
+        关键词参数中的查询值全部使用绑定参数，查询字段、查询方式、关联、加载选项、排序相同的调用称为同一查询结构，
+        同一查询结构会复用缓存的 Select 对象，只需要传入新的参数值，
+        这样既省去了重新构建 sql 的开销，也省去了 SQLAlchemy 计算编译缓存键的开销（缓存键会记录在 Select 对象上）
+
+        使用 v_where 原始表达式，或关联中使用自定义连接条件时，查询结构无法缓存，每次都会重新构建
+
+        :param v_select: 查询内容，model：查询模型，count：查询总数，model_total：查询模型与窗口函数统计的总数
+        :param v_paging: 是否添加分页，添加后需要在参数中传入 v_offset 与 v_limit
+        :param v_select_from: 用于指定查询从哪个表开始，通常与 .join() 等方法一起使用。
+        :param v_join: 创建内连接（INNER JOIN）操作，返回两个表中满足连接条件的交集。
+        :param v_outer_join: 用于创建外连接（OUTER JOIN）操作，返回两个表中满足连接条件的并集，包括未匹配的行，并用 NULL 值填充。
+        :param v_options: 用于为查询添加附加选项，如预加载、延迟加载等。
+        :param v_where: 当前表查询条件，原始表达式
+        :param v_order: 排序，默认正序，为 desc 是倒叙
+        :param v_order_field: 排序字段
+        :param kwargs: 查询参数
+        :return: (sql, 绑定参数)，执行时使用：session.execute(sql, params)
+        """  # noqa E501
+        v_select = SelectShape(v_select)
+        items = self.__dict_filter_items(**kwargs)
+
+        params = {}
+        for field, _, values in items:
+            for index, value in enumerate(values):
+                params[f"kw_{field}_{index}"] = value
+
+        key = self.__statement_shape(
+            v_select, v_paging, v_select_from, v_join, v_outer_join, v_options, v_where, v_order, v_order_field, items
+        )
+        if key is not None:
+            sql = self.statement_cache.get(key)
+            if sql is not None:
+                return sql, params
+        else:
+            self.statement_cache.skip()
+
+        if v_select == SelectShape.COUNT:
+            sql = select(func.count(self.model.id))
+        elif v_select == SelectShape.MODEL_TOTAL:
+            sql = select(self.model, func.count().over().label("v_total")).where(self.model.is_delete == false())
+        else:
+            sql = select(self.model).where(self.model.is_delete == false())
 
+        sql = self.add_relation(
+            v_start_sql=sql,
+            v_select_from=v_select_from,
+            v_join=v_join,
+            v_outer_join=v_outer_join,
+            v_options=v_options,
+        )
+
+        if v_where:
+            sql = sql.where(*v_where)
+
+        conditions = []
+        for field, operator, values in items:
+            operands = [bindparam(f"kw_{field}_{index}", expanding=operator == "in") for index in range(len(values))]
+            conditions.append(self.__filter_condition(getattr(self.model, field), operator, operands))
+        if conditions:
+            sql = sql.where(*conditions)
+
+        sql = self.add_order(sql, v_order=v_order, v_order_field=v_order_field)
+
+        if v_paging:
+            sql = sql.offset(bindparam("v_offset", type_=Integer)).limit(bindparam("v_limit", type_=Integer))
+
+        if key is not None:
+            self.statement_cache.set(key, sql)
+        return sql, params
+
+    def add_order(self, sql: SelectType, *, v_order: str = None, v_order_field: str = None) -> SelectType:
+        """
+        添加排序
+
+        :param sql:
+        :param v_order: 排序，默认正序，为 desc 是倒叙
+        :param v_order_field: 排序字段
+        """
         if v_order_field and (v_order in self.order_fields):
             sql = sql.order_by(getattr(self.model, v_order_field).desc(), self.model.id.desc())
         elif v_order_field:
             sql = sql.order_by(getattr(self.model, v_order_field), self.model.id)
         elif v_order in self.order_fields:
             sql = sql.order_by(self.model.id.desc())
+        return sql
 
-        if v_return_sql:
-            return sql
-
-        queryset = await self.session.execute(sql)
+    @classmethod
+    def get_statement_cache_stats(cls) -> dict:
+        """
+        获取查询语句缓存命中统计
 
-        return queryset
+        :return:
+        """
+        return cls.statement_cache.stats()
 
     def add_relation(
         self,
@@ -471,43 +1667,128 @@ class ORMCrud(ABC, Generic[ORMModel]):
         :param model:
         :param kwargs:
         """
-        conditions = []
+        return [
+            self.__filter_condition(getattr(self.model, field), operator, values)
+            for field, operator, values in self.__dict_filter_items(**kwargs)
+        ]
+
+    def __dict_filter_items(self, **kwargs) -> list[tuple[str, str, tuple]]:
+        """
+        解析字典过滤参数
+
+        :param kwargs:
+        :return: [(字段名称, 查询方式, 查询值), ...]，查询值为最终传入 SQL 的值，例如 like 查询会拼接 %
+        """
+        items = []
         for field, value in kwargs.items():
             if value is not None and value != "":
-                attr = getattr(self.model, field)
                 if isinstance(value, tuple):
                     if len(value) == 1:
-                        if value[0] == "None":
-                            conditions.append(attr.is_(None))
-                        elif value[0] == "not None":
-                            conditions.append(attr.isnot(None))
+                        if value[0] == "None" or value[0] == "not None":
+                            items.append((field, value[0], ()))
                         else:
                             raise CustomException(f"{self}.__dict_filter SQL查询语法错误")
                     elif len(value) == 2 and value[1] not in [None, [], ""]:
-                        if value[0] == "date":
-                            # 根据日期查询， 关键函数是：func.time_format和func.date_format
-                            conditions.append(func.date_format(attr, "%Y-%m-%d") == value[1])
-                        elif value[0] == "like":
-                            conditions.append(attr.like(f"%{value[1]}%"))
-                        elif value[0] == "in":
-                            conditions.append(attr.in_(value[1]))
+                        if value[0] == "like":
+                            items.append((field, "like", (f"%{value[1]}%",)))
                         elif value[0] == "between" and len(value[1]) == 2:
-                            conditions.append(attr.between(value[1][0], value[1][1]))
-                        elif value[0] == "month":
-                            conditions.append(func.date_format(attr, "%Y-%m") == value[1])
-                        elif value[0] == "!=":
-                            conditions.append(attr != value[1])
-                        elif value[0] == ">":
-                            conditions.append(attr > value[1])
-                        elif value[0] == ">=":
-                            conditions.append(attr >= value[1])
-                        elif value[0] == "<=":
-                            conditions.append(attr <= value[1])
+                            items.append((field, "between", (value[1][0], value[1][1])))
+                        elif value[0] in ("date", "in", "month", "!=", ">", ">=", "<="):
+                            items.append((field, value[0], (value[1],)))
                         else:
                             raise CustomException(f"{self}.__dict_filter SQL查询语法错误")
                 else:
-                    conditions.append(attr == value)
-        return conditions
+                    items.append((field, "==", (value,)))
+        return items
+
+    @staticmethod
+    def __filter_condition(attr: Any, operator: str, values: Sequence[Any]) -> BinaryExpression:
+        """
+        生成字典过滤条件
+
+        :param attr: 模型字段
+        :param operator: 查询方式
+        :param values: 查询值，可以是字面值，也可以是绑定参数
+        """
+        if operator == "None":
+            return attr.is_(None)
+        elif operator == "not None":
+            return attr.isnot(None)
+        elif operator == "date":
+            # 根据日期查询， 关键函数是：func.time_format和func.date_format
+            return func.date_format(attr, "%Y-%m-%d") == values[0]
+        elif operator == "like":
+            return attr.like(values[0])
+        elif operator == "in":
+            return attr.in_(values[0])
+        elif operator == "between":
+            return attr.between(values[0], values[1])
+        elif operator == "month":
+            return func.date_format(attr, "%Y-%m") == values[0]
+        elif operator == "!=":
+            return attr != values[0]
+        elif operator == ">":
+            return attr > values[0]
+        elif operator == ">=":
+            return attr >= values[0]
+        elif operator == "<=":
+            return attr <= values[0]
+        return attr == values[0]
+
+    def __statement_shape(
+        self,
+        v_select: SelectShape,
+        v_paging: bool,
+        v_select_from: list[Any] | None,
+        v_join: list[Any] | None,
+        v_outer_join: list[Any] | None,
+        v_options: list[_AbstractLoad] | None,
+        v_where: list[BinaryExpression] | None,
+        v_order: str | None,
+        v_order_field: str | None,
+        items: list[tuple[str, str, tuple]],
+    ) -> tuple | None:
+        """
+        生成查询结构缓存键
+
+        :return: 查询结构无法缓存时返回 None
+        """
+        if v_where:
+            return None
+
+        def static(value: Any) -> bool:
+            return isinstance(value, str | type | QueryableAttribute | Table)
+
+        select_from = tuple(v_select_from or ())
+        if not all(static(table) for table in select_from):
+            return None
+
+        relations = []
+        for relation_list in (v_join, v_outer_join):
+            relation_list = tuple(tuple(relation) for relation in relation_list or ())
+            # 自定义连接条件为表达式，无法缓存
+            if not all(len(relation) == 1 and static(relation[0]) for relation in relation_list):
+                return None
+            relations.append(relation_list)
+
+        options = []
+        for option in v_options or ():
+            cache_key = option._generate_cache_key()
+            if cache_key is None or cache_key.bindparams:
+                return None
+            options.append(cache_key.key)
+
+        return (
+            self.model,
+            v_select,
+            v_paging,
+            select_from,
+            *relations,
+            tuple(options),
+            v_order in self.order_fields,
+            v_order_field,
+            tuple((field, operator, len(values)) for field, operator, values in items),
+        )
 
     def __str__(self):
         return self.__class__.__name__
@@ -67,3 +67,55 @@ class Paging(QueryParams):
         self.limit = limit
         self.v_order = v_order
         self.v_order_field = v_order_field
+
+
+class CursorQueryParams(QueryParams):
+    def __init__(self, params=None):
+        super().__init__()
+        if params:
+            self.cursor = params.cursor
+            self.limit = params.limit
+            self.v_order = params.v_order
+            self.v_order_field = params.v_order_field
+
+
+class CursorPaging(CursorQueryParams):
+    """
+    列表游标分页
+    """
+
+    def __init__(
+        self,
+        cursor: str = Query(None, description="分页游标，第一页不传，之后传入上一页返回的 next_cursor"),
+        limit: int = Query(10, description="每页多少条数据"),
+        v_order_field: str = Query(None, description="排序字段"),
+        v_order: str = Query(None, description="排序规则"),
+    ):
+        super().__init__()
+        self.cursor = cursor
+        self.limit = limit
+        self.v_order = v_order
+        self.v_order_field = v_order_field
+
+
+class ExportQueryParams(QueryParams):
+    def __init__(self, params=None):
+        super().__init__()
+        if params:
+            self.v_order = params.v_order
+            self.v_order_field = params.v_order_field
+
+
+class Exporting(ExportQueryParams):
+    """
+    数据导出
+    """
+
+    def __init__(
+        self,
+        v_order_field: str = Query(None, description="排序字段"),
+        v_order: str = Query(None, description="排序规则"),
+    ):
+        super().__init__()
+        self.v_order = v_order
+        self.v_order_field = v_order_field
@@ -7,13 +7,17 @@
 
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from kinit_fast_task.app.models.base.orm import AbstractORMModel
-from sqlalchemy import String
+from sqlalchemy import Index, String, text
 from kinit_fast_task.app.models.auth_user_to_role_model import auth_user_to_role_model
 
 
 class AuthRoleModel(AbstractORMModel):
     __tablename__ = "auth_role"
-    __table_args__ = {"comment": "角色表"}
+    __table_args__ = (
+        # 只对未软删除的数据要求唯一，软删除后可以重新使用
+        Index("uq_auth_role_role_key", "role_key", unique=True, postgresql_where=text("is_delete = false")),
+        {"comment": "角色表"},
+    )
 
     users: Mapped[set["AuthUserModel"]] = relationship(secondary=auth_user_to_role_model, back_populates="roles")
 
@@ -9,12 +9,17 @@ from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from kinit_fast_task.app.models.auth_user_to_role_model import auth_user_to_role_model
 from kinit_fast_task.app.models.base.orm import AbstractORMModel
-from sqlalchemy import String
+from sqlalchemy import Index, String, text
 
 
 class AuthUserModel(AbstractORMModel):
     __tablename__ = "auth_user"
-    __table_args__ = {"comment": "用户表"}
+    __table_args__ = (
+        # 只对未软删除的数据要求唯一，软删除后可以重新注册
+        Index("uq_auth_user_telephone", "telephone", unique=True, postgresql_where=text("is_delete = false")),
+        Index("uq_auth_user_email", "email", unique=True, postgresql_where=text("is_delete = false")),
+        {"comment": "用户表"},
+    )
 
     roles: Mapped[set["AuthRoleModel"]] = relationship(secondary=auth_user_to_role_model, back_populates="users")
 
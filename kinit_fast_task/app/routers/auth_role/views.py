@@ -79,17 +79,18 @@ async def delete(
 )
 async def list_query(
     params: PageParams = Depends(),
-    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_transaction_getter),
+    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_read_getter),
 ):
-    datas = await AuthRoleCRUD(session).get_datas(**params.dict(), v_return_type="dict")
-    total = await AuthRoleCRUD(session).get_count(**params.to_count())
+    datas, total = await AuthRoleCRUD(session).get_page(**params.dict(), v_return_type="dict", v_cache=True)
     return RestfulResponse.success(data=datas, total=total, page=params.page, limit=params.limit)
 
 
 @router.get("/one/query", summary="获取角色信息")
 async def one_query(
     data_id: int = Query(..., description="角色编号"),
-    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_transaction_getter),
+    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_read_getter),
 ):
-    data = await AuthRoleCRUD(session).get_data(data_id, v_schema=role_s.AuthRoleSimpleOutSchema, v_return_type="dict")
+    data = await AuthRoleCRUD(session).get_data(
+        data_id, v_schema=role_s.AuthRoleSimpleOutSchema, v_return_type="dict", v_cache=True
+    )
     return RestfulResponse.success(data=data)
@@ -5,7 +5,14 @@
 # @Desc           : 用户
 
 from fastapi import Depends
-from kinit_fast_task.app.depends.Paging import Paging, QueryParams
+from kinit_fast_task.app.depends.Paging import (
+    Paging,
+    QueryParams,
+    CursorPaging,
+    CursorQueryParams,
+    Exporting,
+    ExportQueryParams,
+)
 
 
 class PageParams(QueryParams):
@@ -13,3 +20,17 @@ class PageParams(QueryParams):
         super().__init__(params)
 
         self.v_order = "desc"
+
+
+class CursorPageParams(CursorQueryParams):
+    def __init__(self, params: CursorPaging = Depends()):
+        super().__init__(params)
+
+        self.v_order = "desc"
+
+
+class ExportParams(ExportQueryParams):
+    def __init__(self, params: Exporting = Depends()):
+        super().__init__(params)
+
+        self.v_order = "desc"
@@ -14,6 +14,7 @@ from kinit_fast_task.app.models.auth_role_model import AuthRoleModel
 from kinit_fast_task.db import DBFactory
 from kinit_fast_task.app.cruds.auth_user_crud import AuthUserCRUD
 from kinit_fast_task.app.schemas import auth_user_schema as user_s
+from kinit_fast_task.utils.cache import memoize
 
 
 class UserService:
@@ -24,10 +25,13 @@ class UserService:
     def __init__(self, session: AsyncSession = None):
         self.session = session
 
+    @memoize(ttl=60, key=lambda self: "recent_users_count")
     async def get_recent_users_count(self):
         """
         获取最近一个月的用户新增情况
 
+        统计结果按天汇总，允许短时间延迟，使用进程内缓存 60 秒，缓存期间不会查询数据库
+
         :return:
         """
         one_month_ago = datetime.datetime.now() - datetime.timedelta(days=30)
@@ -9,11 +9,12 @@ from fastapi import APIRouter, Depends, Body, Query
 from sqlalchemy.orm import selectinload
 
 from kinit_fast_task.db import DBFactory
-from kinit_fast_task.utils.response import RestfulResponse, ResponseSchema, PageResponseSchema
+from kinit_fast_task.utils.response import RestfulResponse, ResponseSchema, PageResponseSchema, CursorPageResponseSchema
+from kinit_fast_task.utils.export import StreamExport, ExportFormat
 from kinit_fast_task.app.cruds.auth_user_crud import AuthUserCRUD
 from kinit_fast_task.app.schemas import auth_user_schema as user_s, DeleteSchema
 from kinit_fast_task.app.models.auth_user_model import AuthUserModel
-from .params import PageParams
+from .params import PageParams, CursorPageParams, ExportParams
 from .services import UserService
 
 router = APIRouter(prefix="/auth/user", tags=["用户管理"])
@@ -41,6 +42,31 @@ async def create(
     return RestfulResponse.success(await AuthUserCRUD(session).create_data(data=data))
 
 
+@router.post("/batch/create", response_model=ResponseSchema[str], summary="批量创建用户")
+async def batch_create(
+    datas: list[user_s.AuthUserCreateSchema],
+    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_transaction_getter),
+):
+    """
+    示例数据：
+
+        [
+            {
+              "name": "kinit",
+              "telephone": "18820240528",
+              "email": "user@email.com",
+              "is_active": true,
+              "age": 3,
+              "role_ids": [
+                1, 2
+              ]
+            },
+            ...
+        ]
+    """
+    return RestfulResponse.success(await AuthUserCRUD(session).create_datas(datas))
+
+
 @router.post("/update", response_model=ResponseSchema[str], summary="更新用户")
 async def update(
     data_id: int = Body(..., description="用户编号"),
@@ -62,32 +88,71 @@ async def delete(
 @router.get("/list/query", response_model=PageResponseSchema[list[user_s.AuthUserOutSchema]], summary="获取用户列表")
 async def list_query(
     params: PageParams = Depends(),
-    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_transaction_getter),
+    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_read_getter),
 ):
     v_options = [selectinload(AuthUserModel.roles)]
     v_schema = user_s.AuthUserOutSchema
-    datas = await AuthUserCRUD(session).get_datas(
+    datas, total = await AuthUserCRUD(session).get_page(
         **params.dict(), v_options=v_options, v_return_type="dict", v_schema=v_schema
     )
-    total = await AuthUserCRUD(session).get_count(**params.to_count())
     return RestfulResponse.success(data=datas, total=total, page=params.page, limit=params.limit)
 
 
+@router.get(
+    "/list/cursor/query",
+    response_model=CursorPageResponseSchema[list[user_s.AuthUserOutSchema]],
+    summary="获取用户列表（游标分页）",
+)
+async def list_cursor_query(
+    params: CursorPageParams = Depends(),
+    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_read_getter),
+):
+    """
+    游标分页不返回总数，翻页时传入上一页返回的 next_cursor，深度翻页与第一页的查询代价相同
+    """
+    v_options = [selectinload(AuthUserModel.roles)]
+    v_schema = user_s.AuthUserOutSchema
+    datas, next_cursor = await AuthUserCRUD(session).get_cursor_datas(
+        **params.dict(), v_options=v_options, v_return_type="dict", v_schema=v_schema
+    )
+    return RestfulResponse.success(data=datas, next_cursor=next_cursor, limit=params.limit)
+
+
+@router.get("/export", summary="导出用户列表")
+async def export(
+    params: ExportParams = Depends(),
+    export_format: ExportFormat = Query(ExportFormat.CSV, description="导出文件格式"),
+):
+    """
+    使用服务端游标分批读取数据，边读取边输出文件，内存占用与数据总量无关
+
+    开始输出响应时依赖项已经退出，所以在生成器内单独获取数据库会话，导出完成后关闭
+    """
+
+    async def datas():
+        async with DBFactory.get_instance("orm").db_getter() as session:
+            async for data in AuthUserCRUD(session).stream_datas(**params.dict(), v_return_type="dict"):
+                yield data
+
+    export_obj = StreamExport(user_s.AuthUserSimpleOutSchema, filename="用户列表", export_format=export_format)
+    return export_obj.response(datas())
+
+
 @router.get("/one/query", response_model=PageResponseSchema[user_s.AuthUserOutSchema], summary="获取用户信息")
 async def one_query(
     data_id: int = Query(..., description="用户编号"),
-    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_transaction_getter),
+    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_read_getter),
 ):
     v_options = [selectinload(AuthUserModel.roles)]
     data = await AuthUserCRUD(session).get_data(
-        data_id, v_schema=user_s.AuthUserOutSchema, v_options=v_options, v_return_type="dict"
+        data_id, v_schema=user_s.AuthUserOutSchema, v_options=v_options, v_return_type="dict", v_cache=True
     )
     return RestfulResponse.success(data=data)
 
 
 @router.get("/recent/month/user/query", response_model=PageResponseSchema[dict], summary="获取最近一个月的用户新增情况")
 async def recent_month_user_query(
-    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_transaction_getter),
+    session: AsyncSession = Depends(DBFactory.get_instance("orm").db_read_getter),
 ):
     return RestfulResponse.success(data=await UserService(session).get_recent_users_count())
 
@@ -0,0 +1,5 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/20 15:02
+# @File           : __init__.py
+# @IDE            : PyCharm
+# @Desc           : 文件描述信息
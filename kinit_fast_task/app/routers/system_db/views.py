@@ -0,0 +1,61 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/20 15:02
+# @File           : views.py
+# @IDE            : PyCharm
+# @Desc           : 路由，视图文件
+
+from fastapi import APIRouter
+
+from kinit_fast_task.app.cruds.base.orm import ORMCrud
+from kinit_fast_task.db import DBFactory
+from kinit_fast_task.utils.cache import AsyncCache
+from kinit_fast_task.utils.response import RestfulResponse, ResponseSchema
+from kinit_fast_task.utils.user_agent import user_agent_cache
+
+router = APIRouter(prefix="/system/db", tags=["系统数据库管理"])
+
+
+@router.get("/pool", response_model=ResponseSchema[dict], summary="获取 ORM 数据库连接池状态")
+async def pool_status():
+    """
+    返回主库与只读副本的连接池状态与运行指标，用于根据实际测量数据调整 DBSettings 中的连接池配置：
+
+    - checkout_wait_*：获取连接的等待时间，持续偏高说明连接池偏小
+    - connect_time_* 与 connects：新建连接的耗时与次数，次数持续增长说明连接被频繁回收或溢出连接被频繁创建
+    - hold_time_*：连接被占用的时间，连接池大小约等于 每秒获取连接次数 * 平均占用时间
+    - overflow_checkouts 与 overflow_peak：使用溢出连接的次数与峰值
+    """
+    return RestfulResponse.success(data=DBFactory.get_instance("orm").get_pool_status())
+
+
+@router.get("/redis/pool", response_model=ResponseSchema[dict], summary="获取 Redis 连接池状态")
+async def redis_pool_status():
+    """
+    返回 Redis 连接池状态与自动批量发送统计：
+
+    - in_use_connections 持续接近 max_connections 说明连接池偏小，请调整 DBSettings.REDIS_MAX_CONNECTIONS
+    - auto_pipeline.commands_per_batch：每次 Redis 往返平均发送的命令数量
+    """
+    return RestfulResponse.success(data=DBFactory.get_instance("redis").get_pool_status())
+
+
+@router.get("/cache", response_model=ResponseSchema[dict], summary="获取缓存命中统计")
+async def cache_stats():
+    """
+    返回当前进程的查询缓存命中统计：
+
+    - statement：查询语句构建缓存，见 StatementCache
+    - data：单条数据读缓存的进程内缓存，见 ORMDataCache
+    - query：列表查询与统计总数缓存，按 表名.查询类型 分别统计，见 ORMQueryCache
+    - memoize：memoize 装饰器与其他已命名的 AsyncCache，按缓存名称分别统计
+    - user_agent：操作记录 User-Agent 解析结果缓存，见 parse_user_agent
+    """
+    return RestfulResponse.success(
+        data={
+            "statement": ORMCrud.get_statement_cache_stats(),
+            "data": ORMCrud.data_cache.local.stats(),
+            "query": ORMCrud.get_query_cache_stats(),
+            "memoize": AsyncCache.all_stats(),
+            "user_agent": user_agent_cache.stats(),
+        }
+    )
@@ -5,7 +5,9 @@
 # @Desc           : 全局事件
 
 from fastapi import FastAPI
+from kinit_fast_task.config import settings
 from kinit_fast_task.db import DBFactory
+from kinit_fast_task.core.middleware import operation_record_writer
 
 from kinit_fast_task.utils import log
 
@@ -22,3 +24,19 @@ async def close_db_event(app: FastAPI, status: bool):
     else:
         await DBFactory.clear()
         log.info("关闭项目事件成功执行！")
+
+
+async def operation_record_writer_event(app: FastAPI, status: bool):
+    """
+    操作日志后台批量写入事件
+    开始时启动后台写入任务并重新写入上次遗留的溢出文件，关闭时写入队列中剩余的操作记录
+    :param app:
+    :param status: 用于判断是开始还是结束事件，为 True 说明是开始事件，反着关闭事件
+    :return:
+    """
+    if not settings.db.MONGO_DB_ENABLE:
+        return
+    if status:
+        operation_record_writer.start()
+    else:
+        await operation_record_writer.close()
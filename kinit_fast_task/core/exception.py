@@ -27,6 +27,7 @@ class CustomException(Exception):
         code: int = UtilsStatus.HTTP_ERROR,
         status_code: int = fastapi_status.HTTP_200_OK,
         desc: str = None,
+        headers: dict[str, str] = None,
     ):
         """
         自定义异常
@@ -34,6 +35,7 @@ class CustomException(Exception):
         :param code: 描述 code
         :param status_code: 响应 code
         :param desc: 描述信息，不返回给前端，只在接口日志中输出
+        :param headers: 响应头，例如限流时的 Retry-After
         """
         self.message = message
         self.status_code = status_code
@@ -42,6 +44,7 @@ class CustomException(Exception):
         else:
             self.code = code
         self.desc = desc
+        self.headers = headers
 
 
 def refactoring_exception(app: FastAPI):
@@ -59,6 +62,7 @@ def refactoring_exception(app: FastAPI):
         return JSONResponse(
             status_code=exc.status_code,
             content={"message": exc.message, "code": exc.code},
+            headers=exc.headers,
         )
 
     @app.exception_handler(StarletteHTTPException)
@@ -0,0 +1,172 @@
+# @Version        : 1.0
+# @Create Time    : 2024/12/03 15:16
+# @File           : log_policy.py
+# @IDE            : PyCharm
+# @Desc           : 请求日志与操作日志路由策略
+
+"""
+将 SystemSettings.REQUEST_LOG_POLICIES 与 OPERATION_LOG_POLICIES 中的路由策略编译为查找表：
+
+    policies：(请求方式, 接口路径) -> 策略，启动时为每个接口的每个请求方式解析一次策略，请求中只需要一次字典查找
+    static_routes：(请求方式, 请求路径) -> 接口，没有路径参数的接口在请求进入路由之前也可以通过一次字典查找匹配，
+        有路径参数的接口按路由顺序逐个匹配，与路由的匹配结果相同
+
+中间件在构建中间件栈时创建查找表，Starlette 在收到第一个 ASGI 消息（lifespan 启动事件）时构建中间件栈，
+此时所有路由都已注册
+"""
+
+import random
+from fnmatch import fnmatchcase
+
+from fastapi.routing import APIRoute
+from starlette.routing import Match, Router
+from starlette.types import Scope
+
+from kinit_fast_task.config import LogPolicy
+
+
+class LogPolicyTable:
+    """
+    路由策略查找表
+    """
+
+    def __init__(self, router: Router, policies: dict[str, LogPolicy]):
+        """
+        :param router: 应用路由
+        :param policies: 路由策略配置，格式见 SystemSettings.REQUEST_LOG_POLICIES
+        """
+        self.router = router
+        self.rules = policies
+        self.default = policies.get("*", LogPolicy())
+        self.policies: dict[tuple[str, str], LogPolicy] = {}
+        self.static_routes: dict[tuple[str, str], APIRoute] = {}
+        self.compile()
+
+    def compile(self) -> None:
+        """
+        编译查找表
+
+        :return:
+        """
+        for route in self.router.routes:
+            if not isinstance(route, APIRoute):
+                continue
+            for method in route.methods:
+                self.policies[(method, route.path)] = self.resolve(method, route.path)
+                if route.param_convertors or (method, route.path) in self.static_routes:
+                    continue
+                # 前面注册的有路径参数的接口也可能匹配该路径，所以按路由顺序确认实际匹配的接口
+                matched = self.match_routes({
+                    "type": "http",
+                    "method": method,
+                    "path": route.path,
+                    "root_path": "",
+                    "headers": [],
+                })
+                if matched is not None:
+                    self.static_routes[(method, route.path)] = matched
+
+    def resolve(self, method: str, path: str) -> LogPolicy:
+        """
+        获取接口对应的策略
+
+        优先级：指定请求方式的路径 > 路径 > 通配符，通配符越长越优先，同一类中指定请求方式的优先
+
+        :param method: 请求方式
+        :param path: 接口路径
+        :return:
+        """
+        best, best_priority = self.default, None
+        for key, policy in self.rules.items():
+            if key == "*":
+                continue
+            rule_method, _, pattern = key.rpartition(" ")
+            if rule_method and rule_method.upper() != method:
+                continue
+            exact = "*" not in pattern
+            if (exact and pattern != path) or (not exact and not fnmatchcase(path, pattern)):
+                continue
+            priority = (exact, bool(rule_method), len(pattern))
+            if best_priority is None or priority > best_priority:
+                best, best_priority = policy, priority
+        return best
+
+    def match_routes(self, scope: Scope) -> APIRoute | None:
+        """
+        按路由顺序匹配接口
+
+        :param scope:
+        :return: 未匹配到接口时返回 None
+        """
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route if isinstance(route, APIRoute) else None
+        return None
+
+    def match(self, scope: Scope) -> APIRoute | None:
+        """
+        在请求进入路由之前匹配接口
+
+        :param scope:
+        :return: 未匹配到接口时返回 None
+        """
+        route = self.static_routes.get((scope["method"], route_path(scope)))
+        if route is not None:
+            return route
+        return self.match_routes(scope)
+
+    def get(self, method: str, route: APIRoute | None) -> LogPolicy:
+        """
+        获取接口对应的策略
+
+        :param method: 请求方式
+        :param route: 接口，未匹配到接口时使用默认策略
+        :return:
+        """
+        if route is None:
+            return self.default
+        return self.policies.get((method, route.path), self.default)
+
+
+def route_path(scope: Scope) -> str:
+    """
+    获取用于匹配路由的请求路径，即去掉 root_path 前缀后的路径，与 Starlette 路由匹配时使用的路径相同
+
+    :param scope:
+    :return:
+    """
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if not root_path or not path.startswith(root_path):
+        return path
+    if path == root_path:
+        return ""
+    if path[len(root_path)] == "/":
+        return path[len(root_path) :]
+    return path
+
+
+def sample(policy: LogPolicy) -> bool:
+    """
+    按策略采样
+
+    :param policy:
+    :return: 是否采样命中
+    """
+    return policy.sample_rate >= 1 or random.random() < policy.sample_rate
+
+
+def should_record(policy: LogPolicy, sampled: bool, status_code: int, process_time: float) -> bool:
+    """
+    判断是否需要记录
+
+    :param policy:
+    :param sampled: 是否采样命中
+    :param status_code: HTTP 响应状态码
+    :param process_time: 请求耗时（秒）
+    :return:
+    """
+    if sampled or (policy.log_on_error and status_code >= 400):
+        return True
+    return policy.slow_seconds is not None and process_time >= policy.slow_seconds
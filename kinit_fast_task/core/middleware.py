@@ -7,127 +7,418 @@
 """
 官方文档——中间件：https://fastapi.tiangolo.com/tutorial/middleware/
 官方文档——高级中间件：https://fastapi.tiangolo.com/advanced/middleware/
+官方文档——纯 ASGI 中间件：https://www.starlette.io/middleware/#pure-asgi-middleware
 
 经测试：中间件中报错，或使用 raise 无论哪种类型的 Exception，都会被全局异常捕获，无法被特定异常捕获
 所以最好是改变返回的 response
+
+中间件都实现为纯 ASGI 中间件，不使用 @app.middleware("http")（BaseHTTPMiddleware）：
+    BaseHTTPMiddleware 每一层都会创建任务组并将响应体包装为流，中间件越多请求耗时越长，并且会影响流式响应
+    纯 ASGI 中间件只包装 send，从 http.response.start 消息中获取状态码与响应头，
+    从 http.response.body 消息中累计响应体长度，不会缓存响应体，流式响应的每个分块都会立即发送
+
+性能基准测试：python -m kinit_fast_task.scripts.benchmark.middleware
 """
 
 import datetime
 import json
+import math
 import time
+from http.cookies import SimpleCookie
 
-from fastapi import Request
+from fastapi import FastAPI, Request
+from pymongo.errors import BulkWriteError
+from starlette.datastructures import URL, Headers, MutableHeaders, QueryParams
+from starlette.routing import Router
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from kinit_fast_task.utils import log
-from fastapi import FastAPI
-from fastapi.routing import APIRoute
-from user_agents import parse
 from kinit_fast_task.config import settings
+from kinit_fast_task.core.log_policy import LogPolicyTable, sample, should_record
 from kinit_fast_task.app.cruds.record_operation_crud import OperationCURD
 from kinit_fast_task.utils.response import RestfulResponse
 from kinit_fast_task.utils.response_code import Status
+from kinit_fast_task.db.orm.asyncio import read_your_writes_state
+from kinit_fast_task.utils.rate_limit import create_rate_limiter, rate_limit_key
+from kinit_fast_task.utils.batch_writer import BatchWriter
+from kinit_fast_task.utils.user_agent import parse_user_agent
 
 
-def register_request_log_middleware(app: FastAPI):
+class RequestLogMiddleware:
     """
     记录请求日志中间件
-    :param app:
-    :return:
+
+    X-Process-Time 为收到请求到开始发送响应的耗时，响应体全部发送完成后记录日志，响应体长度为实际发送的字节数
+    是否记录由 SystemSettings.REQUEST_LOG_POLICIES 中接口对应的策略决定，慢请求耗时为响应体全部发送完成的耗时
     """
 
-    @app.middleware("http")
-    async def request_log_middleware(request: Request, call_next):
+    def __init__(self, app: ASGIApp, router: Router):
+        """
+        :param app:
+        :param router: 应用路由，用于编译路由策略查找表
+        """
+        self.app = app
+        self.policy_table = LogPolicyTable(router, settings.system.REQUEST_LOG_POLICIES)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         start_time = time.time()
-        response = await call_next(request)
-        process_time = f"{int((time.time() - start_time) * 1000)}ms"
-        response.headers["X-Process-Time"] = str(process_time)
-        http_version = f"http/{request.scope['http_version']}"
-        content_length = response.raw_headers[0][1]
-        process_time = response.headers["X-Process-Time"]
-        content = (
-            f"request router: '{request.method} {request.url} {http_version}' {response.status_code} "
-            f"{response.charset} {content_length} {process_time}"
-        )
-        if response.status_code != 200:
+        status_code = 0
+        charset = None
+        content_length = 0
+        process_time = ""
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, charset, content_length, process_time
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = f"{int((time.time() - start_time) * 1000)}ms"
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Process-Time", process_time)
+                content_type = headers.get("content-type", "")
+                if "charset=" in content_type:
+                    charset = content_type.split("charset=", 1)[1].split(";", 1)[0].strip()
+            elif message["type"] == "http.response.body":
+                content_length += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    content = (
+                        f"request router: '{scope['method']} {URL(scope=scope)} http/{scope['http_version']}' "
+                        f"{status_code} {charset} {content_length} {process_time}"
+                    )
+                    self.write_log(scope, content, status_code, time.time() - start_time)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def write_log(self, scope: Scope, content: str, status_code: int, elapsed: float) -> None:
+        """
+        按路由策略记录请求日志
+
+        :param scope:
+        :param content: 日志内容
+        :param status_code: HTTP 响应状态码
+        :param elapsed: 请求耗时（秒）
+        :return:
+        """
+        # 路由匹配后 scope 中会包含 route
+        policy = self.policy_table.get(scope["method"], scope.get("route"))
+        if not should_record(policy, sample(policy), status_code, elapsed):
+            return
+        if status_code != 200:
             log.error(content)
+        elif policy.slow_seconds is not None and elapsed >= policy.slow_seconds:
+            log.warning(f"{content} slow")
         else:
             log.info(content)
-        return response
 
 
-def register_operation_record_middleware(app: FastAPI):
+def register_request_log_middleware(app: FastAPI):
     """
-    操作记录中间件
-    用于将使用认证的操作全部记录到 mongodb 数据库中
+    记录请求日志中间件
     :param app:
     :return:
     """
+    app.add_middleware(RequestLogMiddleware, router=app.router)
+
+
+async def insert_operation_records(records: list[dict]) -> None:
+    """
+    批量写入操作记录
+
+    请求中只保存 User-Agent 请求头，在写入前解析客户端系统与浏览器，解析耗时不会增加请求耗时
+    ordered=False 时单条记录写入失败不影响其他记录，
+    溢出文件重新写入时，上次已经写入成功的记录会因 _id 重复写入失败，可以直接忽略
+
+    :param records:
+    :return:
+    """
+    for record in records:
+        if "user_agent" in record:
+            record["system"], record["browser"] = parse_user_agent(record.pop("user_agent"))
+    try:
+        await OperationCURD().collection.insert_many(records, ordered=False)
+    except BulkWriteError as e:
+        errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+        if errors:
+            log.error(f"操作记录批量写入：{len(errors)} 条记录写入失败，第一条错误信息：{errors[0].get('errmsg')}")
+
+
+operation_record_writer = BatchWriter(
+    "operation_record",
+    insert_operation_records,
+    max_size=settings.system.OPERATION_RECORD_QUEUE_SIZE,
+    batch_size=settings.system.OPERATION_RECORD_BATCH_SIZE,
+    flush_interval=settings.system.OPERATION_RECORD_FLUSH_INTERVAL,
+    overflow=settings.system.OPERATION_RECORD_OVERFLOW,
+    put_timeout=settings.system.OPERATION_RECORD_PUT_TIMEOUT,
+    spill_path=settings.system.OPERATION_RECORD_SPILL_PATH,
+)
+
+
+class OperationRecordMiddleware:
+    """
+    操作记录中间件
+
+    用于将使用认证的操作全部记录到 mongodb 数据库中
+    操作记录放入 operation_record_writer 队列后立即返回，由后台任务批量写入，请求耗时不受 MongoDB 影响
+
+    在读取请求体之前先根据请求方式、路由与 SystemSettings.OPERATION_LOG_POLICIES 中的策略判断是否可能需要记录，
+    不需要记录的请求直接交给后续中间件与接口处理
+    需要记录的请求不会提前读取请求体，而是在接口读取请求体时复制前 OPERATION_RECORD_BODY_MAX_SIZE 个字节，
+    大请求体不会在内存中多保存一份
+    """
+
+    def __init__(self, app: ASGIApp, router: Router):
+        """
+        :param app:
+        :param router: 应用路由，用于在请求进入路由之前匹配接口与编译路由策略查找表
+        """
+        self.app = app
+        self.policy_table = LogPolicyTable(router, settings.system.OPERATION_LOG_POLICIES)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    @app.middleware("http")
-    async def operation_record_middleware(request: Request, call_next):
         if not settings.db.MONGO_DB_ENABLE:
             log.error("未开启 MongoDB 数据库，无法存入操作记录，请在 config.py:OPERATION_LOG_RECORD 中关闭操作记录")
-            return RestfulResponse.error("系统异常，请联系管理员", code=Status.HTTP_500)
+            response = RestfulResponse.error("系统异常，请联系管理员", code=Status.HTTP_500)
+            await response(scope, receive, send)
+            return
+
+        if scope["method"] not in settings.system.OPERATION_RECORD_METHOD:
+            await self.app(scope, receive, send)
+            return
+        route = self.policy_table.match(scope)
+        if route is None or route.path in settings.system.IGNORE_OPERATION_ROUTER:
+            await self.app(scope, receive, send)
+            return
+        policy = self.policy_table.get(scope["method"], route)
+        sampled = sample(policy)
+        # 未采样命中时，只有报错或慢请求才可能需要记录
+        if not sampled and not policy.log_on_error and policy.slow_seconds is None:
+            await self.app(scope, receive, send)
+            return
 
         start_time = time.time()
+        request_headers = Headers(scope=scope)
         # multipart/form-data 类型数据不保存
-        if request.headers.get("content-type") and "multipart/form-data" in request.headers.get("content-type"):
-            body_params = ""
-        else:
-            body_params = (await request.body()).decode("utf-8", errors="ignore")
-        response = await call_next(request)
-        route = request.scope.get("route")
-        if (
-            request.method not in settings.system.OPERATION_RECORD_METHOD
-            or route.path in settings.system.IGNORE_OPERATION_ROUTER
-        ):
-            return response
+        capture_body = policy.capture_payload and "multipart/form-data" not in request_headers.get("content-type", "")
+        body_max_size = settings.system.OPERATION_RECORD_BODY_MAX_SIZE
+        body = bytearray()
+        body_size = 0
+
+        async def receive_wrapper() -> Message:
+            nonlocal body_size
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                body_size += len(chunk)
+                if capture_body and len(body) < body_max_size:
+                    body.extend(chunk[: body_max_size - len(body)])
+            return message
+
+        status_code = 0
+        content_length = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, content_length
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                content_length += len(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive_wrapper, send_wrapper)
+
         process_time = time.time() - start_time
-        user_agent = parse(request.headers.get("user-agent"))
-        system = f"{user_agent.os.family} {user_agent.os.version_string}"
-        browser = f"{user_agent.browser.family} {user_agent.browser.version_string}"
-        query_params = dict(request.query_params.multi_items())
-        path_params = request.path_params
-        params = {
-            "body_params": body_params,
-            "query_params": query_params if query_params else None,
-            "path_params": path_params if path_params else None,
-        }
-        content_length = response.raw_headers[0][1]
-        assert isinstance(route, APIRoute)
+        if not should_record(policy, sampled, status_code, process_time):
+            return
+        now = datetime.datetime.now()
+        request_api = URL(scope=scope)
+        params = None
+        if policy.capture_payload:
+            query_params = dict(QueryParams(scope["query_string"]).multi_items())
+            # 路由匹配后 scope 中会包含 path_params
+            path_params = scope.get("path_params")
+            params = {
+                # 超出最大字节数时截断，截断位置的不完整字符会被忽略
+                "body_params": body.decode("utf-8", errors="ignore") if capture_body else "",
+                "body_truncated": capture_body and body_size > len(body),
+                "query_params": query_params if query_params else None,
+                "path_params": path_params if path_params else None,
+            }
+        else:
+            # 不保存请求参数时，请求地址中也不保存查询参数
+            request_api = request_api.replace(query="")
+        client = scope.get("client")
         document = {
             "process_time": process_time,
-            "request_api": request.url.__str__(),
-            "client_ip": request.client.host,
-            "system": system,
-            "browser": browser,
-            "request_method": request.method,
+            "request_api": str(request_api),
+            "client_ip": client[0] if client else None,
+            # 写入前由 insert_operation_records 解析为 system 与 browser
+            "user_agent": request_headers.get("user-agent"),
+            "request_method": scope["method"],
             "api_path": route.path,
             "summary": route.summary,
             "description": route.description,
             "tags": route.tags,
             "route_name": route.name,
-            "status_code": response.status_code,
+            "status_code": status_code,
             "content_length": content_length,
-            "create_datetime": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "params": json.dumps(params),
+            "params": json.dumps(params) if params is not None else None,
+            "create_datetime": now,
+            "update_datetime": now,
         }
-        await OperationCURD().create_data(document)
-        return response
+        await operation_record_writer.put(document)
+
+
+def register_operation_record_middleware(app: FastAPI):
+    """
+    操作记录中间件
+    用于将使用认证的操作全部记录到 mongodb 数据库中
+    :param app:
+    :return:
+    """
+    app.add_middleware(OperationRecordMiddleware, router=app.router)
+
+
+class DemoEnvMiddleware:
+    """
+    演示环境中间件
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and settings.demo.DEMO_ENV and scope["method"] != "GET":
+            path = scope["path"]
+            if path in settings.demo.DEMO_BLACK_LIST_PATH or path not in settings.demo.DEMO_WHITE_LIST_PATH:
+                response = RestfulResponse.error("演示环境，禁止操作")
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
 
 
 def register_demo_env_middleware(app: FastAPI):
     """
     演示环境中间件
     """
+    app.add_middleware(DemoEnvMiddleware)
+
+
+class ReadYourWritesMiddleware:
+    """
+    写后读一致中间件
+
+    客户端写入后通过 Cookie 记录写后读一致窗口的结束时间，窗口内该客户端的读取都使用主库，多个进程之间也能保持一致
+    """
+
+    cookie_name = "orm_read_primary_until"
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cookie = SimpleCookie(Headers(scope=scope).get("cookie", ""))
+        try:
+            until = float(cookie[self.cookie_name].value) if self.cookie_name in cookie else 0
+        except ValueError:
+            until = 0
+        state = {"until": until, "wrote": False}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and state["wrote"]:
+                max_age = int(settings.db.ORM_READ_YOUR_WRITES_SECONDS) + 1
+                MutableHeaders(scope=message).append("set-cookie", self.set_cookie(str(state["until"]), max_age))
+            await send(message)
+
+        token = read_your_writes_state.set(state)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            read_your_writes_state.reset(token)
+
+    def set_cookie(self, value: str, max_age: int) -> str:
+        """
+        生成 Set-Cookie 响应头，与 Response.set_cookie 默认参数相同
+
+        :param value:
+        :param max_age:
+        :return:
+        """
+        cookie = SimpleCookie()
+        cookie[self.cookie_name] = value
+        cookie[self.cookie_name]["max-age"] = max_age
+        cookie[self.cookie_name]["path"] = "/"
+        cookie[self.cookie_name]["httponly"] = True
+        cookie[self.cookie_name]["samesite"] = "lax"
+        return cookie.output(header="").strip()
+
+
+def register_read_your_writes_middleware(app: FastAPI):
+    """
+    写后读一致中间件
+    :param app:
+    :return:
+    """
+    app.add_middleware(ReadYourWritesMiddleware)
+
+
+class RateLimitMiddleware:
+    """
+    全局限流中间件
+
+    在路由之前按客户端 IP 或请求路径限流，被限流时直接返回 429，不会执行后续中间件与接口
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.limiter = create_rate_limiter(
+            settings.system.RATE_LIMIT_STRATEGY,
+            limit=settings.system.RATE_LIMIT_REQUESTS,
+            window=settings.system.RATE_LIMIT_WINDOW,
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        result = await self.limiter.hit(rate_limit_key(Request(scope), settings.system.RATE_LIMIT_KEY))
+        if not result.allowed:
+            response = RestfulResponse.error(
+                "请求过于频繁，请稍后再试", code=Status.HTTP_429, status_code=Status.HTTP_429
+            )
+            response.headers["Retry-After"] = str(math.ceil(result.retry_after))
+            await response(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-RateLimit-Limit", str(self.limiter.limit))
+                headers.append("X-RateLimit-Remaining", str(result.remaining))
+            await send(message)
 
-    @app.middleware("http")
-    async def demo_env_middleware(request: Request, call_next):
-        path = request.scope.get("path")
-        # if request.method != "GET":
-        #     print("路由：", path, request.method)
-        if settings.demo.DEMO_ENV and request.method != "GET":
-            if path in settings.demo.DEMO_BLACK_LIST_PATH:
-                return RestfulResponse.error("演示环境，禁止操作")
-            elif path not in settings.demo.DEMO_WHITE_LIST_PATH:
-                return RestfulResponse.error("演示环境，禁止操作")
-        return await call_next(request)
+        await self.app(scope, receive, send_wrapper)
+
+
+def register_rate_limit_middleware(app: FastAPI):
+    """
+    全局限流中间件
+    :param app:
+    :return:
+    """
+    if not settings.db.REDIS_DB_ENABLE:
+        log.error("未开启 Redis 数据库，无法使用全局限流，请在 config.py:RATE_LIMIT_ENABLE 中关闭全局限流")
+        return
+    app.add_middleware(RateLimitMiddleware)
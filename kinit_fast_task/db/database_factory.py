@@ -20,7 +20,7 @@ class DBFactory(metaclass=Singleton):
 
     Methods
     -------
-    get_instance(db_type, loader_name='default', db_url=None)
+    get_instance(db_type, loader_name='default', db_url=None, **kwargs)
         获取指定类型和加载器名称的数据库实例，如果实例不存在则创建并加载到配置加载器
 
     register(loader_name, loader)
@@ -37,7 +37,12 @@ class DBFactory(metaclass=Singleton):
 
     @classmethod
     def get_instance(
-        cls, loader_type: Literal["orm", "mongo", "redis"], *, loader_name: str = "default", db_url: str = None
+        cls,
+        loader_type: Literal["orm", "mongo", "redis"],
+        *,
+        loader_name: str = "default",
+        db_url: str = None,
+        **kwargs,
     ) -> AsyncAbstractDatabase:
         """
         获取指定类型和加载器名称的数据库实例，如果实例不存在则创建并加载到配置加载器
@@ -45,6 +50,7 @@ class DBFactory(metaclass=Singleton):
         :param loader_type: 数据库类型，可选值为 "orm", "mongo", "redis"
         :param loader_name: 配置加载器名称，第一次创建连接成功后，存入 _config_db，存入方式默认与 db_type 拼接
         :param db_url: 数据库连接地址
+        :param kwargs: 其他创建连接参数，例如 ORM 只读副本连接列表 replica_urls
         :return:
         """
         db_key = f"{loader_type}-{loader_name}"
@@ -59,7 +65,7 @@ class DBFactory(metaclass=Singleton):
             loader = RedisDatabase()
         else:
             raise ValueError(f"不存在的数据库类型: {loader_type}")
-        loader.create_connection(db_url)
+        loader.create_connection(db_url, **kwargs)
         cls.register(db_key, loader)
         return loader
 
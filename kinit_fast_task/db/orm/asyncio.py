@@ -4,16 +4,108 @@
 # @IDE            : PyCharm
 # @Desc           : SQLAlchemy ORM 会话管理
 
+import itertools
+import time
+import uuid
 from collections.abc import AsyncGenerator
-from sqlalchemy import text, QueuePool
+from contextvars import ContextVar
+from sqlalchemy import text, Select, event, make_url
+from sqlalchemy.orm import Session, ORMExecuteState
 
 from kinit_fast_task.core import CustomException
 from kinit_fast_task.db.async_base import AsyncAbstractDatabase
+from kinit_fast_task.db.orm.pool import MetricsQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker, AsyncEngine
 from kinit_fast_task.config import settings
 from kinit_fast_task.utils import log
 
 
+# 当前请求的写后读一致状态，由 read_your_writes_middleware 在每个请求开始时设置
+# 格式：{"until": 窗口结束时间戳, "wrote": 本次请求是否写入}
+# 会话在请求内的其他任务中提交时也能修改同一个字典，所以中间件可以在响应时读取到写入状态
+read_your_writes_state: ContextVar[dict | None] = ContextVar("read_your_writes_state", default=None)
+
+
+class RoutingSession(Session):
+    """
+    读写分离会话
+
+    只有通过 ORMDatabase.db_read_getter 获取的会话会将 SELECT 语句路由到只读副本，其他语句与会话都使用主库
+
+    只读会话在第一条 SELECT 语句时选择读取使用的引擎（主库或某个只读副本），之后会话中的查询都使用同一个引擎，
+    保证同一请求中的主查询与 selectinload 等关联查询读取的是同一个数据库
+
+    以下情况读取也会使用主库，保证写后读一致：
+    1. 当前会话已经执行过写入操作
+    2. 当前客户端在写后读一致窗口内有过写入，见 ORMDatabase.read_your_writes_seconds
+
+    官方文档：https://docs.sqlalchemy.org/en/20/orm/persistence_techniques.html#custom-vertical-partitioning
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        database: ORMDatabase = self.info["database"]
+        if not self.info.get("read_replica"):
+            return database.engine.sync_engine
+        if not database.replica_engines or self._flushing or self.info.get("wrote") or not isinstance(clause, Select):
+            return database.read_engine.sync_engine
+        read_engine = self.info.get("read_engine")
+        if read_engine is None:
+            state = read_your_writes_state.get()
+            if state and time.time() < state["until"]:
+                read_engine = database.read_engine
+            else:
+                read_engine = database.choose_replica()
+            self.info["read_engine"] = read_engine
+        return read_engine.sync_engine
+
+    def pin_primary(self) -> bool:
+        """
+        只读会话还未选择读取引擎时，将之后的读取固定到主库
+
+        用于读缓存回源查询，只读副本可能存在复制延迟，从副本查询的数据不能写入缓存
+
+        :return: 之后的查询是否读取主库
+        """
+        database: ORMDatabase = self.info["database"]
+        if not self.info.get("read_replica") or not database.replica_engines or self.info.get("wrote"):
+            return True
+        return self.info.setdefault("read_engine", database.read_engine) is database.read_engine
+
+
+class ReadAsyncSession(AsyncSession):
+    """
+    只读会话
+
+    绑定的数据库引擎使用 AUTOCOMMIT 隔离级别，执行查询时不会发送 BEGIN 与 COMMIT/ROLLBACK，
+    会话第一次执行语句时从连接池获取连接，直到请求结束、db_read_getter 关闭会话时才归还连接，
+    execute、scalar、get 等方法在会话中都使用同一个连接，见 RoutingSession.get_bind
+
+    asyncpg 只能在事务中创建服务端游标，只读会话不会发送 BEGIN，所以不支持 stream、stream_scalars，
+    ORMCrud.stream_datas 与导出等流式读取请使用 db_getter 或 db_transaction_getter 获取的会话
+    """
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_write_execute(orm_execute_state: ORMExecuteState) -> None:
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_write_flush(session: Session, _) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _mark_write_commit(session: Session) -> None:
+    if not session.info.pop("wrote", False):
+        return
+    state = read_your_writes_state.get()
+    if state is not None:
+        state["until"] = time.time() + session.info["database"].read_your_writes_seconds
+        state["wrote"] = True
+
+
 class ORMDatabase(AsyncAbstractDatabase):
     """
     SQLAlchemy ORM 连接 会话管理
@@ -27,12 +119,32 @@ class ORMDatabase(AsyncAbstractDatabase):
         """
         self._engine: AsyncEngine | None = None
         self._session_factory: async_sessionmaker[AsyncSession] | None = None
+        self._read_session_factory: async_sessionmaker[ReadAsyncSession] | None = None
+        # 只读会话使用的 AUTOCOMMIT 引擎，与对应的原引擎共用连接池
+        self.read_engine: AsyncEngine | None = None
+        self.replica_engines: list[AsyncEngine] = []
+        self._replica_read_engines: list[AsyncEngine] = []
+        self._replica_cycle: itertools.cycle | None = None
+        self.replica_strategy = settings.db.ORM_REPLICA_STRATEGY
+        self.read_your_writes_seconds = settings.db.ORM_READ_YOUR_WRITES_SECONDS
 
-    def create_connection(self, db_url: str = None) -> None:
+    @property
+    def engine(self) -> AsyncEngine:
+        """
+        主库数据库引擎
+
+        :return:
+        """
+        if not self._engine:
+            raise CustomException("未连接 SQLAlchemy ORM 数据库！")
+        return self._engine
+
+    def create_connection(self, db_url: str = None, *, replica_urls: list[str] = None) -> None:
         """
         创建数据库引擎与会话工厂
 
-        :param db_url: 数据库连接
+        :param db_url: 主库数据库连接
+        :param replica_urls: 只读副本数据库连接列表，默认使用 ORM_REPLICA_URLS 配置，为空时读写都使用主库
         :return:
         """
         """
@@ -45,50 +157,121 @@ class ORMDatabase(AsyncAbstractDatabase):
         # pool_size=5：在连接池内保持打开的连接数。pool_size设置为0表示没有限制
         # max_overflow 参数用于配置连接池中允许的连接 "溢出" 数量。这个参数用于在高负载情况下处理连接请求的峰值。
         # 当连接池的所有连接都在使用中时，如果有新的连接请求到达，连接池可以创建额外的连接来满足这些请求，最多创建的数量由 max_overflow 参数决定。
+        # pool_timeout=30：连接池与溢出连接都已用完时，获取连接的最长等待秒数，超时抛出 TimeoutError。
+        # pool_use_lifo=False：设置为 True 时优先使用最近归还的连接，低峰期多余的空闲连接可以被回收。
+        # 以上连接池参数均在 DBSettings 中配置，poolclass 使用 MetricsQueuePool 记录连接池运行指标。
         """  # noqa E501
         if not db_url:
             db_url = settings.db.ORM_DATABASE_URL.unicode_string()
-        self._engine = create_async_engine(
+        if replica_urls is None:
+            replica_urls = [url.unicode_string() for url in settings.db.ORM_REPLICA_URLS]
+        self._engine = self.create_engine(db_url)
+        self.replica_engines = [self.create_engine(url) for url in replica_urls]
+        self.read_engine = self._engine.execution_options(isolation_level="AUTOCOMMIT")
+        self._replica_read_engines = [e.execution_options(isolation_level="AUTOCOMMIT") for e in self.replica_engines]
+        self._replica_cycle = itertools.cycle(self._replica_read_engines)
+
+        self._session_factory = async_sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            bind=self._engine,
+            expire_on_commit=True,
+            class_=AsyncSession,
+            sync_session_class=RoutingSession,
+            info={"database": self},
+        )
+        self._read_session_factory = async_sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            bind=self.read_engine,
+            expire_on_commit=False,
+            class_=ReadAsyncSession,
+            sync_session_class=RoutingSession,
+            info={"database": self, "read_replica": True},
+        )
+
+    @staticmethod
+    def create_engine(db_url: str) -> AsyncEngine:
+        """
+        创建数据库引擎，主库与只读副本使用相同的连接池配置
+
+        :param db_url: 数据库连接
+        :return:
+        """
+        return create_async_engine(
             db_url,
             echo=settings.db.ORM_DB_ECHO,
             echo_pool=False,
-            pool_pre_ping=True,
-            pool_recycle=3,
-            pool_size=5,
-            max_overflow=2,
-            connect_args={},
+            poolclass=MetricsQueuePool,
+            pool_pre_ping=settings.db.ORM_POOL_PRE_PING,
+            pool_recycle=settings.db.ORM_POOL_RECYCLE,
+            pool_size=settings.db.ORM_POOL_SIZE,
+            max_overflow=settings.db.ORM_MAX_OVERFLOW,
+            pool_timeout=settings.db.ORM_POOL_TIMEOUT,
+            pool_use_lifo=settings.db.ORM_POOL_USE_LIFO,
+            connect_args=ORMDatabase.get_connect_args(db_url),
         )
 
-        self._session_factory = async_sessionmaker(
-            autocommit=False, autoflush=False, bind=self._engine, expire_on_commit=True, class_=AsyncSession
-        )
+    @staticmethod
+    def get_connect_args(db_url: str) -> dict:
+        """
+        获取数据库驱动连接参数，目前只有 asyncpg 驱动需要配置
+
+        PgBouncer 官方文档：https://docs.sqlalchemy.org/en/20/dialects/postgresql.html#prepared-statement-name-with-pgbouncer
+
+        :param db_url: 数据库连接
+        :return:
+        """
+        if make_url(db_url).get_driver_name() != "asyncpg":
+            return {}
+        connect_args = {
+            "prepared_statement_cache_size": settings.db.ORM_ASYNCPG_PREPARED_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": settings.db.ORM_ASYNCPG_STATEMENT_CACHE_SIZE,
+            "server_settings": settings.db.ORM_ASYNCPG_SERVER_SETTINGS,
+        }
+        if settings.db.ORM_PGBOUNCER:
+            connect_args["prepared_statement_cache_size"] = 0
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+        return connect_args
+
+    def choose_replica(self) -> AsyncEngine:
+        """
+        选择一个只读副本，返回使用 AUTOCOMMIT 隔离级别的副本引擎
 
-    def get_pool_status(self):
-        """
-        获取当前连接池状态
-        """
-        pool = self._engine.pool
-        if isinstance(pool, QueuePool):
-            status = {
-                "checked_out": pool.checkedout(),  # 当前使用中的连接数
-                "overflow": pool._overflow,  # 当前溢出的连接数
-                "pool_size": pool.size(),  # 连接池大小
-                "checked_in": pool.size() - pool.checkedout(),  # 空闲连接数
-            }
-            print("\n=======================BEGIN=======================")
-            print(f"当前使用中的连接数: {status['checked_out']}")
-            print(f"连接池大小: {status['pool_size']}")
-            print(f"当前溢出的连接数: {status['overflow']}")
-            print(f"空闲连接数: {status['checked_in']}")
-            print("========================EOF========================")
-            return status
-        else:
-            raise TypeError("Pool is not a QueuePool instance")
+        round_robin：轮询选择
+        least_checked_out：选择当前使用中连接最少的副本
+
+        :return:
+        """
+        if self.replica_strategy == "least_checked_out":
+            return min(self._replica_read_engines, key=lambda engine: engine.pool.checkedout())
+        return next(self._replica_cycle)
+
+    def get_pool_status(self) -> dict:
+        """
+        获取当前连接池状态与运行指标，包括主库与所有只读副本
+
+        :return:
+        """
+        if not self._engine:
+            raise CustomException("未连接 SQLAlchemy ORM 数据库！")
+        engines = {"primary": self._engine} | {f"replica_{i}": e for i, e in enumerate(self.replica_engines)}
+        status = {}
+        for name, engine in engines.items():
+            pool = engine.pool
+            if not isinstance(pool, MetricsQueuePool):
+                raise TypeError("Pool is not a MetricsQueuePool instance")
+            status[name] = pool.status_dict()
+        return status
 
     async def db_transaction_getter(self) -> AsyncGenerator[AsyncSession, None]:
         """
         从数据库会话工厂中获取数据库事务，它将在单个请求中使用，最后在请求完成后将其关闭
 
+        session.begin() 只会创建会话事务，第一次执行语句时才会从连接池获取连接并发送 BEGIN，
+        所以命中缓存或没有执行语句的请求不会占用连接，也不会发送 BEGIN 与 COMMIT
+
         函数的返回类型被注解为 AsyncGenerator[AsyncSession, None]
         其中 AsyncSession 是生成的值的类型，而 None 表示异步生成器没有终止条件。
 
@@ -107,6 +290,22 @@ class ORMDatabase(AsyncAbstractDatabase):
             async with session.begin():
                 yield session
 
+    async def db_read_getter(self) -> AsyncGenerator[ReadAsyncSession, None]:
+        """
+        获取只读数据库会话，用于 GET 等只读接口，SELECT 语句会路由到只读副本
+
+        与 db_transaction_getter 相同，会话在第一次执行语句时才会从连接池获取连接，命中缓存或参数验证失败时不会占用连接，
+        不同的是只读会话不会发送 BEGIN 与 COMMIT，会话事务在请求结束时结束并归还连接，详见 ReadAsyncSession
+
+        只读会话中每条语句都是自动提交的，写入数据请使用 db_transaction_getter，流式读取请使用 db_getter
+
+        :return:
+        """  # noqa E501
+        if not self._engine or not self._read_session_factory:
+            raise CustomException("未连接 SQLAlchemy ORM 数据库！")
+        async with self._read_session_factory() as session, session.begin():
+            yield session
+
     def db_getter(self) -> AsyncSession:
         """
         获取数据库 session
@@ -141,3 +340,5 @@ class ORMDatabase(AsyncAbstractDatabase):
         """
         if self._engine:
             await self._engine.dispose()
+        for engine in self.replica_engines:
+            await engine.dispose()
@@ -0,0 +1,143 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/20 14:26
+# @File           : pool.py
+# @IDE            : PyCharm
+# @Desc           : 可观测的数据库连接池
+
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+
+
+class PoolMetrics:
+    """
+    连接池运行指标，用于根据实际测量数据调整连接池大小
+
+    时间单位均为毫秒
+    """
+
+    def __init__(self):
+        self.checkouts = 0  # 获取连接总次数
+        self.checkout_wait_total = 0.0  # 获取连接总等待时间，包含新建连接的时间
+        self.checkout_wait_max = 0.0  # 获取连接最大等待时间
+        self.checkout_timeouts = 0  # 获取连接超时次数
+        self.connects = 0  # 新建数据库连接次数
+        self.connect_time_total = 0.0  # 新建数据库连接总耗时
+        self.connect_time_max = 0.0  # 新建数据库连接最大耗时
+        self.hold_time_total = 0.0  # 连接被占用总时间，从获取到归还
+        self.hold_time_max = 0.0  # 连接被占用最大时间
+        self.overflow_checkouts = 0  # 使用溢出连接的次数
+        self.overflow_peak = 0  # 溢出连接数峰值
+        self.invalidations = 0  # 连接失效次数
+
+    def record_checkout(self, wait: float, overflow: int) -> None:
+        self.checkouts += 1
+        self.checkout_wait_total += wait
+        self.checkout_wait_max = max(self.checkout_wait_max, wait)
+        if overflow > 0:
+            self.overflow_checkouts += 1
+            self.overflow_peak = max(self.overflow_peak, overflow)
+
+    def record_connect(self, duration: float) -> None:
+        self.connects += 1
+        self.connect_time_total += duration
+        self.connect_time_max = max(self.connect_time_max, duration)
+
+    def record_checkin(self, hold: float) -> None:
+        self.hold_time_total += hold
+        self.hold_time_max = max(self.hold_time_max, hold)
+
+    def to_dict(self) -> dict:
+        """
+        输出指标，平均值保留三位小数
+
+        :return:
+        """
+        return {
+            "checkouts": self.checkouts,
+            "checkout_wait_avg_ms": round(self.checkout_wait_total / self.checkouts, 3) if self.checkouts else 0,
+            "checkout_wait_max_ms": round(self.checkout_wait_max, 3),
+            "checkout_timeouts": self.checkout_timeouts,
+            "connects": self.connects,
+            "connect_time_avg_ms": round(self.connect_time_total / self.connects, 3) if self.connects else 0,
+            "connect_time_max_ms": round(self.connect_time_max, 3),
+            "hold_time_avg_ms": round(self.hold_time_total / self.checkouts, 3) if self.checkouts else 0,
+            "hold_time_max_ms": round(self.hold_time_max, 3),
+            "overflow_checkouts": self.overflow_checkouts,
+            "overflow_peak": self.overflow_peak,
+            "invalidations": self.invalidations,
+        }
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    connection_record.info["checkout_time"] = time.perf_counter()
+
+
+def _on_checkin(dbapi_connection, connection_record) -> None:
+    checkout_time = connection_record.info.pop("checkout_time", None)
+    metrics: PoolMetrics | None = connection_record.info.get("metrics")
+    if checkout_time is not None and metrics:
+        metrics.record_checkin((time.perf_counter() - checkout_time) * 1000)
+
+
+def _on_invalidate(dbapi_connection, connection_record, exception) -> None:
+    metrics: PoolMetrics | None = connection_record.info.get("metrics")
+    if metrics:
+        metrics.invalidations += 1
+
+
+class MetricsQueuePool(AsyncAdaptedQueuePool):
+    """
+    记录运行指标的异步连接池
+
+    连接池事件只有获取连接之后的 checkout 事件，没有获取连接之前的事件，
+    所以获取连接等待时间与新建连接耗时通过重写方法统计，连接占用时间与失效次数通过连接池事件统计
+
+    重写的 _do_get、_create_connection 与读取的 _max_overflow 都是 SQLAlchemy 内部接口，所以 SQLAlchemy 版本固定为 2.0.x，
+    升级前需要确认这些内部接口没有变化，见 tests/test_orm_pool.py
+
+    连接池事件官方文档：https://docs.sqlalchemy.org/en/20/core/events.html#connection-pool-events
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        if "_dispatch" not in kwargs:
+            # 连接池重建（recreate）时会复制原连接池的事件，不需要重复注册
+            event.listen(self, "checkout", _on_checkout)
+            event.listen(self, "checkin", _on_checkin)
+            event.listen(self, "invalidate", _on_invalidate)
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.checkout_timeouts += 1
+            raise
+        self.metrics.record_checkout((time.perf_counter() - start) * 1000, self.overflow())
+        # 连接失效后 info 会被清空，所以每次获取连接时都重新设置，供连接池事件使用
+        record.info["metrics"] = self.metrics
+        return record
+
+    def _create_connection(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        record = super()._create_connection()
+        self.metrics.record_connect((time.perf_counter() - start) * 1000)
+        return record
+
+    def status_dict(self) -> dict:
+        """
+        当前连接池状态与运行指标
+
+        :return:
+        """
+        return {
+            "pool_size": self.size(),  # 连接池大小
+            "max_overflow": self._max_overflow,  # 最大溢出连接数
+            "checked_out": self.checkedout(),  # 当前使用中的连接数
+            "checked_in": self.checkedin(),  # 空闲连接数
+            "overflow": max(self.overflow(), 0),  # 当前溢出的连接数
+            "metrics": self.metrics.to_dict(),
+        }
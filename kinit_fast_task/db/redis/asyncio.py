@@ -2,14 +2,23 @@
 # @Create Time    : 2024/4/1 13:58
 # @File           : asyncio.py
 # @IDE            : PyCharm
-# @Desc           : mongodb
+# @Desc           : redis
 
 
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from typing import TypeVar
+
 from kinit_fast_task.db.async_base import AsyncAbstractDatabase
 from kinit_fast_task.config import settings
 import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import WatchError
 from kinit_fast_task.core import CustomException
+from kinit_fast_task.db.redis.pipeline import AutoPipeline
 from kinit_fast_task.utils import log
+from kinit_fast_task.utils.response_code import Status
+
+T = TypeVar("T")
 
 
 class RedisDatabase(AsyncAbstractDatabase):
@@ -24,6 +33,8 @@ class RedisDatabase(AsyncAbstractDatabase):
         实例化 Redis 数据库连接
         """
         self._engine: redis.ConnectionPool | None = None
+        self._client: redis.Redis | None = None
+        self._auto_pipeline: AutoPipeline | None = None
 
     def create_connection(self, db_url: str = None) -> None:
         """
@@ -36,28 +47,126 @@ class RedisDatabase(AsyncAbstractDatabase):
         # decode_responses: 自动解码响应为字符串
         # protocol: 指定使用 RESP3 协议
         # max_connections: 最大连接数
+        # timeout: 连接池连接全部被占用时，等待空闲连接的最长时间，超时抛出 ConnectionError
+        # socket_timeout: 单条命令读写超时时间，避免 Redis 无响应时请求一直挂起
+        # socket_connect_timeout: 建立连接超时时间
+        # health_check_interval: 连接空闲超过该时间后，下次使用前先发送 PING 检查连接是否可用
         if not db_url:
             db_url = settings.db.REDIS_DB_URL.unicode_string()
-        self._engine = redis.ConnectionPool.from_url(
-            db_url, encoding="utf-8", decode_responses=True, protocol=3, max_connections=10
+        self._engine = redis.BlockingConnectionPool.from_url(
+            db_url,
+            encoding="utf-8",
+            decode_responses=True,
+            protocol=3,
+            max_connections=settings.db.REDIS_MAX_CONNECTIONS,
+            timeout=settings.db.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.db.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.db.REDIS_SOCKET_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=settings.db.REDIS_HEALTH_CHECK_INTERVAL,
         )
+        # 客户端每次执行命令时从连接池获取连接，执行完成后归还，可以在多个协程中共享同一个客户端
+        self._client = redis.Redis(connection_pool=self._engine)
+        self._auto_pipeline = AutoPipeline(self._client)
 
     def db_getter(self) -> redis.Redis:
         """
-        返回一个从连接池获取的 Redis 客户端
+        返回共享的 Redis 客户端
+        :return:
+        """
+        if not self._client:
+            raise CustomException("未连接 Redis 数据库！")
+        return self._client
+
+    @property
+    def auto_pipeline(self) -> AutoPipeline:
+        """
+        自动批量发送命令的客户端，同一轮事件循环中发出的命令合并为一个 pipeline 发送
+
+        :return:
+        """
+        if not self._auto_pipeline:
+            raise CustomException("未连接 Redis 数据库！")
+        return self._auto_pipeline
+
+    def get_pool_status(self) -> dict:
+        """
+        连接池状态与自动批量发送统计
+
         :return:
         """
         if not self._engine:
             raise CustomException("未连接 Redis 数据库！")
-        return redis.Redis(connection_pool=self._engine)
+        # redis-py 没有提供获取连接数量的公开接口，读取的是连接池内部属性，不同版本中不存在时返回 None
+        in_use = getattr(self._engine, "_in_use_connections", None)
+        available = getattr(self._engine, "_available_connections", None)
+        return {
+            "max_connections": self._engine.max_connections,
+            "in_use_connections": len(in_use) if in_use is not None else None,
+            "idle_connections": len(available) if available is not None else None,
+            "auto_pipeline": self._auto_pipeline.stats(),
+        }
 
-    async def db_transaction_getter(self):
+    async def db_transaction_getter(self) -> AsyncGenerator[Pipeline, None]:
         """
-        获取数据库事务
+        获取 Redis 事务，它将在单个请求中使用，与 ORM 的 db_transaction_getter 用法相同：
+            pipe: Pipeline = Depends(DBFactory.get_instance("redis").db_transaction_getter)
+
+        返回 MULTI/EXEC 事务 pipeline，请求中调用的命令只会缓存在本地（不需要 await），
+        请求完成后通过 MULTI/EXEC 在一次网络往返中发送并原子执行，请求中抛出异常时丢弃所有命令
+
+        事务中的命令在请求完成前不会执行，无法读取到执行结果，先读取再根据结果写入的场景请使用 transaction 方法
 
         :return:
         """
-        raise NotImplementedError("未实现 Redis 事务功能！")
+        if not self._client:
+            raise CustomException("未连接 Redis 数据库！")
+        async with self._client.pipeline(transaction=True) as pipe:
+            yield pipe
+            # 没有缓存命令时不会获取连接，也不会发送 MULTI/EXEC
+            await pipe.execute()
+
+    async def transaction(
+        self,
+        func: Callable[[Pipeline], Awaitable[T]],
+        *watch_keys: str,
+        retries: int = 3,
+    ) -> T:
+        """
+        执行 WATCH + MULTI/EXEC 乐观锁事务，监听的键在事务执行前被其他客户端修改时自动重试
+
+        func 接收事务 pipeline，调用 pipe.multi() 之前的命令会立即执行并返回结果，用于读取监听的键，
+        调用 pipe.multi() 之后的命令缓存在本地，func 返回后通过 MULTI/EXEC 一次发送，例如：
+
+            async def incr_balance(pipe: Pipeline) -> int:
+                balance = int(await pipe.get("balance") or 0) + 100
+                pipe.multi()
+                pipe.set("balance", balance)
+                return balance
+
+            balance = await DBFactory.get_instance("redis").transaction(incr_balance, "balance")
+
+        :param func: 事务函数，每次重试都会重新执行，需要保证除 Redis 命令外没有其他副作用
+        :param watch_keys: 监听的键
+        :param retries: 监听的键被修改时的最大重试次数
+        :return: func 的返回值
+        """
+        if not self._client:
+            raise CustomException("未连接 Redis 数据库！")
+        async with self._client.pipeline(transaction=True) as pipe:
+            for attempt in range(retries + 1):
+                try:
+                    if watch_keys:
+                        await pipe.watch(*watch_keys)
+                    result = await func(pipe)
+                    await pipe.execute()
+                    return result
+                except WatchError:
+                    log.warning(f"Redis 事务监听的键已被修改，第 {attempt + 1} 次执行失败：{watch_keys}")
+                    await pipe.reset()
+        raise CustomException(
+            "数据已被修改，请稍后重试", code=Status.HTTP_409, desc=f"Redis 事务监听的键：{watch_keys}"
+        )
 
     async def test_connection(self) -> None:
         """
@@ -79,4 +188,5 @@ class RedisDatabase(AsyncAbstractDatabase):
         """
         if not self._engine:
             return None
+        await self._client.aclose()
         await self._engine.aclose()
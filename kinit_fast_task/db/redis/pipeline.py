@@ -0,0 +1,122 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/27 09:51
+# @File           : pipeline.py
+# @IDE            : PyCharm
+# @Desc           : Redis 自动批量发送命令
+
+import asyncio
+from typing import Any
+
+import redis.asyncio as redis
+
+
+class AutoPipeline:
+    """
+    Redis 自动批量发送命令（auto-pipelining）
+
+    同一轮事件循环中发出的命令先放入队列，在下一轮事件循环开始时通过一个非事务 pipeline 一次发送，
+    并发请求大量读写 Redis 时（例如 asyncio.gather 批量查询缓存），N 次往返会合并为一次往返
+
+    pipeline 不是事务，命令之间没有原子性保证，只是合并网络往返，单条命令执行失败只影响该命令的调用方
+
+    使用方式：
+        pipe = DBFactory.get_instance("redis").auto_pipeline
+        values = await asyncio.gather(*[pipe.get(key) for key in keys])
+    """
+
+    def __init__(self, client: redis.Redis, *, max_batch: int = 1000):
+        """
+        :param client: Redis 客户端
+        :param max_batch: 单个 pipeline 最大命令数量，队列达到该数量时立即发送
+        """
+        self.client = client
+        self.max_batch = max_batch
+        self._queue: list[tuple[tuple, dict, asyncio.Future]] = []
+        self._scheduled = False
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0  # 发送的 pipeline 数量，即网络往返次数
+        self.commands = 0  # 发送的命令数量
+
+    def execute_command(self, *args, **options) -> asyncio.Future:
+        """
+        将命令加入队列
+
+        :param args: 命令与参数，例如 "GET", "key"
+        :param options: 命令选项，与 Redis.execute_command 相同
+        :return: 命令执行结果 Future
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((args, options, future))
+        if len(self._queue) >= self.max_batch:
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self.flush)
+        return future
+
+    def flush(self) -> None:
+        """
+        发送队列中的命令
+
+        :return:
+        """
+        self._scheduled = False
+        if not self._queue:
+            return
+        queue, self._queue = self._queue, []
+        task = asyncio.create_task(self._execute(queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, queue: list[tuple[tuple, dict, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.commands += len(queue)
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for args, options, _ in queue:
+                    pipe.execute_command(*args, **options)
+                results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            for _, _, future in queue:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(queue, results, strict=True):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def get(self, key: str) -> Any:
+        return await self.execute_command("GET", key)
+
+    async def set(self, key: str, value: Any, *, ex: int = None) -> Any:
+        args = ("SET", key, value, "EX", ex) if ex is not None else ("SET", key, value)
+        return await self.execute_command(*args)
+
+    async def delete(self, *keys: str) -> int:
+        return await self.execute_command("DEL", *keys)
+
+    async def hget(self, key: str, field: str) -> Any:
+        return await self.execute_command("HGET", key, field)
+
+    async def incrby(self, key: str, amount: int = 1) -> int:
+        return await self.execute_command("INCRBY", key, amount)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return await self.execute_command("EXPIRE", key, seconds)
+
+    def stats(self) -> dict:
+        """
+        批量发送统计
+
+        :return:
+        """
+        return {
+            "batches": self.batches,
+            "commands": self.commands,
+            "commands_per_batch": round(self.commands / self.batches, 2) if self.batches else 0,
+        }
@@ -0,0 +1,5 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/14 15:40
+# @File           : __init__.py
+# @IDE            : PyCharm
+# @Desc           : 性能基准测试脚本
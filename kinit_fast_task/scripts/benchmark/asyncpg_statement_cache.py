@@ -0,0 +1,118 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/21 11:08
+# @File           : asyncpg_statement_cache.py
+# @IDE            : PyCharm
+# @Desc           : asyncpg 预编译语句缓存配置性能基准测试
+
+"""
+对比不同 asyncpg 连接参数下 CRUD 常用查询的单次耗时：
+
+    1. default：当前 DBSettings 中的配置
+    2. no_cache：关闭 SQLAlchemy 与 asyncpg 两级预编译语句缓存，每次查询都需要重新 prepare
+    3. pgbouncer：ORM_PGBOUNCER 模式，关闭缓存并为每条预编译语句生成唯一名称
+    4. jit_on：使用当前缓存配置，但不设置 server_settings，jit 使用数据库默认配置
+
+需要连接 PostgreSQL 数据库，并且 auth_user 表中已有数据，默认使用 ORM_DATABASE_URL
+
+命令示例：python -m kinit_fast_task.scripts.benchmark.asyncpg_statement_cache --number 500
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import make_url, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from kinit_fast_task.app.cruds.auth_user_crud import AuthUserCRUD
+from kinit_fast_task.app.models.auth_user_model import AuthUserModel
+from kinit_fast_task.app.schemas import auth_user_schema as user_s
+from kinit_fast_task.config import settings
+from kinit_fast_task.db.orm.asyncio import ORMDatabase
+
+
+def build_configs(db_url: str) -> dict[str, dict]:
+    """
+    构造需要对比的连接参数
+
+    :param db_url: 数据库连接
+    :return:
+    """
+    if make_url(db_url).get_driver_name() != "asyncpg":
+        raise SystemExit("只支持 postgresql+asyncpg 数据库连接")
+    default = ORMDatabase.get_connect_args(db_url)
+    return {
+        "default": default,
+        "no_cache": default | {"prepared_statement_cache_size": 0, "statement_cache_size": 0},
+        "pgbouncer": default
+        | {
+            "prepared_statement_cache_size": 0,
+            "statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        },
+        "jit_on": default | {"server_settings": {}},
+    }
+
+
+async def run_config(db_url: str, connect_args: dict, number: int) -> dict[str, tuple[float, float]]:
+    """
+    执行一种连接参数的测试
+
+    :param db_url: 数据库连接
+    :param connect_args: 连接参数
+    :param number: 每个查询执行次数
+    :return: {查询名称: (平均耗时, p95 耗时)}，单位毫秒
+    """
+    engine = create_async_engine(db_url, pool_size=1, max_overflow=0, connect_args=connect_args)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as session:
+        ids = (await session.execute(select(AuthUserModel.id).limit(100))).scalars().all()
+    if not ids:
+        await engine.dispose()
+        raise SystemExit("auth_user 表中没有数据，请先创建测试数据")
+
+    v_options = [selectinload(AuthUserModel.roles)]
+    queries = {
+        "get_data": lambda crud, i: crud.get_data(ids[i % len(ids)], v_return_type="dict"),
+        "get_page": lambda crud, i: crud.get_page(
+            page=1, limit=20, v_options=v_options, v_schema=user_s.AuthUserOutSchema, v_return_type="dict"
+        ),
+        "get_count": lambda crud, i: crud.get_count(is_active=True),
+        "validate_data": lambda crud, i: crud.validate_data(telephone=f"199{i:08d}", email=f"bench{i}@email.com"),
+    }
+
+    result = {}
+    for name, query in queries.items():
+        # 预热，建立连接并填充预编译语句缓存
+        for i in range(10):
+            async with session_factory() as session:
+                await query(AuthUserCRUD(session), i)
+        costs = []
+        for i in range(number):
+            async with session_factory() as session:
+                start = time.perf_counter()
+                await query(AuthUserCRUD(session), i)
+                costs.append((time.perf_counter() - start) * 1000)
+        costs.sort()
+        result[name] = (sum(costs) / len(costs), costs[int(len(costs) * 0.95) - 1])
+    await engine.dispose()
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="asyncpg 预编译语句缓存配置性能基准测试")
+    parser.add_argument("--url", default=settings.db.ORM_DATABASE_URL.unicode_string(), help="数据库连接")
+    parser.add_argument("--number", type=int, default=500, help="每个查询执行次数")
+    args = parser.parse_args()
+
+    for config_name, connect_args in build_configs(args.url).items():
+        result = await run_config(args.url, connect_args, args.number)
+        for query_name, (avg, p95) in result.items():
+            print(f"{config_name:<10} {query_name:<14} avg={avg:.3f} ms  p95={p95:.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
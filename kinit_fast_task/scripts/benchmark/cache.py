@@ -0,0 +1,125 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/25 14:03
+# @File           : cache.py
+# @IDE            : PyCharm
+# @Desc           : 进程内缓存性能基准测试
+
+"""
+测试 utils.cache 各组件的单次操作耗时与并发加载效果：
+
+    1. LRUCache get 命中、get 未命中、set（超过最大数量时包含淘汰）
+    2. AsyncCache 命中与直接 await 协程函数的耗时对比
+    3. memoize 命中与直接 await 协程函数的耗时对比
+    4. 并发未命中：同一个键同时发起多次请求，统计加载函数实际执行次数与总耗时
+
+不需要连接数据库，加载函数使用 asyncio.sleep 模拟一次数据库查询
+
+命令示例：python -m kinit_fast_task.scripts.benchmark.cache --number 100000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import time
+import timeit
+
+from kinit_fast_task.utils.cache import AsyncCache, LRUCache, memoize
+
+
+def bench_lru(number: int, max_size: int) -> None:
+    """
+    LRUCache 单次操作耗时
+
+    :param number: 执行次数
+    :param max_size: 最大缓存数量
+    :return:
+    """
+    cache = LRUCache(max_size, ttl=60)
+    for i in range(max_size):
+        cache.set(i, i)
+    keys = [i % max_size for i in range(number)]
+    cases = {
+        "LRUCache.get hit": lambda: [cache.get(key) for key in keys],
+        "LRUCache.get miss": lambda: [cache.get(-1) for _ in keys],
+        "LRUCache.set evict": lambda: [cache.set(key + max_size, key) for key in keys],
+    }
+    for name, func in cases.items():
+        seconds = min(timeit.repeat(func, number=1, repeat=3)) / number
+        print(f"{name:<24} {seconds * 1e9:>8.0f} ns/op")
+    print(f"{'LRUCache.stats':<24} {cache.stats()}")
+
+
+async def bench_async(number: int) -> None:
+    """
+    AsyncCache 与 memoize 命中耗时
+
+    :param number: 执行次数
+    :return:
+    """
+
+    async def load() -> dict:
+        return {"count": 1}
+
+    cache = AsyncCache(max_size=16)
+
+    @memoize(ttl=60, name="benchmark.memoized")
+    async def memoized(key: int) -> dict:
+        return {"count": key}
+
+    cases = {
+        "direct await": lambda: load(),
+        "AsyncCache.get hit": lambda: cache.get("key", load),
+        "memoize hit": lambda: memoized(1),
+    }
+    for name, func in cases.items():
+        await func()
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        seconds = (time.perf_counter() - start) / number
+        print(f"{name:<24} {seconds * 1e9:>8.0f} ns/op")
+    print(f"{'memoize.stats':<24} {memoized.cache.stats()}")
+
+
+async def bench_single_flight(concurrency: int, delay: float) -> None:
+    """
+    同一个键并发未命中时加载函数执行次数
+
+    :param concurrency: 并发请求数量
+    :param delay: 模拟的加载耗时（秒）
+    :return:
+    """
+    calls = 0
+
+    async def load() -> dict:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(delay)
+        return {"count": calls}
+
+    for name, get in (
+        ("no single-flight", lambda cache: load()),
+        ("AsyncCache", lambda cache: cache.get("key", load)),
+    ):
+        calls = 0
+        cache = AsyncCache(max_size=16)
+        start = time.perf_counter()
+        await asyncio.gather(*[get(cache) for _ in range(concurrency)])
+        seconds = time.perf_counter() - start
+        print(f"{name:<24} concurrency={concurrency} loader_calls={calls} total={seconds * 1000:.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="进程内缓存性能基准测试")
+    parser.add_argument("--number", type=int, default=100000, help="单次操作测试执行次数")
+    parser.add_argument("--max-size", type=int, default=1024, help="LRUCache 最大缓存数量")
+    parser.add_argument("--concurrency", type=int, default=100, help="并发未命中测试的并发数量")
+    parser.add_argument("--delay", type=float, default=0.005, help="并发未命中测试中模拟的加载耗时（秒）")
+    args = parser.parse_args()
+
+    bench_lru(args.number, args.max_size)
+    await bench_async(args.number)
+    await bench_single_flight(args.concurrency, args.delay)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
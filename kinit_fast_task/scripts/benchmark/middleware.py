@@ -0,0 +1,151 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/29 10:37
+# @File           : middleware.py
+# @IDE            : PyCharm
+# @Desc           : 中间件性能基准测试
+
+"""
+对比不同中间件配置下每秒处理的请求数：
+
+    1. 不使用中间件
+    2. 3 个纯 ASGI 中间件：请求日志、操作记录、演示环境
+    3. 3 个直接返回 call_next 结果的 @app.middleware("http")（BaseHTTPMiddleware），作为改为纯 ASGI 中间件之前的参照
+
+不经过 HTTP 服务器与网络，直接调用 ASGI 应用，测试结果只包含框架、中间件与接口本身的耗时
+不需要连接数据库，操作记录只放入队列，批量写入函数替换为直接丢弃；默认关闭日志输出，避免测试结果主要为日志写入耗时
+
+命令示例：python -m kinit_fast_task.scripts.benchmark.middleware --number 5000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from loguru import logger
+
+from kinit_fast_task.config import settings
+from kinit_fast_task.core.middleware import (
+    operation_record_writer,
+    register_demo_env_middleware,
+    register_operation_record_middleware,
+    register_request_log_middleware,
+)
+
+BODY = b'{"name": "kinit", "telephone": "13800000000", "is_active": true}'
+
+
+def create_app(mode: str) -> FastAPI:
+    """
+    创建测试应用
+
+    :param mode: none：不使用中间件，asgi：纯 ASGI 中间件，base_http：BaseHTTPMiddleware
+    :return:
+    """
+    app = FastAPI()
+
+    @app.post("/benchmark/{data_id}")
+    async def benchmark(data_id: int, data: dict):
+        return {"code": 200, "message": "success", "data": {"id": data_id} | data}
+
+    if mode == "asgi":
+        register_request_log_middleware(app)
+        register_operation_record_middleware(app)
+        register_demo_env_middleware(app)
+    elif mode == "base_http":
+        for _ in range(3):
+
+            @app.middleware("http")
+            async def passthrough(request: Request, call_next):
+                return await call_next(request)
+
+    return app
+
+
+async def request(app: FastAPI) -> int:
+    """
+    直接调用 ASGI 应用发送一次请求
+
+    :param app:
+    :return: 响应状态码
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/benchmark/1",
+        "raw_path": b"/benchmark/1",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"127.0.0.1"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(BODY)).encode()),
+            (b"user-agent", b"Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0 Safari/537.36"),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 9000),
+    }
+    messages = [{"type": "http.request", "body": BODY, "more_body": False}]
+    status_code = 0
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+
+    await app(scope, receive, send)
+    return status_code
+
+
+async def bench(mode: str, number: int, concurrency: int) -> None:
+    """
+    测试每秒处理的请求数
+
+    :param mode: 中间件配置
+    :param number: 请求数量
+    :param concurrency: 并发数量
+    :return:
+    """
+    app = create_app(mode)
+    # 预热，构建中间件栈
+    assert await request(app) == 200
+    start = time.perf_counter()
+    for _ in range(number // concurrency):
+        await asyncio.gather(*[request(app) for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+    total = number // concurrency * concurrency
+    print(f"{mode:<10} {total / seconds:>10.0f} req/s {seconds / total * 1e6:>8.1f} us/req")
+
+
+async def discard(records: list[dict]) -> None:
+    return None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="中间件性能基准测试")
+    parser.add_argument("--number", type=int, default=5000, help="每种配置发送的请求数量")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发请求数量")
+    parser.add_argument("--log", action="store_true", help="是否输出请求日志")
+    args = parser.parse_args()
+
+    if not args.log:
+        logger.remove()
+    settings.db.MONGO_DB_ENABLE = True
+    settings.demo.DEMO_ENV = False
+    operation_record_writer.flush = discard
+
+    for mode in ("none", "asgi", "base_http"):
+        await bench(mode, args.number, args.concurrency)
+    await operation_record_writer.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
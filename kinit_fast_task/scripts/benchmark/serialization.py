@@ -0,0 +1,90 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/14 15:40
+# @File           : serialization.py
+# @IDE            : PyCharm
+# @Desc           : 列表接口序列化性能基准测试
+
+"""
+对比列表接口两种序列化方式的耗时：
+
+    1. 原方式：逐行 model_validate().model_dump()，再通过 ResponseSchema(...).model_dump() 包装响应，最后 orjson 序列化
+    2. 现方式：list[schema] TypeAdapter 一次验证与序列化，响应内容直接交给 orjson 序列化
+
+不需要连接数据库，使用内存中构造的 ORM Model 对象
+
+命令示例：python -m kinit_fast_task.scripts.benchmark.serialization --rows 500 --number 20
+"""
+
+import argparse
+import datetime
+import timeit
+
+import orjson
+
+from kinit_fast_task.app.cruds.base.orm import get_list_adapter
+from kinit_fast_task.app.models.auth_role_model import AuthRoleModel
+from kinit_fast_task.app.models.auth_user_model import AuthUserModel
+from kinit_fast_task.app.schemas import auth_user_schema as user_s
+from kinit_fast_task.utils.response import ResponseSchema, SchemaORJSONResponse
+
+
+def build_users(rows: int) -> list[AuthUserModel]:
+    """
+    构造测试数据
+
+    :param rows: 数据量
+    :return:
+    """
+    now = datetime.datetime.now()
+    roles = [
+        AuthRoleModel(
+            id=i, name=f"角色{i}", role_key=f"role{i}", is_active=True, create_datetime=now, update_datetime=now
+        )
+        for i in range(1, 4)
+    ]
+    users = []
+    for i in range(1, rows + 1):
+        user = AuthUserModel(
+            id=i,
+            name=f"用户{i}",
+            telephone=f"188{i:08d}",
+            email=f"user{i}@email.com",
+            is_active=True,
+            age=i % 80,
+            create_datetime=now,
+            update_datetime=now,
+        )
+        user.roles = {roles[i % 3], roles[(i + 1) % 3]}
+        users.append(user)
+    return users
+
+
+def per_row(users: list[AuthUserModel]) -> bytes:
+    datas = [user_s.AuthUserOutSchema.model_validate(obj).model_dump() for obj in users]
+    content = ResponseSchema(data=datas).model_dump() | {"total": len(datas), "page": 1, "limit": len(datas)}
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def type_adapter(users: list[AuthUserModel]) -> bytes:
+    adapter = get_list_adapter(user_s.AuthUserOutSchema)
+    datas = adapter.dump_python(adapter.validate_python(users, from_attributes=True))
+    content = {"code": 200, "message": "success", "data": datas, "total": len(datas), "page": 1, "limit": len(datas)}
+    return SchemaORJSONResponse(content=content).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表接口序列化性能基准测试")
+    parser.add_argument("--rows", type=int, default=500, help="每页数据量")
+    parser.add_argument("--number", type=int, default=20, help="每种方式执行次数")
+    args = parser.parse_args()
+
+    users = build_users(args.rows)
+    assert orjson.loads(per_row(users)) == orjson.loads(type_adapter(users)), "两种方式的序列化结果不一致"
+
+    for name, func in (("per_row model_validate", per_row), ("list TypeAdapter", type_adapter)):
+        seconds = min(timeit.repeat(lambda f=func: f(users), number=args.number, repeat=3)) / args.number
+        print(f"{name:<24} rows={args.rows:<6} {seconds * 1000:.2f} ms/request")
+
+
+if __name__ == "__main__":
+    main()
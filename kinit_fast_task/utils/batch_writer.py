@@ -0,0 +1,354 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/28 14:20
+# @File           : batch_writer.py
+# @IDE            : PyCharm
+# @Desc           : 异步批量写入
+
+"""
+后台批量写入，用于操作记录等不需要在请求中等待写入结果的数据：
+
+    1. 请求中调用 put 将数据放入有界内存队列，不等待数据库写入
+    2. 后台任务从队列中取出数据，达到 batch_size 条或距离第一条数据超过 flush_interval 秒时批量写入
+    3. 同一时间只有一个批次在写入，数据库变慢时队列会逐渐堆积，队列满时按 overflow 策略处理：
+        drop：丢弃新数据
+        spill：将新数据追加写入本地磁盘文件，数据库恢复后在后台重新写入
+        block：请求等待队列空闲，最多等待 put_timeout 秒，超时后丢弃，用于将数据库压力反馈给请求方
+    4. 批量写入失败时，spill 策略会将整个批次写入磁盘文件，其他策略丢弃该批次
+    5. 关闭时写入队列中剩余的数据，超过等待时间仍未写入的数据按 spill 策略写入磁盘文件或丢弃
+
+溢出文件每行为一条 bson.json_util 格式的 JSON 数据，可以保留 datetime、ObjectId 等类型
+溢出文件的读写在线程池中执行，不会阻塞事件循环，同一时间只有一个线程读写溢出文件
+重新写入时无法解析的行（例如进程在写入溢出文件时退出留下的不完整行）会被跳过，并追加到 {spill_path}.bad 文件
+"""
+
+import asyncio
+import os
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from typing import IO, Literal
+
+from bson import json_util
+
+from kinit_fast_task.utils import log
+
+
+class BatchWriter:
+    """
+    异步批量写入
+
+    使用方式：
+        writer = BatchWriter("operation_record", insert_records, spill_path="logs/operation_record.spill")
+        await writer.put({"api_path": "/auth/user/create"})
+        await writer.close()
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[list[dict]], Awaitable[None]],
+        *,
+        max_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1,
+        overflow: Literal["drop", "spill", "block"] = "drop",
+        put_timeout: float = 0.1,
+        spill_path: str = None,
+        retry_interval: float = 30,
+    ):
+        """
+        :param name: 写入器名称，用于日志
+        :param flush: 批量写入函数，写入失败时抛出异常
+        :param max_size: 队列最大数据量
+        :param batch_size: 单次批量写入最大数据量
+        :param flush_interval: 批量写入最长等待时间（秒）
+        :param overflow: 队列满时的处理策略，drop：丢弃，spill：写入磁盘文件，block：等待队列空闲
+        :param put_timeout: block 策略最长等待时间（秒），超时后丢弃
+        :param spill_path: spill 策略溢出文件地址
+        :param retry_interval: 写入失败后，重新写入溢出文件数据的等待时间（秒）
+        """
+        if overflow == "spill" and not spill_path:
+            raise ValueError("spill 策略需要指定溢出文件地址 spill_path")
+        self.name = name
+        self.flush = flush
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.put_timeout = put_timeout
+        self.spill_path = spill_path
+        self.retry_interval = retry_interval
+        self._retry_at = 0.0
+        self._queue: asyncio.Queue[dict] | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        # 后台任务被取消时未写入的数据，关闭时按 overflow 策略处理
+        self._pending: list[dict] = []
+        self._spill_lock = asyncio.Lock()
+        self.written = 0  # 写入成功的数据量
+        self.dropped = 0  # 丢弃的数据量
+        self.spilled = 0  # 写入溢出文件的数据量
+        self.replayed = 0  # 从溢出文件重新写入的数据量
+        self.corrupted = 0  # 溢出文件中无法解析的数据量
+        self.batches = 0  # 批量写入次数
+        self.failed_batches = 0  # 批量写入失败次数
+
+    def start(self) -> None:
+        """
+        启动后台写入任务，需要在事件循环中调用，put 时未启动会自动启动
+
+        :return:
+        """
+        if self._task and not self._task.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_size)
+        self._closing = False
+        self._task = asyncio.create_task(self._run(), name=f"batch_writer:{self.name}")
+
+    async def put(self, item: dict) -> None:
+        """
+        放入队列，队列未满时立即返回
+
+        :param item: 数据
+        :return:
+        """
+        if self._closing:
+            await self._overflow([item])
+            return
+        self.start()
+        try:
+            self._queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+        if self.overflow == "block":
+            try:
+                await asyncio.wait_for(self._queue.put(item), self.put_timeout)
+                return
+            except asyncio.TimeoutError:
+                pass
+        await self._overflow([item])
+
+    async def _overflow(self, items: list[dict]) -> None:
+        """
+        无法写入的数据，spill 策略写入溢出文件，否则丢弃
+
+        :param items:
+        :return:
+        """
+        if self.overflow == "spill":
+            try:
+                async with self._spill_lock:
+                    await asyncio.to_thread(self._append_spill, items)
+                self.spilled += len(items)
+                return
+            except OSError as e:
+                log.error(f"{self.name} 批量写入：写入溢出文件失败：{e}")
+        self.dropped += len(items)
+        log.warning(f"{self.name} 批量写入：丢弃 {len(items)} 条数据，累计丢弃 {self.dropped} 条")
+
+    def _append_spill(self, items: Iterable[dict]) -> None:
+        """
+        追加写入溢出文件，在线程中执行
+
+        :param items:
+        :return:
+        """
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.writelines(f"{json_util.dumps(item)}\n" for item in items)
+
+    async def _run(self) -> None:
+        """
+        后台写入任务
+
+        :return:
+        """
+        await self._replay()
+        while True:
+            batch = await self._next_batch()
+            if batch:
+                if not await self._write(batch):
+                    await self._overflow(batch)
+            elif self._closing:
+                return
+            elif time.monotonic() >= self._retry_at:
+                # 空闲时将溢出文件重新写入数据库
+                await self._replay()
+
+    async def _next_batch(self) -> list[dict]:
+        """
+        获取下一个批次，最多等待 flush_interval 秒
+
+        :return:
+        """
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or self._closing:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+            except asyncio.CancelledError:
+                self._pending.extend(batch)
+                raise
+        return batch
+
+    async def _write(self, batch: list[dict]) -> bool:
+        """
+        批量写入，写入失败的批次由调用方处理
+
+        :param batch:
+        :return: 是否写入成功
+        """
+        self.batches += 1
+        try:
+            await self.flush(batch)
+        except asyncio.CancelledError:
+            # 关闭超时被取消时，正在写入的批次同样按 overflow 策略处理
+            self._pending.extend(batch)
+            raise
+        except Exception as e:
+            self.failed_batches += 1
+            self._retry_at = time.monotonic() + self.retry_interval
+            log.error(f"{self.name} 批量写入：写入 {len(batch)} 条数据失败：{e}")
+            return False
+        self.written += len(batch)
+        return True
+
+    async def _replay(self) -> None:
+        """
+        将溢出文件中的数据重新写入数据库
+
+        先将溢出文件重命名，重新写入期间新的溢出数据会写入新的溢出文件，
+        某个批次写入失败时停止重新写入，该批次与剩余数据重新追加到溢出文件，等待 retry_interval 秒后再次重新写入
+
+        :return:
+        """
+        if self.overflow != "spill":
+            return
+        replay_path = f"{self.spill_path}.replay"
+        async with self._spill_lock:
+            if not await asyncio.to_thread(self._prepare_replay, replay_path):
+                return
+        f = await asyncio.to_thread(open, replay_path, encoding="utf-8")
+        try:
+            while batch := await asyncio.to_thread(self._read_batch, f):
+                if not await self._write(batch):
+                    async with self._spill_lock:
+                        await asyncio.to_thread(self._append_rest, batch, f)
+                    break
+                self.replayed += len(batch)
+        finally:
+            await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.remove, replay_path)
+
+    def _prepare_replay(self, replay_path: str) -> bool:
+        """
+        将溢出文件重命名为重新写入文件，在线程中执行
+
+        上次重新写入过程中进程退出时，先重新写入遗留的文件
+
+        :param replay_path: 重新写入文件地址
+        :return: 是否有需要重新写入的文件
+        """
+        if os.path.exists(replay_path):
+            return True
+        if not os.path.exists(self.spill_path):
+            return False
+        os.replace(self.spill_path, replay_path)
+        return True
+
+    def _read_batch(self, f: IO[str]) -> list[dict]:
+        """
+        从重新写入文件中读取一个批次，在线程中执行
+
+        :param f: 重新写入文件
+        :return: 读取到文件末尾时返回空列表
+        """
+        batch = []
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                batch.append(json_util.loads(line))
+            except (ValueError, TypeError) as e:
+                self._append_bad(line)
+                log.error(f"{self.name} 批量写入：跳过溢出文件中无法解析的数据：{e}")
+            if len(batch) >= self.batch_size:
+                break
+        return batch
+
+    def _append_bad(self, line: str) -> None:
+        """
+        将无法解析的数据追加到 {spill_path}.bad 文件，在线程中执行
+
+        :param line: 无法解析的行
+        :return:
+        """
+        self.corrupted += 1
+        if not line.endswith("\n"):
+            line += "\n"
+        try:
+            with open(f"{self.spill_path}.bad", "a", encoding="utf-8") as bad:
+                bad.write(line)
+        except OSError as e:
+            log.error(f"{self.name} 批量写入：写入无法解析的数据失败：{e}")
+
+    def _append_rest(self, batch: list[dict], f: IO[str]) -> None:
+        """
+        将写入失败的批次与重新写入文件中剩余的数据追加到溢出文件，在线程中执行
+
+        :param batch: 写入失败的批次
+        :param f: 重新写入文件
+        :return:
+        """
+        self._append_spill(batch)
+        with open(self.spill_path, "a", encoding="utf-8") as spill:
+            spill.writelines(f)
+
+    async def close(self, timeout: float = 10) -> None:
+        """
+        关闭后台写入任务，等待队列中剩余的数据写入完成
+
+        :param timeout: 最长等待时间（秒），超时后剩余数据按 spill 策略写入磁盘文件或丢弃
+        :return:
+        """
+        if not self._task:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            log.error(f"{self.name} 批量写入：关闭超时，未写入的数据按 {self.overflow} 策略处理")
+        finally:
+            self._task = None
+        remaining, self._pending = self._pending, []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        if remaining:
+            await self._overflow(remaining)
+        log.info(f"{self.name} 批量写入：已关闭，{self.stats()}")
+
+    def stats(self) -> dict:
+        """
+        写入统计
+
+        :return:
+        """
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_size": self.max_size,
+            "written": self.written,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "corrupted": self.corrupted,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+        }
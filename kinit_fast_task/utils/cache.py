@@ -0,0 +1,320 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/22 09:35
+# @File           : cache.py
+# @IDE            : PyCharm
+# @Desc           : 进程内缓存
+
+"""
+进程内异步缓存工具：
+
+    LRUCache：LRU + TTL 缓存，带命中、未命中、淘汰、过期统计
+    SingleFlight：同一个键并发加载时只执行一次加载函数
+    AsyncCache：组合以上两者，未命中时单次加载并写入缓存，支持缓存 None（负缓存）
+    memoize：协程函数结果缓存装饰器
+
+进程内缓存不会在多个进程间同步，适合允许短时间不一致的数据，需要写入后立即失效的数据请使用 ORMCrud 的查询缓存
+
+性能基准测试：python -m kinit_fast_task.scripts.benchmark.cache
+"""
+
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+# 缓存未命中标识，用于区分缓存的值本身为 None 的情况
+MISSING = object()
+# SingleFlight 执行加载的请求被取消时通知等待的请求重新加载
+_RETRY = object()
+
+
+class LRUCache:
+    """
+    进程内 LRU + TTL 缓存
+
+    超过最大数量时淘汰最久未使用的数据，数据过期后在下次读取时删除
+    只在事件循环线程中使用，不需要加锁
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float | None = None):
+        """
+        :param max_size: 最大缓存数量
+        :param ttl: 默认过期时间（秒），为 None 时不过期
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float | None, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # 超过最大数量被淘汰的次数
+        self.expirations = 0  # 读取时已过期被删除的次数
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        获取缓存
+
+        :param key: 缓存键
+        :param default: 未命中时返回的值
+        :return:
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expire, value = item
+        if expire is not None and expire <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = MISSING) -> None:
+        """
+        设置缓存
+
+        :param key: 缓存键
+        :param value: 缓存值
+        :param ttl: 过期时间（秒），不传时使用默认过期时间，为 None 时不过期
+        :return:
+        """
+        ttl = self.ttl if ttl is MISSING else ttl
+        self._data[key] = (time.monotonic() + ttl if ttl is not None else None, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """
+        删除缓存
+
+        :param key: 缓存键
+        :return:
+        """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        清空缓存与统计
+
+        :return:
+        """
+        self._data.clear()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> dict:
+        """
+        缓存命中统计
+
+        :return:
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / total, 4) if total else 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    同一个键同时只执行一次加载
+
+    并发请求同一个键时，只有第一个请求执行加载函数，其他请求等待并共享该次加载的结果或异常
+
+    执行加载的请求被取消（例如客户端断开连接）时，取消不会传递给等待的请求，
+    等待的请求中的一个会重新执行加载，其他请求继续等待该次加载的结果
+    """
+
+    def __init__(self):
+        self._futures: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行加载
+
+        :param key: 加载键
+        :param loader: 加载函数
+        :return: 加载结果
+        """
+        while (future := self._futures.get(key)) is not None:
+            # 等待的请求被取消时不影响正在执行的加载
+            result = await asyncio.shield(future)
+            if result is not _RETRY:
+                return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # 没有其他请求等待时，避免事件循环提示异常未被获取
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._futures.pop(key, None)
+
+
+class AsyncCache:
+    """
+    异步读穿缓存
+
+    未命中时通过 SingleFlight 执行一次加载函数并写入缓存，加载函数抛出异常时不写入缓存
+    加载结果为 None 时，设置了 negative_ttl 才会缓存，用于避免不存在的数据反复查询数据库
+
+    创建时指定 name 会注册到 AsyncCache.instances，可以通过 AsyncCache.all_stats() 统一获取命中统计
+    """
+
+    instances: dict[str, "AsyncCache"] = {}
+
+    def __init__(
+        self,
+        name: str = None,
+        *,
+        max_size: int = 1024,
+        ttl: float | None = 60,
+        negative_ttl: float | None = None,
+    ):
+        """
+        :param name: 缓存名称
+        :param max_size: 最大缓存数量
+        :param ttl: 缓存过期时间（秒），为 None 时不过期
+        :param negative_ttl: 加载结果为 None 时的缓存过期时间（秒），为 None 时不缓存 None
+        """
+        self.name = name
+        self.negative_ttl = negative_ttl
+        self.cache = LRUCache(max_size, ttl=ttl)
+        self.single_flight = SingleFlight()
+        self.loads = 0  # 执行加载函数的次数
+        if name:
+            self.instances[name] = self
+
+    async def get(self, key: Hashable, loader: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        获取缓存，未命中时执行加载函数
+
+        加载函数的参数单独传入，命中时不需要创建闭包
+
+        :param key: 缓存键
+        :param loader: 加载函数
+        :param args: 加载函数位置参数
+        :param kwargs: 加载函数关键字参数
+        :return:
+        """
+        value = self.cache.get(key)
+        if value is not MISSING:
+            return value
+        return await self.single_flight.do(key, lambda: self.load(key, loader(*args, **kwargs)))
+
+    async def load(self, key: Hashable, awaitable: Awaitable[Any]) -> Any:
+        self.loads += 1
+        value = await awaitable
+        if value is not None:
+            self.cache.set(key, value)
+        elif self.negative_ttl is not None:
+            self.cache.set(key, None, self.negative_ttl)
+        return value
+
+    def delete(self, key: Hashable) -> None:
+        """
+        删除缓存
+
+        :param key: 缓存键
+        :return:
+        """
+        self.cache.delete(key)
+
+    def clear(self) -> None:
+        """
+        清空缓存与统计
+
+        :return:
+        """
+        self.cache.clear()
+        self.loads = 0
+
+    def stats(self) -> dict:
+        """
+        缓存命中统计
+
+        :return:
+        """
+        return self.cache.stats() | {"loads": self.loads}
+
+    @classmethod
+    def all_stats(cls) -> dict:
+        """
+        所有已注册缓存的命中统计
+
+        :return:
+        """
+        return {name: cache.stats() for name, cache in sorted(cls.instances.items())}
+
+
+def make_key(*args, **kwargs) -> Hashable:
+    """
+    默认缓存键，由位置参数与排序后的关键字参数组成，参数需要可哈希
+
+    :return:
+    """
+    if not kwargs:
+        return args
+    return args, tuple(sorted(kwargs.items()))
+
+
+def memoize(
+    *,
+    ttl: float | None = 60,
+    max_size: int = 256,
+    negative_ttl: float | None = None,
+    key: Callable[..., Hashable] = make_key,
+    name: str = None,
+) -> Callable:
+    """
+    协程函数结果缓存装饰器
+
+    缓存对象可以通过被装饰函数的 cache 属性访问，用于获取统计或清空缓存
+
+    装饰实例方法时，默认缓存键包含 self，每次创建新实例（例如每个请求创建的 Service）都不会命中，
+    需要通过 key 指定不包含 self 的缓存键，例如：@memoize(ttl=60, key=lambda self: "recent_users_count")
+
+    :param ttl: 缓存过期时间（秒），为 None 时不过期
+    :param max_size: 最大缓存数量
+    :param negative_ttl: 返回 None 时的缓存过期时间（秒），为 None 时不缓存 None
+    :param key: 缓存键函数，接收与被装饰函数相同的参数
+    :param name: 缓存名称，默认使用函数的模块与限定名
+    :return:
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        cache = AsyncCache(
+            name or f"{func.__module__}.{func.__qualname__}", max_size=max_size, ttl=ttl, negative_ttl=negative_ttl
+        )
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await cache.get(key(*args, **kwargs), func, *args, **kwargs)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -11,29 +11,41 @@ from redis.asyncio.client import Redis
 class Count:
     """
     redis 计数
+
+    增加与减少使用 INCRBY 原子操作，并发调用不会丢失计数
+    需要设置过期时间时与 EXPIRE 通过 MULTI/EXEC pipeline 在一次往返中发送
     """
 
     def __init__(self, rd: Redis, key):
         self.rd = rd
         self.key = key
 
-    async def add(self, ex: int = None) -> int:
+    async def add(self, ex: int = None, amount: int = 1) -> int:
         """
         增加
-        :param ex:
+        :param ex: 过期时间（秒），不传时保留原有的过期时间
+        :param amount: 增加数量
         :return: 总数
         """
-        await self.rd.set(self.key, await self.get_count() + 1, ex=ex)
-        return await self.get_count()
+        return await self._incr(amount, ex)
 
-    async def subtract(self, ex: int = None) -> int:
+    async def subtract(self, ex: int = None, amount: int = 1) -> int:
         """
         减少
-        :param ex:
-        :return:
+        :param ex: 过期时间（秒），不传时保留原有的过期时间
+        :param amount: 减少数量
+        :return: 总数
         """
-        await self.rd.set(self.key, await self.get_count() - 1, ex=ex)
-        return await self.get_count()
+        return await self._incr(-amount, ex)
+
+    async def _incr(self, amount: int, ex: int = None) -> int:
+        if ex is None:
+            return await self.rd.incrby(self.key, amount)
+        async with self.rd.pipeline(transaction=True) as pipe:
+            pipe.incrby(self.key, amount)
+            pipe.expire(self.key, ex)
+            number, _ = await pipe.execute()
+        return number
 
     async def get_count(self) -> int:
         """
@@ -0,0 +1,198 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/18 10:12
+# @File           : export.py
+# @IDE            : PyCharm
+# @Desc           : 流式导出数据
+
+import asyncio
+import csv
+import datetime
+import io
+import os
+import tempfile
+from collections.abc import AsyncIterable, AsyncIterator
+from enum import Enum
+from typing import Any
+from urllib.parse import quote
+
+import orjson
+import xlsxwriter
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from kinit_fast_task.utils.response import orjson_default
+
+
+class ExportFormat(str, Enum):
+    """
+    导出文件格式
+    """
+
+    NDJSON = "ndjson"
+    CSV = "csv"
+    XLSX = "xlsx"
+
+
+class StreamExport:
+    """
+    流式导出数据
+
+    边读取数据边输出文件内容，配合 ORMCrud.stream_datas 使用时内存占用与数据总量无关
+
+    XLSX 为 zip 格式无法边写边输出，使用 xlsxwriter constant_memory 模式逐行写入临时文件，写入完成后再分块输出，
+    constant_memory 模式每写入一行都会写入磁盘，所以每 xlsx_chunk_size 行在线程中批量写入一次，不阻塞事件循环
+    """
+
+    media_types = {
+        ExportFormat.NDJSON: "application/x-ndjson",
+        ExportFormat.CSV: "text/csv; charset=utf-8",
+        ExportFormat.XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    }
+    # XLSX 单个工作表最大行数
+    xlsx_max_rows = 1048576
+
+    def __init__(
+        self,
+        schema: type[BaseModel],
+        *,
+        filename: str,
+        export_format: ExportFormat = ExportFormat.CSV,
+        buffer_size: int = 64 * 1024,
+        xlsx_chunk_size: int = 1000,
+    ):
+        """
+        :param schema: 导出数据使用的序列化对象，导出字段与字段顺序与 schema 保持一致，表头使用字段 description
+        :param filename: 导出文件名称，不需要包含后缀
+        :param export_format: 导出文件格式
+        :param buffer_size: 输出缓冲区大小，缓冲区满后才会输出一次，避免逐行输出
+        :param xlsx_chunk_size: XLSX 每批写入行数，与 ORMCrud.stream_datas 的 v_yield_per 一致时每次读取的数据写入一次
+        """
+        self.fields = list(schema.model_fields)
+        self.headers = [field.description or name for name, field in schema.model_fields.items()]
+        self.filename = f"{filename}.{export_format.value}"
+        self.export_format = export_format
+        self.buffer_size = buffer_size
+        self.xlsx_chunk_size = xlsx_chunk_size
+
+    def response(self, datas: AsyncIterable[dict]) -> StreamingResponse:
+        """
+        返回流式响应
+
+        :param datas: 字典数据异步迭代器
+        :return:
+        """
+        if self.export_format == ExportFormat.NDJSON:
+            content = self.iter_ndjson(datas)
+        elif self.export_format == ExportFormat.CSV:
+            content = self.iter_csv(datas)
+        else:
+            content = self.iter_xlsx(datas)
+        headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(self.filename)}"}
+        return StreamingResponse(content, media_type=self.media_types[self.export_format], headers=headers)
+
+    async def iter_ndjson(self, datas: AsyncIterable[dict]) -> AsyncIterator[bytes]:
+        """
+        每行输出一条 JSON 数据
+
+        :param datas: 字典数据异步迭代器
+        :return:
+        """
+        buffer = bytearray()
+        async for data in datas:
+            buffer += orjson.dumps({field: data.get(field) for field in self.fields}, default=orjson_default)
+            buffer += b"\n"
+            if len(buffer) >= self.buffer_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    async def iter_csv(self, datas: AsyncIterable[dict]) -> AsyncIterator[bytes]:
+        """
+        输出 CSV 数据，带有 BOM 头，Excel 打开时中文不会乱码
+
+        :param datas: 字典数据异步迭代器
+        :return:
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write("\ufeff")
+        writer.writerow(self.headers)
+        async for data in datas:
+            writer.writerow([self.cell_value(data.get(field)) for field in self.fields])
+            if buffer.tell() >= self.buffer_size:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    async def iter_xlsx(self, datas: AsyncIterable[dict]) -> AsyncIterator[bytes]:
+        """
+        输出 XLSX 数据，超出单个工作表最大行数时自动写入新的工作表
+
+        :param datas: 字典数据异步迭代器
+        :return:
+        """
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+            rows, row = [], self.xlsx_max_rows
+            async for data in datas:
+                rows.append([self.cell_value(data.get(field)) for field in self.fields])
+                if len(rows) >= self.xlsx_chunk_size:
+                    row = await asyncio.to_thread(self.write_xlsx_rows, workbook, rows, row)
+                    rows = []
+            if rows:
+                await asyncio.to_thread(self.write_xlsx_rows, workbook, rows, row)
+            await asyncio.to_thread(self.close_xlsx, workbook)
+
+            file = await asyncio.to_thread(open, path, "rb")
+            try:
+                while chunk := await asyncio.to_thread(file.read, self.buffer_size):
+                    yield chunk
+            finally:
+                await asyncio.to_thread(file.close)
+        finally:
+            await asyncio.to_thread(os.remove, path)
+
+    def write_xlsx_rows(self, workbook: xlsxwriter.Workbook, rows: list[list], row: int) -> int:
+        """
+        写入一批 XLSX 数据，超出单个工作表最大行数时自动写入新的工作表，在线程中执行
+
+        :param workbook: 工作簿
+        :param rows: 一批数据
+        :param row: 当前工作表下一行行号
+        :return: 写入后当前工作表下一行行号
+        """
+        for values in rows:
+            if row >= self.xlsx_max_rows:
+                workbook.add_worksheet().write_row(0, 0, self.headers)
+                row = 1
+            workbook.worksheets()[-1].write_row(row, 0, values)
+            row += 1
+        return row
+
+    def close_xlsx(self, workbook: xlsxwriter.Workbook) -> None:
+        """
+        保存工作簿，没有数据时只写入表头，在线程中执行
+
+        :param workbook: 工作簿
+        :return:
+        """
+        if not workbook.worksheets():
+            workbook.add_worksheet().write_row(0, 0, self.headers)
+        workbook.close()
+
+    @staticmethod
+    def cell_value(value: Any) -> Any:
+        """
+        将无法直接写入单元格的数据转为字符串
+
+        :param value:
+        :return:
+        """
+        if value is None or isinstance(value, str | int | float | bool | datetime.date):
+            return value
+        return orjson.dumps(value, default=orjson_default).decode()
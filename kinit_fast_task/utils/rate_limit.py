@@ -0,0 +1,234 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/26 10:18
+# @File           : rate_limit.py
+# @IDE            : PyCharm
+# @Desc           : Redis 限流
+
+"""
+基于 Redis Lua 脚本的限流，每次判断只需要一次 Redis 往返，脚本在 Redis 中原子执行，多个进程共享同一个限流计数
+
+    SlidingWindowLimiter：滑动窗口，任意 window 秒内最多 limit 次请求，使用有序集合记录窗口内每次请求的时间
+    TokenBucketLimiter：令牌桶，桶容量为 limit，每 window 秒补充 limit 个令牌，允许短时间突发 limit 次请求
+
+时间使用 Redis 服务器时间，不受各个应用服务器时钟偏差影响
+
+Redis 不可用时不限流，只输出警告日志，避免 Redis 故障导致所有接口不可用
+
+使用方式：
+    1. 接口依赖，在路由中判断，可以使用路由路径作为限流键：
+        @router.get("/list/query", dependencies=[Depends(RateLimit(SlidingWindowLimiter(limit=10, window=1)))])
+    2. 全局中间件，在路由之前判断，见 SystemSettings.RATE_LIMIT_ENABLE
+"""
+
+import math
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from typing import Literal, NamedTuple
+
+from fastapi import Request
+from redis import RedisError
+from redis.commands.core import AsyncScript
+
+from kinit_fast_task.core import CustomException
+from kinit_fast_task.db import DBFactory
+from kinit_fast_task.utils import log
+from kinit_fast_task.utils.response_code import Status
+
+
+class RateLimitResult(NamedTuple):
+    """
+    限流判断结果
+    """
+
+    allowed: bool  # 是否允许本次请求
+    remaining: int  # 剩余可请求次数
+    retry_after: float  # 被限流时，距离下一次可以请求的时间（秒）
+
+
+class RateLimiter(ABC):
+    """
+    限流器基类
+    """
+
+    # 限流方式名称，用于区分 Redis 键
+    name: str
+    # Lua 脚本，返回 {是否允许, 剩余次数, 重试等待毫秒数}
+    script: str
+
+    def __init__(self, *, limit: int, window: float, prefix: str = "rate_limit"):
+        """
+        :param limit: 窗口时间内允许的请求次数
+        :param window: 窗口时间（秒）
+        :param prefix: Redis 键前缀
+        """
+        self.limit = limit
+        self.window = window
+        # 不同限流方式与配置使用不同的键，相同配置的限流器共享计数
+        self.prefix = f"{prefix}:{self.name}:{limit}/{window}"
+        self._script: AsyncScript | None = None
+
+    @abstractmethod
+    def script_args(self) -> list:
+        """
+        Lua 脚本参数
+
+        :return:
+        """
+
+    async def hit(self, key: str) -> RateLimitResult:
+        """
+        记录一次请求并判断是否允许
+
+        :param key: 限流键，例如客户端 IP 或路由
+        :return:
+        """
+        rd = DBFactory.get_instance("redis").db_getter()
+        if self._script is None:
+            # Script 对象缓存脚本的 SHA1，执行时使用 EVALSHA，Redis 中不存在脚本时自动 SCRIPT LOAD
+            self._script = rd.register_script(self.script)
+        try:
+            allowed, remaining, retry_after = await self._script(
+                keys=[f"{self.prefix}:{key}"], args=self.script_args(), client=rd
+            )
+        except RedisError as e:
+            log.warning(f"限流判断失败，本次请求不限流：{e}")
+            return RateLimitResult(True, self.limit, 0)
+        return RateLimitResult(bool(allowed), remaining, retry_after / 1000)
+
+
+class SlidingWindowLimiter(RateLimiter):
+    """
+    滑动窗口限流
+
+    有序集合中每个成员为一次请求，分数为请求时间，每次请求先删除窗口之外的成员，再判断窗口内的请求数量，
+    被限流的请求不会记录，内存占用与 limit 成正比，适合 limit 较小的接口级限流
+    """
+
+    name = "sliding_window"
+    script = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local window = tonumber(ARGV[1])
+    local limit = tonumber(ARGV[2])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+    local count = redis.call('ZCARD', KEYS[1])
+    if count < limit then
+        redis.call('ZADD', KEYS[1], now, ARGV[3])
+        redis.call('PEXPIRE', KEYS[1], window)
+        return {1, limit - count - 1, 0}
+    end
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return {0, 0, tonumber(oldest[2]) + window - now}
+    """
+
+    def script_args(self) -> list:
+        return [int(self.window * 1000), self.limit, uuid.uuid4().hex]
+
+
+class TokenBucketLimiter(RateLimiter):
+    """
+    令牌桶限流
+
+    使用 Hash 记录剩余令牌数与上次补充时间，每次请求按经过的时间补充令牌，
+    每个限流键只占用一个固定大小的 Hash，适合 limit 较大或允许突发请求的场景
+    """
+
+    name = "token_bucket"
+    script = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        retry_after = math.ceil((1 - tokens) / rate)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate))
+    return {allowed, math.floor(tokens), retry_after}
+    """
+
+    def script_args(self) -> list:
+        # 每毫秒补充的令牌数
+        return [self.limit, repr(self.limit / (self.window * 1000))]
+
+
+def create_rate_limiter(
+    strategy: Literal["sliding_window", "token_bucket"], *, limit: int, window: float, prefix: str = "rate_limit"
+) -> RateLimiter:
+    """
+    创建限流器
+
+    :param strategy: 限流方式，sliding_window：滑动窗口，token_bucket：令牌桶
+    :param limit: 窗口时间内允许的请求次数
+    :param window: 窗口时间（秒）
+    :param prefix: Redis 键前缀
+    :return:
+    """
+    if strategy == "sliding_window":
+        return SlidingWindowLimiter(limit=limit, window=window, prefix=prefix)
+    elif strategy == "token_bucket":
+        return TokenBucketLimiter(limit=limit, window=window, prefix=prefix)
+    raise ValueError(f"不存在的限流方式: {strategy}")
+
+
+def rate_limit_key(request: Request, key: Literal["ip", "route", "ip_route"]) -> str:
+    """
+    获取限流键
+
+    已匹配路由时使用路由路径，例如 /auth/user/{data_id}，否则使用请求路径
+
+    :param request:
+    :param key: ip：按客户端 IP 限流，route：按路由限流，ip_route：按客户端 IP 与路由限流
+    :return:
+    """
+    ip = request.client.host if request.client else "unknown"
+    if key == "ip":
+        return f"ip:{ip}"
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or request.url.path
+    if key == "route":
+        return f"route:{request.method}:{path}"
+    return f"ip_route:{ip}:{request.method}:{path}"
+
+
+class RateLimit:
+    """
+    限流接口依赖
+
+    被限流时返回 HTTP 429 状态码，并通过 Retry-After 响应头告知客户端可以重试的时间
+    """
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        *,
+        key: Literal["ip", "route", "ip_route"] | Callable[[Request], str] = "ip_route",
+    ):
+        """
+        :param limiter: 限流器
+        :param key: 限流键，可选值见 rate_limit_key，也可以传入根据请求返回限流键的函数
+        """
+        self.limiter = limiter
+        self.key = key
+
+    async def __call__(self, request: Request) -> None:
+        key = self.key(request) if callable(self.key) else rate_limit_key(request, self.key)
+        result = await self.limiter.hit(key)
+        if not result.allowed:
+            raise CustomException(
+                "请求过于频繁，请稍后再试",
+                code=Status.HTTP_429,
+                status_code=Status.HTTP_429,
+                headers={"Retry-After": str(math.ceil(result.retry_after))},
+                desc=f"限流键：{key}",
+            )
@@ -5,9 +5,10 @@
 # @Desc           : 全局响应
 
 
+import orjson
 from pydantic import BaseModel, Field
 from kinit_fast_task.utils.response_code import Status
-from typing import Generic, TypeVar
+from typing import Any, Generic, TypeVar
 from fastapi import status as fastapi_status
 from fastapi.responses import ORJSONResponse
 
@@ -34,6 +35,15 @@ class PageResponseSchema(ResponseSchema):
     limit: int = Field(10, description="每页多少条数据")
 
 
+class CursorPageResponseSchema(ResponseSchema):
+    """
+    带有游标分页的响应模型
+    """
+
+    next_cursor: str | None = Field(None, description="下一页游标，为空说明已经是最后一页")
+    limit: int = Field(10, description="每页多少条数据")
+
+
 class ErrorResponseSchema(BaseModel, Generic[DataT]):
     """
     默认请求失败响应模型
@@ -47,6 +57,31 @@ class ErrorResponseSchema(BaseModel, Generic[DataT]):
 ResponseSchemaT = TypeVar("ResponseSchemaT", bound=ResponseSchema)
 
 
+def orjson_default(obj: Any) -> Any:
+    """
+    orjson 无法直接序列化的类型处理
+
+    :param obj:
+    :return:
+    """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class SchemaORJSONResponse(ORJSONResponse):
+    """
+    支持直接序列化 Pydantic Schema 对象的 ORJSONResponse
+
+    响应内容不再需要先通过 ResponseSchema 验证并 model_dump 一遍，orjson 遇到 Pydantic 对象时才会调用 model_dump
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
+
 class RestfulResponse:
     """
     响应体
@@ -60,7 +95,7 @@ class RestfulResponse:
         data: DataT = None,
         status_code: int = fastapi_status.HTTP_200_OK,
         **kwargs,
-    ) -> ORJSONResponse:
+    ) -> SchemaORJSONResponse:
         """
         成功响应
 
@@ -71,9 +106,8 @@ class RestfulResponse:
         :param kwargs: 额外参数
         :return:
         """
-        content = ResponseSchema(code=code, message=message, data=data)
-        content = content.model_dump() | kwargs
-        return ORJSONResponse(content=content, status_code=status_code)
+        content = {"code": code, "message": message, "data": data} | kwargs
+        return SchemaORJSONResponse(content=content, status_code=status_code)
 
     @staticmethod
     def error(
@@ -83,7 +117,7 @@ class RestfulResponse:
         data: DataT = None,
         status_code: int = fastapi_status.HTTP_200_OK,
         **kwargs,
-    ) -> ORJSONResponse:
+    ) -> SchemaORJSONResponse:
         """
         失败响应
 
@@ -93,6 +127,5 @@ class RestfulResponse:
         :param status_code: HTTP 响应状态码
         :return:
         """
-        content = ErrorResponseSchema(code=code, message=message, data=data)
-        content = content.model_dump() | kwargs
-        return ORJSONResponse(content=content, status_code=status_code)
+        content = {"code": code, "message": message, "data": data} | kwargs
+        return SchemaORJSONResponse(content=content, status_code=status_code)
@@ -37,6 +37,8 @@ class Status:
     HTTP_404 = 404  # NOT_FOUND: 未找到
     HTTP_405 = 405  # METHOD_NOT_ALLOWED: 方法不允许
     HTTP_408 = 408  # REQUEST_TIMEOUT: 请求超时
+    HTTP_409 = 409  # CONFLICT: 请求与当前资源状态冲突
+    HTTP_429 = 429  # TOO_MANY_REQUESTS: 请求过于频繁
     HTTP_500 = 500  # INTERNAL_SERVER_ERROR: 服务器内部错误
     HTTP_502 = 502  # BAD_GATEWAY: 错误的网关
     HTTP_503 = 503  # SERVICE_UNAVAILABLE: 服务不可用
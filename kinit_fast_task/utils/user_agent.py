@@ -0,0 +1,36 @@
+# @Version        : 1.0
+# @Create Time    : 2024/12/02 09:44
+# @File           : user_agent.py
+# @IDE            : PyCharm
+# @Desc           : User-Agent 解析
+
+"""
+user_agents.parse 每次解析都需要执行几十个正则表达式，而实际请求中不同的 User-Agent 数量很少，
+所以按 User-Agent 字符串缓存解析结果，缓存命中统计见 GET /system/db/cache 中的 user_agent
+"""
+
+from user_agents import parse
+
+from kinit_fast_task.utils.cache import MISSING, LRUCache
+
+# User-Agent 字符串 -> (客户端系统, 客户端浏览器)
+user_agent_cache = LRUCache(max_size=1024)
+
+
+def parse_user_agent(user_agent: str | None) -> tuple[str, str]:
+    """
+    解析 User-Agent，获取客户端系统与浏览器
+
+    :param user_agent: User-Agent 请求头
+    :return: (客户端系统, 客户端浏览器)，例如 ("Windows 10", "Chrome 120.0.0")
+    """
+    user_agent = user_agent or ""
+    result = user_agent_cache.get(user_agent)
+    if result is MISSING:
+        parsed = parse(user_agent)
+        result = (
+            f"{parsed.os.family} {parsed.os.version_string}",
+            f"{parsed.browser.family} {parsed.browser.version_string}",
+        )
+        user_agent_cache.set(user_agent, result)
+    return result
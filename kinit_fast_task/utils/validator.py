@@ -64,6 +64,9 @@ def datetime_str_vali(value: str | datetime.datetime | int | float | dict):
         except ValueError:
             pass
     elif isinstance(value, datetime.datetime):
+        if value.tzinfo is None and value.year >= 1000:
+            # 与 strftime("%Y-%m-%d %H:%M:%S") 结果相同，但速度快很多，列表接口每行都会调用
+            return value.isoformat(sep=" ", timespec="seconds")
         return value.strftime("%Y-%m-%d %H:%M:%S")
     elif isinstance(value, dict):
         # 用于处理 mongodb 日期时间数据类型
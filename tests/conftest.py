@@ -20,3 +20,27 @@ def resource_setup():
 @pytest.fixture(scope="session")
 def session_resource_setup():
     yield
+
+
+@pytest.fixture(scope="function")
+def fake_redis(monkeypatch):
+    """
+    使用 fakeredis 替代 Redis 数据库，DBFactory.get_instance("redis") 返回使用 fakeredis 客户端的 RedisDatabase
+
+    安装：poetry add --group dev fakeredis[lua]
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+    from kinit_fast_task.config import settings
+    from kinit_fast_task.db import DBFactory
+    from kinit_fast_task.db.redis.asyncio import RedisDatabase
+    from kinit_fast_task.db.redis.pipeline import AutoPipeline
+
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    database = RedisDatabase()
+    database._client = client
+    database._auto_pipeline = AutoPipeline(client)
+    monkeypatch.setitem(DBFactory._config_loader, "redis-default", database)
+    monkeypatch.setattr(settings.db, "REDIS_DB_ENABLE", True)
+    return client
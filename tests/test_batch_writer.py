@@ -0,0 +1,176 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/28 16:05
+# @File           : test_batch_writer.py
+# @IDE            : PyCharm
+# @Desc           : 异步批量写入
+
+import asyncio
+import datetime
+
+from kinit_fast_task.utils.batch_writer import BatchWriter
+
+
+class Sink:
+    """
+    记录写入数据的批量写入函数，可以模拟数据库变慢或不可用
+    """
+
+    def __init__(self, *, delay: float = 0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.batches: list[list[dict]] = []
+
+    async def __call__(self, batch: list[dict]) -> None:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        self.batches.append(batch)
+
+    @property
+    def items(self) -> list[dict]:
+        return [item for batch in self.batches for item in batch]
+
+
+def test_batch_writer_batches():
+    async def main():
+        sink = Sink()
+        writer = BatchWriter("test", sink, batch_size=10, flush_interval=0.05)
+        for i in range(25):
+            await writer.put({"i": i})
+        await asyncio.sleep(0.2)
+        assert [len(batch) for batch in sink.batches] == [10, 10, 5]
+        await writer.close()
+
+    asyncio.run(main())
+
+
+def test_batch_writer_close_drains_queue():
+    async def main():
+        sink = Sink()
+        writer = BatchWriter("test", sink, batch_size=100, flush_interval=10)
+        for i in range(7):
+            await writer.put({"i": i})
+        await writer.close(timeout=1)
+        assert sink.items == [{"i": i} for i in range(7)]
+
+    asyncio.run(main())
+
+
+def test_batch_writer_overflow_drop():
+    async def main():
+        sink = Sink(delay=0.2)
+        writer = BatchWriter("test", sink, max_size=5, batch_size=5, flush_interval=0.01)
+        for i in range(20):
+            await writer.put({"i": i})
+        await writer.close()
+        stats = writer.stats()
+        assert stats["dropped"] > 0
+        assert stats["written"] + stats["dropped"] == 20
+
+    asyncio.run(main())
+
+
+def test_batch_writer_overflow_block():
+    async def main():
+        sink = Sink(delay=0.01)
+        writer = BatchWriter(
+            "test", sink, max_size=2, batch_size=2, flush_interval=0.01, overflow="block", put_timeout=1
+        )
+        for i in range(10):
+            await writer.put({"i": i})
+        await writer.close()
+        assert writer.stats()["dropped"] == 0
+        assert sink.items == [{"i": i} for i in range(10)]
+
+    asyncio.run(main())
+
+
+def test_batch_writer_overflow_block_timeout():
+    async def main():
+        sink = Sink(delay=1)
+        writer = BatchWriter(
+            "test", sink, max_size=1, batch_size=1, flush_interval=0.01, overflow="block", put_timeout=0.01
+        )
+        for i in range(5):
+            await writer.put({"i": i})
+        assert writer.stats()["dropped"] > 0
+        await writer.close(timeout=0.01)
+
+    asyncio.run(main())
+
+
+def test_batch_writer_overflow_spill_and_replay(tmp_path):
+    spill_path = tmp_path / "records.spill"
+
+    async def main():
+        sink = Sink(fail=True)
+        writer = BatchWriter(
+            "test",
+            sink,
+            max_size=5,
+            batch_size=5,
+            flush_interval=0.01,
+            overflow="spill",
+            spill_path=str(spill_path),
+            retry_interval=0.1,
+        )
+        now = datetime.datetime(2026, 10, 17, 12, 0, 0)
+        for i in range(12):
+            await writer.put({"i": i, "create_datetime": now})
+        await asyncio.sleep(0.05)
+        assert writer.stats()["spilled"] == 12
+        assert len(spill_path.read_text(encoding="utf-8").splitlines()) == 12
+
+        # 数据库恢复后，空闲时重新写入溢出文件中的数据
+        sink.fail = False
+        await asyncio.sleep(0.3)
+        assert not spill_path.exists()
+        assert sorted(item["i"] for item in sink.items) == list(range(12))
+        assert all(item["create_datetime"] == now for item in sink.items)
+        assert writer.stats()["replayed"] == 12
+        await writer.close()
+
+    asyncio.run(main())
+
+
+def test_batch_writer_close_timeout_spills(tmp_path):
+    spill_path = tmp_path / "records.spill"
+
+    async def main():
+        sink = Sink(delay=10)
+        writer = BatchWriter(
+            "test", sink, batch_size=2, flush_interval=0.01, overflow="spill", spill_path=str(spill_path)
+        )
+        for i in range(5):
+            await writer.put({"i": i})
+        await asyncio.sleep(0.05)
+        await writer.close(timeout=0.05)
+        # 正在写入的批次与队列中剩余的数据都写入溢出文件
+        assert writer.stats()["spilled"] == 5
+        assert len(spill_path.read_text(encoding="utf-8").splitlines()) == 5
+
+    asyncio.run(main())
+
+
+def test_batch_writer_replay_skips_corrupt_line(tmp_path):
+    spill_path = tmp_path / "records.spill"
+    # 上次重新写入过程中进程退出，遗留的重新写入文件中有一行不完整的数据
+    replay_path = tmp_path / "records.spill.replay"
+    replay_path.write_text('{"i": 0}\n{"i": 1}\n{"i": \n{"i": 2}\n', encoding="utf-8")
+
+    async def main():
+        sink = Sink()
+        writer = BatchWriter(
+            "test", sink, batch_size=2, flush_interval=0.01, overflow="spill", spill_path=str(spill_path)
+        )
+        await writer.put({"i": 3})
+        await asyncio.sleep(0.2)
+        assert sorted(item["i"] for item in sink.items) == [0, 1, 2, 3]
+        assert not replay_path.exists()
+        assert (tmp_path / "records.spill.bad").read_text(encoding="utf-8") == '{"i": \n'
+        assert writer.stats()["replayed"] == 3
+        assert writer.stats()["corrupted"] == 1
+        await writer.close()
+
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/12 10:26
+# @File           : test_cursor.py
+# @IDE            : PyCharm
+# @Desc           : 游标分页游标编码与解析
+
+import datetime
+
+import pytest
+
+from kinit_fast_task.app.cruds.base.orm import ORMCrud
+from kinit_fast_task.app.models.auth_user_model import AuthUserModel
+from kinit_fast_task.core import CustomException
+
+
+@pytest.mark.parametrize("value", [None, 10, "kinit", 1.5])
+def test_cursor_round_trip(value):
+    cursor = ORMCrud.encode_cursor(value, 42)
+    assert ORMCrud.decode_cursor(cursor) == (value, 42)
+
+
+def test_cursor_round_trip_datetime():
+    value = datetime.datetime(2026, 10, 17, 12, 30, 15, 123456)
+    cursor = ORMCrud.encode_cursor(value, 7)
+    assert ORMCrud.decode_cursor(cursor, AuthUserModel.create_datetime) == (value, 7)
+
+
+def test_cursor_is_url_safe():
+    cursor = ORMCrud.encode_cursor("?/+=" * 10, 1)
+    assert all(char.isalnum() or char in "-_=" for char in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", ORMCrud.encode_cursor("x", 1)[:-4] + "!!!!"])
+def test_cursor_invalid(cursor):
+    with pytest.raises(CustomException):
+        ORMCrud.decode_cursor(cursor)
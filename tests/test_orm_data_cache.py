@@ -0,0 +1,114 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/22 16:47
+# @File           : test_orm_data_cache.py
+# @IDE            : PyCharm
+# @Desc           : ORM 单条数据读缓存
+
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.util import greenlet_spawn
+
+from kinit_fast_task.app.cruds.base.cache import ORMDataCache
+from kinit_fast_task.app.cruds.auth_user_crud import AuthUserCRUD
+from kinit_fast_task.app.cruds.base.orm import ReturnType
+from kinit_fast_task.app.models.auth_user_model import AuthUserModel
+from kinit_fast_task.core import CustomException
+
+
+class UserSchema(BaseModel):
+    id: int
+    name: str
+
+
+def test_data_cache_fill(fake_redis):
+    async def main():
+        cache = ORMDataCache()
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            return {"id": 1, "name": "kinit"}, True
+
+        assert await cache.get("auth_user", 1, UserSchema, loader) == {"id": 1, "name": "kinit"}
+        cache.local.clear()
+        assert await cache.get("auth_user", 1, UserSchema, loader) == {"id": 1, "name": "kinit"}
+        assert len(calls) == 1
+        assert await fake_redis.hget(cache.redis_key("auth_user", 1), cache.schema_key(UserSchema))
+
+    asyncio.run(main())
+
+
+def test_data_cache_skip_not_cacheable(fake_redis):
+    async def main():
+        cache = ORMDataCache()
+
+        async def loader():
+            # 例如从只读副本查询的数据
+            return {"id": 1, "name": "replica"}, False
+
+        assert await cache.get("auth_user", 1, UserSchema, loader) == {"id": 1, "name": "replica"}
+        assert not await fake_redis.exists(cache.redis_key("auth_user", 1))
+        assert len(cache.local) == 0
+
+    asyncio.run(main())
+
+
+def test_data_cache_invalidate_during_load(fake_redis):
+    async def main():
+        cache = ORMDataCache()
+
+        async def stale_loader():
+            # 查询到旧数据之后、写入缓存之前，其他会话修改数据并提交
+            data = {"id": 1, "name": "old"}
+            await greenlet_spawn(cache.invalidate, [("auth_user", 1)])
+            return data, True
+
+        assert await cache.get("auth_user", 1, UserSchema, stale_loader) == {"id": 1, "name": "old"}
+        assert not await fake_redis.exists(cache.redis_key("auth_user", 1))
+        assert len(cache.local) == 0
+
+        async def loader():
+            return {"id": 1, "name": "new"}, True
+
+        assert await cache.get("auth_user", 1, UserSchema, loader) == {"id": 1, "name": "new"}
+        cache.local.clear()
+        assert await cache.get("auth_user", 1, UserSchema, stale_loader) == {"id": 1, "name": "new"}
+
+    asyncio.run(main())
+
+
+def test_data_cache_local_invalidate_during_load(monkeypatch):
+    monkeypatch.setattr(ORMDataCache, "redis_enabled", False)
+
+    async def main():
+        cache = ORMDataCache()
+
+        async def stale_loader():
+            data = {"id": 1, "name": "old"}
+            cache.invalidate([("auth_user", 1)])
+            return data, True
+
+        await cache.get("auth_user", 1, UserSchema, stale_loader)
+        assert len(cache.local) == 0
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"v_start_sql": select(AuthUserModel)},
+        {"v_where": [AuthUserModel.id == 1]},
+        {"v_join": [AuthUserModel.roles]},
+    ],
+)
+def test_get_data_cache_reject_sql(kwargs):
+    async def main():
+        crud = AuthUserCRUD(None)
+        with pytest.raises(CustomException):
+            await crud.get_data(1, v_cache=True, v_return_type=ReturnType.DICT, **kwargs)
+
+    asyncio.run(main())
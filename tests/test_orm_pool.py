@@ -0,0 +1,51 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/20 16:12
+# @File           : test_orm_pool.py
+# @IDE            : PyCharm
+# @Desc           : 可观测的数据库连接池
+
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.pool import Pool, QueuePool
+from sqlalchemy.util import greenlet_spawn
+
+from kinit_fast_task.db.orm.pool import MetricsQueuePool
+
+
+def create_pool(**kwargs) -> MetricsQueuePool:
+    return MetricsQueuePool(lambda: sqlite3.connect(":memory:", check_same_thread=False), **kwargs)
+
+
+def test_pool_private_hooks():
+    # MetricsQueuePool 重写了 SQLAlchemy 连接池的内部方法，升级 SQLAlchemy 后内部方法被重命名时需要同步修改
+    assert "_do_get" in QueuePool.__dict__
+    assert "_create_connection" in Pool.__dict__
+    assert create_pool(pool_size=2, max_overflow=3)._max_overflow == 3
+
+
+def test_pool_metrics():
+    pool = create_pool(pool_size=1, max_overflow=1, timeout=0.01)
+
+    def run():
+        first = pool.connect()
+        second = pool.connect()
+        with pytest.raises(exc.TimeoutError):
+            pool.connect()
+        second.close()
+        first.close()
+
+    asyncio.run(greenlet_spawn(run))
+    status = pool.status_dict()
+    assert status["pool_size"] == 1
+    assert status["max_overflow"] == 1
+    assert status["checked_out"] == 0
+    metrics = status["metrics"]
+    assert metrics["checkouts"] == 2
+    assert metrics["connects"] == 2
+    assert metrics["checkout_timeouts"] == 1
+    assert metrics["overflow_checkouts"] == 1
+    assert metrics["overflow_peak"] == 1
+    assert metrics["hold_time_max_ms"] > 0
@@ -0,0 +1,55 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/26 11:02
+# @File           : test_rate_limit.py
+# @IDE            : PyCharm
+# @Desc           : Redis 限流
+
+import asyncio
+
+import pytest
+from fastapi import Request
+
+from kinit_fast_task.core import CustomException
+from kinit_fast_task.utils.rate_limit import RateLimit, SlidingWindowLimiter, TokenBucketLimiter
+
+
+def make_request(ip: str = "127.0.0.1") -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/test", "headers": [], "client": (ip, 50000)})
+
+
+@pytest.mark.parametrize("limiter_class", [SlidingWindowLimiter, TokenBucketLimiter])
+def test_rate_limit_allow_then_deny(fake_redis, limiter_class):
+    async def main():
+        limiter = limiter_class(limit=3, window=60)
+        results = [await limiter.hit("client") for _ in range(4)]
+        assert [result.allowed for result in results] == [True, True, True, False]
+        assert [result.remaining for result in results[:3]] == [2, 1, 0]
+        assert results[3].retry_after > 0
+        # 不同的限流键分别计数
+        assert (await limiter.hit("other")).allowed
+
+    asyncio.run(main())
+
+
+def test_rate_limit_dependency(fake_redis):
+    async def main():
+        dependency = RateLimit(SlidingWindowLimiter(limit=1, window=60), key="ip")
+        await dependency(make_request())
+        with pytest.raises(CustomException) as exc_info:
+            await dependency(make_request())
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.code == 429
+        assert int(exc_info.value.headers["Retry-After"]) > 0
+        await dependency(make_request("127.0.0.2"))
+
+    asyncio.run(main())
+
+
+def test_rate_limit_redis_unavailable(fake_redis):
+    async def main():
+        fake_redis.connection_pool.connection_kwargs["server"].connected = False
+        limiter = SlidingWindowLimiter(limit=1, window=60)
+        # Redis 不可用时不限流
+        assert all([(await limiter.hit("client")).allowed for _ in range(3)])
+
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+# @Version        : 1.0
+# @Create Time    : 2024/11/25 14:30
+# @File           : test_single_flight.py
+# @IDE            : PyCharm
+# @Desc           : SingleFlight 并发加载
+
+import asyncio
+
+import pytest
+
+from kinit_fast_task.utils.cache import SingleFlight
+
+
+def test_single_flight_share_result():
+    async def main():
+        single_flight = SingleFlight()
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*[single_flight.do("key", loader) for _ in range(10)])
+        assert results == ["value"] * 10
+        assert len(calls) == 1
+
+    asyncio.run(main())
+
+
+def test_single_flight_share_exception():
+    async def main():
+        single_flight = SingleFlight()
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise ValueError("load failed")
+
+        results = await asyncio.gather(*[single_flight.do("key", loader) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(main())
+
+
+def test_single_flight_cancel_leader():
+    async def main():
+        single_flight = SingleFlight()
+        started = asyncio.Event()
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            started.set()
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        leader = asyncio.create_task(single_flight.do("key", loader))
+        await started.wait()
+        waiters = [asyncio.create_task(single_flight.do("key", loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        # 等待的请求不会被取消，其中一个重新加载，其他请求共享该次加载的结果
+        assert await asyncio.gather(*waiters) == [2, 2, 2]
+        assert len(calls) == 2
+
+    asyncio.run(main())
+
+
+def test_single_flight_cancel_waiter():
+    async def main():
+        single_flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def loader():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "value"
+
+        leader = asyncio.create_task(single_flight.do("key", loader))
+        await started.wait()
+        waiter = asyncio.create_task(single_flight.do("key", loader))
+        await asyncio.sleep(0)
+        waiter.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert await leader == "value"
+
+    asyncio.run(main())